@@ -6,11 +6,20 @@ using Azure AI Search as the knowledge base.
 """
 
 import os
+import re
+import time
+import weakref
 from typing import Optional
 
 from azure.search.documents import SearchClient
+from azure.search.documents.indexes import SearchIndexClient
 from azure.search.documents.models import VectorizedQuery
 from azure.core.credentials import AzureKeyCredential
+from azure.core.exceptions import HttpResponseError
+
+from . import health, metrics, profiling, usage
+from .context import assemble_context, extract_snippet
+from .embeddings import get_embedding_service
 
 
 def require_env(name: str) -> str:
@@ -21,80 +30,273 @@ def require_env(name: str) -> str:
     return value
 
 
+# Projections each client's index rejected, so later queries on it skip them
+_projection_failed: "weakref.WeakKeyDictionary[SearchClient, set[tuple]]" = weakref.WeakKeyDictionary()
+
+_search_client: Optional[tuple[tuple, SearchClient]] = None
+
+
+def search_fields() -> dict:
+    """Index field names read from search results (``AZURE_SEARCH_*_FIELD``)."""
+    return {
+        "id": os.getenv("AZURE_SEARCH_ID_FIELD", "id"),
+        "content": os.getenv("AZURE_SEARCH_CONTENT_FIELD", "content"),
+        "source": os.getenv("AZURE_SEARCH_SOURCE_FIELD", "source"),
+    }
+
+
+def snippet_mode(semantic_config: Optional[str]) -> str:
+    """
+    How document text is cut down (``AZURE_SEARCH_SNIPPETS``).
+    
+    ``captions`` uses semantic captions (only with a semantic configuration),
+    ``highlights`` uses hit highlights on the content field, ``local``
+    extracts the sentences around query terms here and ``off`` only applies
+    the per-document character budget.
+    """
+    mode = os.getenv("AZURE_SEARCH_SNIPPETS", "local").strip().lower()
+    if mode == "captions" and not semantic_config:
+        return "local"
+    return mode if mode in {"captions", "highlights", "local", "off"} else "local"
+
+
+def _server_snippet(result: dict, content_field: str) -> str:
+    """Caption or highlight text returned by the service, if any."""
+    captions = result.get("@search.captions") or []
+    texts = [
+        getattr(caption, "text", None) or (caption.get("text") if isinstance(caption, dict) else None)
+        for caption in captions
+    ]
+    texts = [text for text in texts if text]
+    if not texts:
+        texts = ((result.get("@search.highlights") or {}).get(content_field)) or []
+    return " … ".join(text.strip() for text in texts if text and text.strip())
+
+
+def _names_field(message: str, fields: list[str]) -> bool:
+    return any(re.search(rf"(?<![\w$]){re.escape(field)}(?!\w)", message) for field in fields)
+
+
+def _run_search(client: SearchClient, **kwargs) -> list[dict]:
+    select = kwargs.pop("select", None)
+    rejected = _projection_failed.setdefault(client, set())
+    if select and tuple(select) not in rejected:
+        try:
+            return list(client.search(select=select, **kwargs))
+        except HttpResponseError as e:
+            # A bad filter or semantic configuration is also a 400; only an
+            # error about a selected field means the index lacks it
+            if e.status_code != 400 or not _names_field(str(e.message or e), select):
+                raise
+            rejected.add(tuple(select))
+            print(f"Azure Search rejected the field projection {select}, retrying without it: {e.message}")
+    return list(client.search(**kwargs))
+
+
 def get_search_client() -> SearchClient:
-    """Initialize and return Azure Search client."""
+    """
+    Return the shared Azure Search client.
+
+    One client per configuration, so its HTTP session (and TLS connection)
+    is reused across queries instead of being rebuilt for every search.
+    """
+    global _search_client
     endpoint = require_env("AZURE_SEARCH_ENDPOINT")
     key = require_env("AZURE_SEARCH_KEY")
     index_name = require_env("AZURE_SEARCH_INDEX")
     
-    credential = AzureKeyCredential(key)
-    return SearchClient(endpoint=endpoint, index_name=index_name, credential=credential)
+    config = (endpoint, index_name, key)
+    if _search_client is None or _search_client[0] != config:
+        credential = AzureKeyCredential(key)
+        _search_client = (config, SearchClient(endpoint=endpoint, index_name=index_name, credential=credential))
+    return _search_client[1]
+
+
+def probe_target() -> tuple[str, dict]:
+    """Cheap authenticated request for the health prober: the index's document count."""
+    endpoint = require_env("AZURE_SEARCH_ENDPOINT").rstrip("/")
+    index_name = require_env("AZURE_SEARCH_INDEX")
+    url = f"{endpoint}/indexes/{index_name}/docs/$count?api-version=2023-11-01"
+    return url, {"api-key": require_env("AZURE_SEARCH_KEY")}
+
+
+def search_index_version() -> str:
+    """
+    Identify the current contents of the search index.
+    
+    ``AZURE_SEARCH_INDEX_VERSION`` wins when the ingestion pipeline stamps
+    one; otherwise the document count and storage size from the index
+    statistics stand in, which change whenever documents are added, removed
+    or rewritten.
+    """
+    stamped = os.getenv("AZURE_SEARCH_INDEX_VERSION", "").strip()
+    if stamped:
+        return stamped
+    client = SearchIndexClient(
+        endpoint=require_env("AZURE_SEARCH_ENDPOINT"),
+        credential=AzureKeyCredential(require_env("AZURE_SEARCH_KEY")),
+    )
+    index_name = require_env("AZURE_SEARCH_INDEX")
+    stats = client.get_index_statistics(index_name)
+    count = getattr(stats, "document_count", None)
+    size = getattr(stats, "storage_size", None)
+    return f"{index_name}:docs={count}:bytes={size}"
 
 
-async def search_knowledge_base(query: str, top_k: int = 5) -> list[dict]:
+@profiling.traced("search")
+async def search_knowledge_base(
+    query: str,
+    top_k: int = 5,
+    vector_field: Optional[str] = None,
+    semantic_config: Optional[str] = None,
+) -> list[dict]:
     """
     Search Azure AI Search index for relevant documents.
     
     Args:
         query: Search query string
         top_k: Number of top results to return
+        vector_field: Vector field for hybrid search; defaults to
+            ``AZURE_SEARCH_VECTOR_FIELD``, ``""`` forces text-only search
+        semantic_config: Semantic ranker configuration; defaults to
+            ``AZURE_SEARCH_SEMANTIC_CONFIG``, ``""`` disables reranking
         
     Returns:
         List of search results with document content and scores
     """
+    # Fail fast while the service is known to be down
+    breaker = health.breaker(health.SEARCH)
+    if not breaker.allow():
+        print("Azure Search skipped: circuit open")
+        return []
+    started = None
     try:
         client = get_search_client()
         
-        # Perform hybrid search (BM25 + vector search recommended)
-        # For now, using simple text search
-        results = client.search(
+        # Hybrid search (BM25 + vector) when the index has a vector field;
+        # query embeddings come from the cached, batched embedding service.
+        vector_queries = None
+        if vector_field is None:
+            vector_field = os.getenv("AZURE_SEARCH_VECTOR_FIELD")
+        if vector_field:
+            try:
+                vector = await get_embedding_service().embed(query)
+                vector_queries = [
+                    VectorizedQuery(
+                        vector=vector.tolist(),
+                        k_nearest_neighbors=top_k,
+                        fields=vector_field,
+                    )
+                ]
+            except Exception as e:
+                print(f"Query embedding error, falling back to text search: {e}")
+
+        if semantic_config is None:
+            semantic_config = os.getenv("AZURE_SEARCH_SEMANTIC_CONFIG")
+        rerank = {}
+        if semantic_config:
+            rerank = {"query_type": "semantic", "semantic_configuration_name": semantic_config}
+
+        # Only the fields we read come back (no vectors or metadata), and the
+        # text is cut to the passages around the query
+        fields = search_fields()
+        mode = snippet_mode(semantic_config)
+        if mode == "captions":
+            rerank.update(query_caption="extractive", query_caption_highlight_enabled=False)
+        elif mode == "highlights":
+            rerank.update(highlight_fields=fields["content"], highlight_pre_tag="", highlight_post_tag="")
+        max_chars = int(os.getenv("AZURE_SEARCH_DOC_MAX_CHARS", "1500"))
+
+        started = time.perf_counter()
+        results = _run_search(
+            client,
             search_text=query,
+            vector_queries=vector_queries,
             top=top_k,
             include_total_count=True,
+            select=list(dict.fromkeys(fields.values())),
+            **rerank,
         )
+        usage.record(search_calls=1)
+        breaker.record(True, (time.perf_counter() - started) * 1000)
         
         documents = []
+        full_chars = 0
         for result in results:
+            content = result.get(fields["content"]) or result.get("content") or result.get("text") or ""
+            full_chars += len(content)
+            if mode in {"captions", "highlights"}:
+                content = _server_snippet(result, fields["content"]) or content
             doc = {
-                "content": result.get("content") or result.get("text") or str(result),
-                "score": result.get("@search.score", 0),
-                "source": result.get("source") or result.get("title") or "Unknown",
+                "id": str(result.get(fields["id"]) or result.get("key") or ""),
+                "content": extract_snippet(content, query if mode != "off" else "", max_chars),
+                "score": result.get("@search.reranker_score") or result.get("@search.score", 0),
+                "source": result.get(fields["source"]) or result.get("title") or "Unknown",
             }
             documents.append(doc)
+        metrics.observe("search.result_chars", full_chars)
+        metrics.observe("search.snippet_chars", sum(len(doc["content"]) for doc in documents))
         
-        print(f"Azure Search results: {len(documents)}")
-        return documents
+        print(f"Azure Search results: {len(documents)}")
+        return documents
     except Exception as e:
         print(f"Azure Search error: {e}")
+        status = getattr(e, "status_code", None) if isinstance(e, HttpResponseError) else None
+        failed = not status or health.failed_status(status)
+        ms = (time.perf_counter() - started) * 1000 if started else None
+        breaker.record(not failed, ms, str(e)[:200] if failed else None)
         return []
 
 
-async def build_rag_context(query: str) -> str:
+async def retrieve_context(query: str) -> dict:
     """
-    Build RAG context from search results.
+    Search the knowledge base and assemble the LLM context.
+    
+    Documents are ranked by relevance, de-duplicated and packed into the
+    configured token budget (see ``api.context``).
     
     Args:
         query: User query to search for
         
     Returns:
-        Formatted context string for the LLM
+        Dict with the context ``text``, the ``doc_ids`` it was built from and
+        the search ``scores`` (best first) for confidence decisions
     """
     if not query or not query.strip():
-        return ""
+        return {"text": "", "doc_ids": [], "scores": []}
     
     documents = await search_knowledge_base(query, top_k=5)
     
     if not documents:
-        return ""
+        return {"text": "", "doc_ids": [], "scores": []}
     
-    context_parts = []
-    for doc in documents:
-        context_parts.append(
-            f"Source: {doc['source']} (Relevance: {doc['score']:.2f})\n"
-            f"Content: {doc['content']}"
-        )
+    # Documents are selected by relevance but rendered in id order without
+    # per-query scores, so repeated document sets keep a cacheable prefix.
+    context = assemble_context(
+        documents,
+        render=lambda doc: f"Source: {doc['source']}\nContent: {doc['content']}",
+        order_key=lambda doc: f"{doc['source']}\x00{doc.get('id', '')}",
+    )
+    metrics.observe("rag.context_tokens", context["tokens"])
+    metrics.observe("rag.context_documents", len(context["documents"]))
+    return {
+        "text": context["text"],
+        "doc_ids": [doc.get("id") or doc["source"] for doc in context["documents"]],
+        "scores": sorted((float(doc.get("score") or 0) for doc in documents), reverse=True),
+    }
+
+
+async def build_rag_context(query: str) -> str:
+    """
+    Build RAG context from search results.
     
-    return "\n\n".join(context_parts)
+    Args:
+        query: User query to search for
+        
+    Returns:
+        Formatted context string for the LLM
+    """
+    return (await retrieve_context(query))["text"]
 
 
 async def search_tool(query: str) -> dict:
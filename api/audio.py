@@ -0,0 +1,310 @@
+"""
+Audio processing stage for voice notes.
+
+Inbound audio is decoded once to 16 kHz mono PCM, screened by the local
+voice-activity detector (``api.vad``), trimmed to the detected speech and
+re-encoded as low-bitrate Opus before it is uploaded for transcription;
+silent or noise-only clips are rejected without any STT call. Outbound TTS audio is re-encoded as a
+voice-tuned Opus-in-Ogg voice note for WhatsApp. Transcoding shells out to
+ffmpeg inside a process pool so the event loop is never blocked; without
+ffmpeg the audio passes through unchanged.
+"""
+
+import asyncio
+import io
+import os
+import shutil
+import subprocess
+import wave
+from concurrent.futures import ProcessPoolExecutor
+from typing import BinaryIO, Optional
+
+import numpy as np
+
+from . import metrics, profiling
+from .uploads import SpooledUpload
+from .vad import analyze_speech
+
+
+STT_SAMPLE_RATE = 16000
+
+_pool: Optional[ProcessPoolExecutor] = None
+_warned = False
+
+
+class NoSpeechDetected(Exception):
+    """Raised when a voice note contains no usable speech."""
+
+    def __init__(self, analysis: dict):
+        super().__init__("No speech detected in audio")
+        self.analysis = analysis
+
+
+class AudioTooLong(Exception):
+    """Raised when a clip is longer than the allowed duration."""
+
+    def __init__(self, max_seconds: float):
+        super().__init__(f"Audio is longer than {max_seconds:g} seconds")
+        self.max_seconds = max_seconds
+
+
+def ffmpeg_path() -> Optional[str]:
+    return shutil.which(os.getenv("FFMPEG_PATH", "ffmpeg"))
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=int(os.getenv("AUDIO_WORKERS", "2")))
+    return _pool
+
+
+async def warm_pool() -> int:
+    """Spawn the ffmpeg worker processes now instead of on the first voice note."""
+    pool = _get_pool()
+    loop = asyncio.get_running_loop()
+    workers = pool._max_workers
+    pids = await asyncio.gather(*(loop.run_in_executor(pool, os.getpid) for _ in range(workers)))
+    return len(set(pids))
+
+
+def shutdown_pool() -> None:
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def _ffmpeg(
+    binary: str, args: list[str], data: bytes | str, input_args: tuple = (), timeout: float = 60
+) -> bytes:
+    """Pipe ``data`` (bytes, or a file path) through ffmpeg; runs inside the process pool."""
+    source = data if isinstance(data, str) else "pipe:0"
+    result = subprocess.run(
+        [binary, "-hide_banner", "-loglevel", "error", *input_args, "-i", source, *args, "pipe:1"],
+        input=None if isinstance(data, str) else data,
+        capture_output=True,
+        timeout=timeout,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"ffmpeg failed: {result.stderr.decode('utf-8', 'replace').strip()}")
+    return result.stdout
+
+
+def _ffmpeg_or_warn() -> Optional[str]:
+    global _warned
+    binary = ffmpeg_path()
+    if not binary and not _warned:
+        print("Warning: ffmpeg not found; audio is passed through untranscoded")
+        _warned = True
+    return binary
+
+
+async def run_ffmpeg(args: list[str], data: bytes) -> Optional[bytes]:
+    """Transcode ``data`` off the event loop; None when ffmpeg is unavailable."""
+    binary = _ffmpeg_or_warn()
+    if not binary:
+        return None
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_pool(), _ffmpeg, binary, args, data)
+
+
+def _opus_args(bitrate: str, sample_rate: int) -> list[str]:
+    return [
+        "-vn", "-ac", "1", "-ar", str(sample_rate),
+        "-c:a", "libopus", "-b:a", bitrate, "-application", "voip",
+        "-f", "ogg",
+    ]
+
+
+def _screen_and_encode(
+    binary: str, data: bytes | str, bitrate: str, vad: dict, max_seconds: Optional[float] = None
+) -> tuple[Optional[bytes], dict]:
+    """
+    Decode once to PCM, run VAD, and encode only the speech span as Opus.
+    Runs inside the process pool; returns ``(None, analysis)`` without speech.
+    With ``max_seconds`` decoding stops just past the limit, so an overlong
+    clip costs no more than an allowed one (``analysis["too_long"]``).
+    """
+    limit = ["-t", f"{max_seconds + 0.5:g}"] if max_seconds else []
+    pcm = _ffmpeg(binary, ["-vn", *limit, "-ac", "1", "-ar", str(STT_SAMPLE_RATE), "-f", "s16le"], data)
+    samples = np.frombuffer(pcm, dtype=np.int16)
+    analysis = analyze_speech(samples, STT_SAMPLE_RATE)
+    if max_seconds and analysis["duration"] > max_seconds:
+        analysis["too_long"] = True
+        return None, analysis
+    if (
+        analysis["speech_seconds"] < vad["min_speech_seconds"]
+        or analysis["speech_ratio"] < vad["min_speech_ratio"]
+    ):
+        return None, analysis
+
+    pad = vad["padding_seconds"]
+    start = int(max(0.0, analysis["start"] - pad) * STT_SAMPLE_RATE)
+    end = int(min(analysis["duration"], analysis["end"] + pad) * STT_SAMPLE_RATE)
+    encoded = _ffmpeg(
+        binary,
+        _opus_args(bitrate, STT_SAMPLE_RATE),
+        samples[start:end].tobytes(),
+        input_args=("-f", "s16le", "-ar", str(STT_SAMPLE_RATE), "-ac", "1"),
+    )
+    analysis["kept_seconds"] = (end - start) / STT_SAMPLE_RATE
+    return encoded, analysis
+
+
+# Layer III bitrates (kbps) by bitrate index: MPEG-1, then MPEG-2/2.5
+_MP3_BITRATES = (
+    (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+)
+
+
+def audio_seconds(data: bytes, total_bytes: Optional[int] = None) -> Optional[float]:
+    """
+    Duration of a WAV, Ogg/Opus or constant-bitrate MP3 clip from its
+    headers alone (no decoding); None for anything else.
+
+    Args:
+        data: The clip, or for MP3 just its head
+        total_bytes: Full MP3 size when only the head is passed
+    """
+    try:
+        if data[:4] == b"RIFF":
+            with wave.open(io.BytesIO(data), "rb") as wav:
+                return wav.getnframes() / wav.getframerate()
+        if data[:4] == b"OggS":
+            if b"OpusHead" not in data[:128]:
+                return None
+            last = data.rfind(b"OggS")
+            # Granule position of the last page counts 48 kHz samples
+            return int.from_bytes(data[last + 6:last + 14], "little") / 48000
+        offset = 0
+        if data[:3] == b"ID3":
+            size = data[6:10]
+            offset = 10 + (size[0] << 21 | size[1] << 14 | size[2] << 7 | size[3])
+        header = data[offset:offset + 4]
+        if len(header) < 4 or header[0] != 0xFF or header[1] & 0xE6 != 0xE2:
+            return None
+        mpeg1 = header[1] & 0x18 == 0x18
+        bitrate = _MP3_BITRATES[0 if mpeg1 else 1][header[2] >> 4] if header[2] >> 4 < 15 else 0
+        if not bitrate:
+            return None
+        return ((total_bytes or len(data)) - offset) * 8 / (bitrate * 1000)
+    except Exception:
+        return None
+
+
+def _header_seconds(audio: bytes | SpooledUpload, probe_bytes: int = 65536) -> Optional[float]:
+    """``audio_seconds`` of a clip or upload, reading only its head and tail from disk."""
+    if not isinstance(audio, SpooledUpload):
+        return audio_seconds(audio)
+    source = audio.source()
+    if isinstance(source, bytes):
+        return audio_seconds(source)
+    with open(source, "rb") as f:
+        head = f.read(probe_bytes)
+        if head[:4] != b"OggS" or audio.size <= probe_bytes:
+            return audio_seconds(head, audio.size)
+        # The duration is in the last Ogg page
+        f.seek(audio.size - probe_bytes)
+        return audio_seconds(head[:128] + f.read())
+
+
+def pcm_to_wav(pcm: bytes, sample_rate: int = STT_SAMPLE_RATE) -> bytes:
+    """Wrap mono int16 PCM in a WAV header (no transcoding, safe on the event loop)."""
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+        wav.writeframes(pcm)
+    return buffer.getvalue()
+
+
+@profiling.traced("audio_prepare")
+async def prepare_for_stt(
+    audio: bytes | SpooledUpload,
+    filename: str,
+    content_type: Optional[str],
+    max_seconds: Optional[float] = None,
+) -> tuple[bytes | BinaryIO, str, Optional[str]]:
+    """
+    Screen and shrink an inbound clip before transcription.
+
+    Args:
+        audio: Clip bytes, or a spooled upload (read by ffmpeg from disk
+            once it has spilled)
+        filename: Original file name
+        content_type: Original content type
+        max_seconds: Reject clips longer than this
+
+    Returns:
+        ``(audio, filename, content_type)`` ready for ``transcribe_audio``;
+        ``audio`` is an open file when a spilled upload is passed through
+
+    Raises:
+        NoSpeechDetected: The clip is silent or noise-only (VAD_* thresholds)
+        AudioTooLong: The clip is longer than ``max_seconds``
+    """
+    spooled = isinstance(audio, SpooledUpload)
+    data = audio.source() if spooled else audio
+    size = audio.size if spooled else len(audio)
+
+    def original() -> tuple[bytes | BinaryIO, str, Optional[str]]:
+        # Without the decode, enforce the limit from the container headers
+        seconds = _header_seconds(audio) if max_seconds else None
+        if seconds is not None and seconds > max_seconds:
+            metrics.incr("audio.rejected_too_long")
+            raise AudioTooLong(max_seconds)
+        return (audio.payload() if spooled else audio), filename, content_type
+
+    binary = _ffmpeg_or_warn()
+    if not binary:
+        return original()
+    vad = {
+        "min_speech_seconds": float(os.getenv("VAD_MIN_SPEECH_SECONDS", "0.3")),
+        "min_speech_ratio": float(os.getenv("VAD_MIN_SPEECH_RATIO", "0.05")),
+        "padding_seconds": float(os.getenv("VAD_PADDING_SECONDS", "0.25")),
+    }
+    loop = asyncio.get_running_loop()
+    try:
+        processed, analysis = await loop.run_in_executor(
+            _get_pool(), _screen_and_encode, binary, data, os.getenv("STT_OPUS_BITRATE", "16k"), vad, max_seconds
+        )
+    except Exception as e:
+        print(f"STT preprocessing failed, sending original audio: {e}")
+        return original()
+
+    if analysis.get("too_long"):
+        metrics.incr("audio.rejected_too_long")
+        raise AudioTooLong(max_seconds)
+    metrics.incr("vad.audio_seconds_total", analysis["duration"])
+    if processed is None:
+        metrics.incr("vad.rejected")
+        metrics.incr("vad.skipped_seconds_total", analysis["duration"])
+        raise NoSpeechDetected(analysis)
+    metrics.incr("vad.skipped_seconds_total", analysis["duration"] - analysis["kept_seconds"])
+    metrics.observe("audio.stt_bytes_in", size)
+    metrics.observe("audio.stt_bytes_out", len(processed))
+    return processed, "audio.ogg", "audio/ogg"
+
+
+@profiling.traced("audio_encode")
+async def encode_voice_note(audio_bytes: bytes, content_type: str) -> tuple[bytes, str]:
+    """
+    Re-encode synthesized speech as an Opus-in-Ogg WhatsApp voice note.
+
+    Returns:
+        ``(audio_bytes, content_type)``
+    """
+    args = _opus_args(os.getenv("TTS_OPUS_BITRATE", "24k"), int(os.getenv("TTS_OPUS_SAMPLE_RATE", "24000")))
+    try:
+        encoded = await run_ffmpeg(args, audio_bytes)
+    except Exception as e:
+        print(f"Voice note encoding failed, sending original audio: {e}")
+        return audio_bytes, content_type
+    if not encoded:
+        return audio_bytes, content_type
+    metrics.observe("audio.tts_bytes_in", len(audio_bytes))
+    metrics.observe("audio.tts_bytes_out", len(encoded))
+    return encoded, "audio/ogg"
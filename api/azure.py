@@ -1,11 +1,17 @@
 import os
-import json
 import mimetypes
-from typing import Optional, Any
+import time
+from typing import Any, AsyncIterator, BinaryIO, Optional
 
 import httpx
 from fastapi import HTTPException
 
+from . import health, metrics, profiling, usage
+from .audio import audio_seconds
+from .clients import pooled
+from .prompts import DEFAULT_SYSTEM_PROMPT
+from .serialization import JSON_HEADERS, dumps, dumps_str, loads
+
 
 def require_env(name: str) -> str:
   value = os.getenv(name)
@@ -26,6 +32,10 @@ def api_headers() -> dict:
   return {"api-key": require_env("AZURE_OPENAI_API_KEY")}
 
 
+def json_headers() -> dict:
+  return {**api_headers(), **JSON_HEADERS}
+
+
 def audio_content_type() -> str:
   fmt = os.getenv("AZURE_TTS_FORMAT", "mp3").lower()
   is_mp3 = fmt in ("mp3", "mpeg", "audio/mpeg")
@@ -36,6 +46,33 @@ def stt_language() -> str:
   return os.getenv("AZURE_STT_LANGUAGE", "auto").strip().lower()
 
 
+def probe_target() -> tuple[str, dict]:
+  """Cheap authenticated request for the health prober: the resource's model list."""
+  return f"{base_url()}/openai/models?api-version={api_version()}", api_headers()
+
+
+def record_usage(response: dict, deployment: str | None = None) -> None:
+  """Report token usage from a chat completion response to metrics and usage accounting."""
+  tokens = response.get("usage") or {}
+  if not tokens:
+    usage.record(deployment, llm_calls=1)
+    return
+  metrics.observe("llm.prompt_tokens", tokens.get("prompt_tokens") or 0)
+  metrics.observe("llm.completion_tokens", tokens.get("completion_tokens") or 0)
+  details = tokens.get("prompt_tokens_details") or {}
+  cached = details.get("cached_tokens") or 0
+  metrics.observe("llm.cached_tokens", cached)
+  metrics.incr("llm.prompt_tokens_total", tokens.get("prompt_tokens") or 0)
+  metrics.incr("llm.cached_tokens_total", cached)
+  usage.record(
+    deployment,
+    llm_calls=1,
+    prompt_tokens=tokens.get("prompt_tokens") or 0,
+    completion_tokens=tokens.get("completion_tokens") or 0,
+    cached_tokens=cached,
+  )
+
+
 def get_search_tools() -> list[dict]:
   """Get Azure AI Search tool definition for function calling."""
   return [
@@ -59,11 +96,23 @@ def get_search_tools() -> list[dict]:
   ]
 
 
+def _llm_upstream(*args, deployment: str | None = None, **kwargs) -> str:
+  """Breaker for a chat call: the fast-tier deployment has its own."""
+  fast = os.getenv("AZURE_GPT_FAST_DEPLOYMENT", "").strip()
+  if fast and deployment == fast and fast != os.getenv("AZURE_GPT_DEPLOYMENT"):
+    return health.LLM_FAST
+  return health.LLM
+
+
+@profiling.traced("llm")
+@health.watched(_llm_upstream)
 async def generate_text(
   user_prompt: str,
   system_prompt: str | None = None,
   use_tools: bool = True,
-  tool_results: dict | None = None
+  tool_results: dict | None = None,
+  deployment: str | None = None,
+  max_tokens: int | None = None
 ) -> str:
   """
   Generate text using GPT-4o with optional function calling for RAG.
@@ -73,28 +122,18 @@ async def generate_text(
     system_prompt: Optional system prompt
     use_tools: Whether to enable function calling for knowledge base search
     tool_results: Results from function calls to include in context
+    deployment: Chat deployment to use (defaults to ``AZURE_GPT_DEPLOYMENT``)
+    max_tokens: Optional cap on completion tokens
   
   Returns:
     Generated response text
   """
-  deployment = require_env("AZURE_GPT_DEPLOYMENT")
+  deployment = deployment or require_env("AZURE_GPT_DEPLOYMENT")
   url = f"{base_url()}/openai/deployments/{deployment}/chat/completions"
   params = {"api-version": api_version()}
   
-  messages = []
-  if system_prompt:
-    messages.append({"role": "system", "content": str(system_prompt)})
-  else:
-    messages.append(
-      {
-        "role": "system",
-        "content": (
-          "You are a helpful Bank Islami customer service assistant. "
-          "Provide accurate information about banking products and services. "
-          "Keep replies concise and helpful. Reply in the same language as the user."
-        ),
-      }
-    )
+  # The system prompt leads so Azure can serve it from the prompt cache.
+  messages = [{"role": "system", "content": str(system_prompt or DEFAULT_SYSTEM_PROMPT)}]
   
   messages.append({"role": "user", "content": str(user_prompt or "")})
   
@@ -102,7 +141,7 @@ async def generate_text(
   if tool_results:
     messages.append({
       "role": "assistant",
-      "content": f"Knowledge base search results: {json.dumps(tool_results)}"
+      "content": f"Knowledge base search results: {dumps_str(tool_results)}"
     })
     messages.append({
       "role": "user",
@@ -114,20 +153,23 @@ async def generate_text(
     "temperature": 0.3,
     "top_p": 0.95,
   }
+  if max_tokens:
+    body["max_tokens"] = max_tokens
   
   # Add tools if enabled
   if use_tools:
     body["tools"] = get_search_tools()
   
-  async with httpx.AsyncClient(timeout=120) as client:
-    r = await client.post(url, params=params, headers=api_headers(), json=body)
+  async with pooled("azure") as client:
+    r = await client.post(url, params=params, headers=json_headers(), content=dumps(body), timeout=120)
     try:
       r.raise_for_status()
     except httpx.HTTPStatusError as exc:
       detail = exc.response.text
       raise HTTPException(status_code=502, detail=f"Azure GPT error: {detail}") from exc
     
-    response = r.json()
+    response = loads(r.content)
+    record_usage(response, deployment)
     choice = response.get("choices", [{}])[0]
     message = choice.get("message", {})
     
@@ -141,19 +183,19 @@ async def generate_text(
           if function.get("name") == "search_knowledge_base":
             # Parse the query from arguments
             try:
-              args = json.loads(function.get("arguments", "{}"))
+              args = loads(function.get("arguments") or "{}")
               query = args.get("query", "")
               if query:
                 result = await search_tool(query)
                 tool_results.append({
                   "tool_call_id": tool_call.get("id"),
-                  "content": json.dumps(result)
+                  "content": dumps_str(result)
                 })
             except Exception as e:
               print(f"Error executing search tool: {e}")
               tool_results.append({
                 "tool_call_id": tool_call.get("id"),
-                "content": json.dumps({"error": str(e)})
+                "content": dumps_str({"error": str(e)})
               })
       
       # Make another API call with tool results
@@ -173,14 +215,15 @@ async def generate_text(
         # Remove tools from body for the follow-up call
         body.pop("tools", None)
         
-        r = await client.post(url, params=params, headers=api_headers(), json=body)
+        r = await client.post(url, params=params, headers=json_headers(), content=dumps(body), timeout=120)
         try:
           r.raise_for_status()
         except httpx.HTTPStatusError as exc:
           detail = exc.response.text
           raise HTTPException(status_code=502, detail=f"Azure GPT error: {detail}") from exc
         
-        response = r.json()
+        response = loads(r.content)
+        record_usage(response, deployment)
         choice = response.get("choices", [{}])[0]
         message = choice.get("message", {})
     
@@ -189,8 +232,17 @@ async def generate_text(
     return text or "Sorry, I could not generate a response."
 
 
-async def transcribe_audio(audio_bytes: bytes, filename: str, content_type: str | None, language: str | None = None) -> str:
-  """Transcribe audio to text using Azure STT."""
+@profiling.traced("stt")
+@health.watched(health.STT)
+async def transcribe_audio(
+  audio: bytes | BinaryIO, filename: str, content_type: str | None, language: str | None = None
+) -> str:
+  """
+  Transcribe audio to text using Azure STT.
+
+  ``audio`` may be an open binary file, which is streamed as multipart
+  without being read into memory.
+  """
   # Use the configured STT deployment
   deployment = os.getenv("AZURE_STT_DEPLOYMENT", "gpt-4o-mini-transcribe")
   url = f"{base_url()}/openai/deployments/{deployment}/audio/transcriptions"
@@ -198,23 +250,27 @@ async def transcribe_audio(audio_bytes: bytes, filename: str, content_type: str
   inferred = content_type
   if not inferred:
     inferred, _ = mimetypes.guess_type(filename or "")
-  files = {"file": (filename or "audio", audio_bytes, inferred or "application/octet-stream")}
+  files = {"file": (filename or "audio", audio, inferred or "application/octet-stream")}
   data = {}
   lang = (language or stt_language()).strip().lower()
   if lang and lang != "auto":
     data["language"] = lang
 
-  async with httpx.AsyncClient(timeout=300) as client:
-    r = await client.post(url, params=params, headers=api_headers(), files=files, data=data)
+  async with pooled("azure") as client:
+    r = await client.post(url, params=params, headers=api_headers(), files=files, data=data, timeout=300)
     try:
       r.raise_for_status()
     except httpx.HTTPStatusError as exc:
       detail = exc.response.text
       raise HTTPException(status_code=502, detail=f"Azure STT error: {detail}") from exc
-    text = r.json().get("text", "")
-    return (text or "").strip()
+    text = loads(r.content).get("text", "")
+  seconds = audio_seconds(audio) if isinstance(audio, bytes) else None
+  usage.record(deployment, stt_calls=1, stt_seconds=seconds or 0)
+  return (text or "").strip()
 
 
+@profiling.traced("tts")
+@health.watched(health.TTS)
 async def synthesize_speech(text: str) -> bytes:
   """Synthesize text to speech using Azure TTS."""
   # Use the configured TTS deployment
@@ -228,11 +284,61 @@ async def synthesize_speech(text: str) -> bytes:
     "format": os.getenv("AZURE_TTS_FORMAT", "mp3"),
   }
 
-  async with httpx.AsyncClient(timeout=300) as client:
-    r = await client.post(url, params=params, headers=api_headers(), json=body)
+  async with pooled("azure") as client:
+    r = await client.post(url, params=params, headers=json_headers(), content=dumps(body), timeout=300)
     try:
       r.raise_for_status()
     except httpx.HTTPStatusError as exc:
       detail = exc.response.text
       raise HTTPException(status_code=502, detail=f"Azure TTS error: {detail}") from exc
-    return r.content
\ No newline at end of file
+  usage.record(
+    deployment, tts_calls=1, tts_chars=len(body["input"]), tts_seconds=audio_seconds(r.content) or 0
+  )
+  return r.content
+
+
+async def stream_speech(text: str) -> AsyncIterator[bytes]:
+  """Synthesize text to speech, yielding audio chunks as Azure streams them."""
+  deployment = os.getenv("AZURE_TTS_DEPLOYMENT", "gpt-4o-mini-tts")
+  url = f"{base_url()}/openai/deployments/{deployment}/audio/speech"
+  params = {"api-version": api_version()}
+  body = {
+    "model": deployment,
+    "input": str(text or ""),
+    "voice": os.getenv("AZURE_TTS_VOICE", "alloy"),
+    "format": os.getenv("AZURE_TTS_FORMAT", "mp3"),
+  }
+
+  tts = health.breaker(health.TTS)
+  if not tts.allow():
+    raise health.UpstreamUnavailable(health.TTS)
+  started = time.perf_counter()
+  head = b""
+  size = 0
+  try:
+    async with pooled("azure") as client:
+      async with client.stream(
+        "POST", url, params=params, headers=json_headers(), content=dumps(body), timeout=300
+      ) as r:
+        if r.status_code >= 400:
+          detail = (await r.aread()).decode("utf-8", "replace")
+          failed = health.failed_status(r.status_code)
+          tts.record(not failed, (time.perf_counter() - started) * 1000, detail[:200] if failed else None)
+          raise HTTPException(status_code=502, detail=f"Azure TTS error: {detail}")
+        async for chunk in r.aiter_bytes():
+          if chunk:
+            if not head:
+              # Latency to first audio, which is what a live caller waits for
+              tts.record(True, (time.perf_counter() - started) * 1000)
+            head = head or chunk
+            size += len(chunk)
+            yield chunk
+  except httpx.HTTPError as exc:
+    tts.record(False, (time.perf_counter() - started) * 1000, str(exc)[:200])
+    raise
+  finally:
+    # Also on barge-in: the characters are billed whether or not all audio was played
+    if size:
+      usage.record(
+        deployment, tts_calls=1, tts_chars=len(body["input"]), tts_seconds=audio_seconds(head, size) or 0
+      )
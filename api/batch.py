@@ -0,0 +1,177 @@
+"""
+Bulk question answering.
+
+``run_batch`` answers a list of questions with bounded concurrency and
+yields one result per unique question as soon as it completes, followed by
+a summary with latency percentiles and throughput. Questions that normalize
+to the same text are answered once. ``AnswerCache`` keeps generated answers
+in the shared state backend so repeated evaluation runs skip retrieval and
+generation for questions they have already seen; the offline CLI, which has
+no long-lived process, keeps them in a SQLite file unless Redis is configured.
+"""
+
+import asyncio
+import hashlib
+import os
+import time
+from typing import AsyncIterator, Awaitable, Callable, Iterable, Optional
+
+from . import metrics
+from .embeddings import normalize_text
+from .state import MemoryState, Namespace, SqliteState, get_state, namespace
+
+
+Answerer = Callable[[str], Awaitable[str]]
+
+
+class AnswerCache:
+    """
+    Answers keyed by normalized question text.
+
+    Args:
+        store: Shared state namespace holding the answers
+        fingerprint: Anything that changes the answer for the same question
+            (system prompt, deployment); part of every key
+        ttl: Seconds an answer stays valid
+    """
+
+    def __init__(self, store: Namespace, fingerprint: str, ttl: int = 86400):
+        self.store = store
+        self.fingerprint = fingerprint
+        self.ttl = ttl
+        self._prefix = hashlib.sha256(fingerprint.encode("utf-8")).hexdigest()[:16]
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, question: str) -> str:
+        digest = hashlib.sha256(normalize_text(question).encode("utf-8")).hexdigest()
+        return f"{self._prefix}:{digest}"
+
+    async def get(self, question: str) -> Optional[str]:
+        value = await self.store.get(self.key(question))
+        if value is None:
+            self.misses += 1
+            metrics.incr("answer_cache.misses")
+            return None
+        self.hits += 1
+        metrics.incr("answer_cache.hits")
+        return value.decode("utf-8")
+
+    async def put(self, question: str, answer: str) -> None:
+        if answer:
+            await self.store.set(self.key(question), answer.encode("utf-8"), self.ttl)
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses}
+
+
+def create_answer_cache(fingerprint: str, path: Optional[str] = None) -> AnswerCache:
+    """
+    Answer cache on the shared state backend (``ANSWER_CACHE_TTL`` seconds).
+
+    Args:
+        fingerprint: See ``AnswerCache``
+        path: SQLite file used instead when the configured backend is
+            process-local memory, so answers outlive a one-shot process
+    """
+    store = namespace("answer")
+    if path and isinstance(get_state(), MemoryState):
+        store = Namespace(SqliteState(path), "answer:")
+    return AnswerCache(store, fingerprint, int(os.getenv("ANSWER_CACHE_TTL", "86400")))
+
+
+def default_concurrency() -> int:
+    return int(os.getenv("BATCH_CONCURRENCY", "8"))
+
+
+def _group_questions(questions: Iterable) -> tuple[list[dict], int]:
+    """Collapse duplicates; returns the unique groups and the number of blank inputs."""
+    groups: dict[str, dict] = {}
+    blank = 0
+    for index, question in enumerate(questions):
+        text = str(question or "").strip()
+        if not text:
+            blank += 1
+            continue
+        group = groups.setdefault(normalize_text(text), {"question": text, "indices": []})
+        group["indices"].append(index)
+    return list(groups.values()), blank
+
+
+async def _answer_group(group: dict, answer: Answerer) -> dict:
+    result = {"index": group["indices"][0], "question": group["question"]}
+    if len(group["indices"]) > 1:
+        result["duplicates"] = group["indices"][1:]
+    started = time.perf_counter()
+    try:
+        result["answer"] = await answer(group["question"])
+    except Exception as exc:
+        result["error"] = str(exc)
+    result["latency_ms"] = round((time.perf_counter() - started) * 1000, 2)
+    return result
+
+
+async def run_batch(
+    questions: Iterable,
+    answer: Answerer,
+    concurrency: Optional[int] = None,
+) -> AsyncIterator[dict]:
+    """
+    Answer ``questions`` with at most ``concurrency`` in flight.
+
+    Args:
+        questions: Question strings; blanks are skipped, duplicates answered once
+        answer: Coroutine function producing the answer for one question
+        concurrency: Parallel answers (``BATCH_CONCURRENCY`` when omitted)
+
+    Yields:
+        One dict per unique question in completion order (``index`` of its
+        first occurrence, ``duplicates``, ``answer`` or ``error``,
+        ``latency_ms``), then a final ``{"summary": {...}}``
+    """
+    started = time.perf_counter()
+    groups, blank = _group_questions(questions)
+    queue: asyncio.Queue = asyncio.Queue()
+    for group in groups:
+        queue.put_nowait(group)
+    results: asyncio.Queue = asyncio.Queue()
+
+    async def worker() -> None:
+        while True:
+            try:
+                group = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            await results.put(await _answer_group(group, answer))
+
+    width = max(1, min(concurrency or default_concurrency(), len(groups) or 1))
+    workers = [asyncio.create_task(worker()) for _ in range(width)] if groups else []
+    latencies = metrics.Histogram()
+    errors = 0
+    try:
+        for _ in range(len(groups)):
+            result = await results.get()
+            latencies.observe(result["latency_ms"])
+            if "error" in result:
+                errors += 1
+            yield result
+    finally:
+        # Also reached when the consumer stops early (client disconnect)
+        for task in workers:
+            task.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+
+    elapsed = time.perf_counter() - started
+    metrics.incr("batch.questions", len(groups))
+    yield {
+        "summary": {
+            "questions": sum(len(group["indices"]) for group in groups) + blank,
+            "unique": len(groups),
+            "blank": blank,
+            "errors": errors,
+            "concurrency": width,
+            "elapsed_s": round(elapsed, 3),
+            "throughput_qps": round(len(groups) / elapsed, 2) if elapsed else 0.0,
+            "latency_ms": latencies.snapshot(),
+        }
+    }
@@ -0,0 +1,74 @@
+"""
+Pooled HTTP clients for upstream services.
+
+One ``httpx.AsyncClient`` per upstream (``azure``, ``graph``) is shared by
+all requests so TLS connections are reused instead of re-established per
+call. Clients are bound to the event loop that created them and closed on
+shutdown by ``aclose_clients``.
+"""
+
+import asyncio
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+
+import httpx
+
+from .recorder import get_recorder
+
+
+_clients: dict[str, tuple[asyncio.AbstractEventLoop, httpx.AsyncClient]] = {}
+
+_LIMITS = httpx.Limits(max_connections=100, max_keepalive_connections=20, keepalive_expiry=30)
+
+
+def get_client(name: str) -> httpx.AsyncClient:
+    """Return the shared client for ``name``, creating it on first use."""
+    loop = asyncio.get_running_loop()
+    entry = _clients.get(name)
+    if entry is None or entry[0] is not loop or entry[1].is_closed:
+        recorder = get_recorder()
+        hooks = {}
+        if recorder:
+            hooks = {"request": [recorder.on_request], "response": [recorder.response_hook(name)]}
+        client = httpx.AsyncClient(timeout=300, limits=_LIMITS, event_hooks=hooks)
+        _clients[name] = (loop, client)
+        return client
+    return entry[1]
+
+
+@asynccontextmanager
+async def pooled(name: str) -> AsyncIterator[httpx.AsyncClient]:
+    """``async with`` drop-in for ``httpx.AsyncClient()`` that keeps the pool open."""
+    yield get_client(name)
+
+
+async def warm_connections(name: str, url: str, count: int = 4) -> int:
+    """
+    Resolve ``url``'s host and open up to ``count`` pooled connections to it
+    with concurrent HEAD requests; any HTTP status will do.
+
+    Returns:
+        Number of requests that reached the server
+    """
+    client = get_client(name)
+
+    async def probe() -> bool:
+        try:
+            await client.head(url, timeout=10)
+            return True
+        except httpx.HTTPError:
+            return False
+
+    results = await asyncio.gather(*(probe() for _ in range(count)))
+    if not any(results):
+        raise RuntimeError(f"Could not connect to {url}")
+    return sum(results)
+
+
+async def aclose_clients() -> None:
+    """Close every pooled client owned by the running event loop."""
+    loop = asyncio.get_running_loop()
+    for name, (owner, client) in list(_clients.items()):
+        if owner is loop:
+            await client.aclose()
+            _clients.pop(name, None)
@@ -0,0 +1,225 @@
+"""
+Token-budgeted RAG context assembly.
+
+Retrieved documents are ranked by relevance, near-duplicate chunks are
+dropped, each document is truncated to a per-document token cap and the
+result is filled up to a total token budget.
+"""
+
+import os
+import re
+from typing import Callable, Optional
+
+
+_PIECES = re.compile(r"\w+|[^\w\s]", re.UNICODE)
+_SENTENCE_END = re.compile(r"(?<=[.!?۔])\s+")
+_WORD = re.compile(r"\w+", re.UNICODE)
+
+_SHINGLE = 5
+
+_encoding = None
+_encoding_loaded = False
+
+
+def _get_encoding():
+    global _encoding, _encoding_loaded
+    if not _encoding_loaded:
+        _encoding_loaded = True
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding(os.getenv("RAG_TOKEN_ENCODING", "o200k_base"))
+        except Exception:
+            _encoding = None
+    return _encoding
+
+
+def count_tokens(text: str) -> int:
+    """Count tokens locally with tiktoken, or estimate when it is unavailable."""
+    if not text:
+        return 0
+    encoding = _get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text))
+    return max(len(_PIECES.findall(text)), (len(text) + 3) // 4)
+
+
+def truncate_tokens(text: str, max_tokens: int) -> str:
+    """Cut ``text`` to at most ``max_tokens``, preferring sentence boundaries."""
+    if max_tokens <= 0:
+        return ""
+    if count_tokens(text) <= max_tokens:
+        return text
+
+    kept: list[str] = []
+    used = 0
+    for sentence in _SENTENCE_END.split(text):
+        cost = count_tokens(sentence)
+        if used + cost > max_tokens:
+            break
+        kept.append(sentence)
+        used += cost
+    if kept:
+        return " ".join(kept)
+
+    encoding = _get_encoding()
+    if encoding is not None:
+        return encoding.decode(encoding.encode(text)[:max_tokens])
+    ratio = max_tokens / max(count_tokens(text), 1)
+    return text[: int(len(text) * ratio)]
+
+
+def _head(sentences: list[str], max_chars: int) -> str:
+    kept: list[str] = []
+    used = 0
+    for sentence in sentences:
+        if used + len(sentence) + (1 if kept else 0) > max_chars:
+            break
+        kept.append(sentence)
+        used += len(sentence) + (1 if len(kept) > 1 else 0)
+    if kept:
+        return " ".join(kept)
+    return sentences[0][:max_chars].rsplit(" ", 1)[0] if sentences else ""
+
+
+def extract_snippet(text: str, query: str, max_chars: int) -> str:
+    """
+    Keep the sentences of ``text`` that mention ``query``, within ``max_chars``.
+
+    Sentences are ranked by how many distinct query words (3+ letters) they
+    contain; the best ones are kept first, then their neighbours while the
+    budget allows, rendered in document order with `` … `` marking gaps.
+    Text that shares no words with the query is cut from the start at a
+    sentence boundary instead.
+    """
+    text = (text or "").strip()
+    if max_chars <= 0 or len(text) <= max_chars:
+        return text if max_chars > 0 else ""
+    sentences = [sentence.strip() for sentence in _SENTENCE_END.split(text) if sentence.strip()]
+    terms = {word.casefold() for word in _WORD.findall(query or "") if len(word) > 2}
+    hits = [len(terms & {word.casefold() for word in _WORD.findall(sentence)}) for sentence in sentences]
+    if not any(hits):
+        return _head(sentences, max_chars)
+
+    chosen: set[int] = set()
+    used = 0
+
+    def take(index: int) -> None:
+        nonlocal used
+        if index in chosen or not 0 <= index < len(sentences):
+            return
+        cost = len(sentences[index]) + 3
+        if used + cost <= max_chars:
+            chosen.add(index)
+            used += cost
+
+    ranked = sorted((i for i, count in enumerate(hits) if count), key=lambda i: (-hits[i], i))
+    for index in ranked:
+        take(index)
+    for index in sorted(chosen):
+        take(index + 1)
+        take(index - 1)
+    if not chosen:
+        return _head([sentences[ranked[0]]], max_chars)
+
+    parts: list[str] = []
+    previous = None
+    for index in sorted(chosen):
+        if previous is not None and index != previous + 1:
+            parts.append("…")
+        parts.append(sentences[index])
+        previous = index
+    return " ".join(parts)
+
+
+def _shingles(text: str) -> set[tuple[str, ...]]:
+    words = [w.casefold() for w in _WORD.findall(text)]
+    if len(words) < _SHINGLE:
+        return {tuple(words)} if words else set()
+    return {tuple(words[i:i + _SHINGLE]) for i in range(len(words) - _SHINGLE + 1)}
+
+
+def _overlaps(candidate: set, selected: list[set], threshold: float) -> bool:
+    if not candidate:
+        return True
+    for other in selected:
+        shared = len(candidate & other)
+        if shared / min(len(candidate), len(other) or 1) >= threshold:
+            return True
+    return False
+
+
+def default_budget() -> int:
+    return int(os.getenv("RAG_CONTEXT_TOKEN_BUDGET", "1500"))
+
+
+def default_doc_cap() -> int:
+    return int(os.getenv("RAG_CONTEXT_DOC_TOKENS", "500"))
+
+
+def assemble_context(
+    documents: list[dict],
+    budget_tokens: Optional[int] = None,
+    max_doc_tokens: Optional[int] = None,
+    render: Optional[Callable[[dict], str]] = None,
+    separator: str = "\n\n",
+    dedupe_threshold: float = 0.8,
+    order_key: Optional[Callable[[dict], str]] = None,
+) -> dict:
+    """
+    Build a context string from scored documents within a token budget.
+
+    Args:
+        documents: Dicts with ``content`` and optional ``score``/``source``
+        budget_tokens: Total token budget for the context
+        max_doc_tokens: Per-document token cap applied before rendering
+        render: Formats one (truncated) document; defaults to its content
+        separator: Joiner between rendered documents
+        dedupe_threshold: Shingle containment above which a chunk is a duplicate
+        order_key: Re-sorts the selected documents (e.g. by id) so the same
+            document set always renders to the same bytes
+
+    Returns:
+        Dict with ``text``, ``tokens`` and the ``documents`` actually used
+    """
+    budget = default_budget() if budget_tokens is None else budget_tokens
+    doc_cap = default_doc_cap() if max_doc_tokens is None else max_doc_tokens
+    render = render or (lambda doc: doc["content"])
+    separator_tokens = count_tokens(separator)
+
+    ranked = sorted(
+        (doc for doc in documents if (doc.get("content") or "").strip()),
+        key=lambda doc: doc.get("score") or 0,
+        reverse=True,
+    )
+
+    parts: list[str] = []
+    used_docs: list[dict] = []
+    seen: list[set] = []
+    used = 0
+    for doc in ranked:
+        shingles = _shingles(doc["content"])
+        if _overlaps(shingles, seen, dedupe_threshold):
+            continue
+        remaining = budget - used - (separator_tokens if parts else 0)
+        if remaining <= 0:
+            break
+        trimmed = dict(doc, content=truncate_tokens(doc["content"].strip(), doc_cap))
+        rendered = render(trimmed)
+        cost = count_tokens(rendered)
+        if cost > remaining:
+            overhead = cost - count_tokens(trimmed["content"])
+            trimmed["content"] = truncate_tokens(trimmed["content"], remaining - overhead)
+            if not trimmed["content"]:
+                break
+            rendered = render(trimmed)
+            cost = count_tokens(rendered)
+        parts.append(rendered)
+        used_docs.append(trimmed)
+        seen.append(shingles)
+        used += cost + (separator_tokens if len(parts) > 1 else 0)
+
+    if order_key is not None:
+        ordered = sorted(zip(used_docs, parts), key=lambda pair: order_key(pair[0]))
+        used_docs = [doc for doc, _ in ordered]
+        parts = [part for _, part in ordered]
+    return {"text": separator.join(parts), "tokens": used, "documents": used_docs}
@@ -0,0 +1,283 @@
+"""
+Embedding Service Module
+
+Cached, micro-batched access to the Azure OpenAI embeddings deployment.
+Vectors are stored as float16 both in the in-memory LRU and on disk, keyed
+by the embedding model and the normalized query text.
+"""
+
+import asyncio
+import hashlib
+import os
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Awaitable, Callable, Optional
+
+import numpy as np
+
+from . import usage
+from .azure import api_version, base_url, json_headers
+from .clients import pooled
+from .serialization import dumps, loads
+
+
+_WHITESPACE = re.compile(r"\s+")
+
+Fetcher = Callable[[list[str], str], Awaitable[list[list[float]]]]
+
+
+def normalize_text(text: str) -> str:
+    """Normalize text so trivially different queries share a cache entry."""
+    text = unicodedata.normalize("NFKC", str(text or ""))
+    return _WHITESPACE.sub(" ", text).strip().casefold()
+
+
+def embedding_model() -> str:
+    return os.getenv("AZURE_EMBEDDING_DEPLOYMENT", "text-embedding-3-small")
+
+
+class EmbeddingCache:
+    """
+    Two-level embedding cache: an in-memory LRU in front of a directory of
+    float16 ``.npy`` files. Safe to share between threads.
+    """
+
+    def __init__(self, max_items: int = 4096, cache_dir: Optional[str] = None):
+        self.max_items = max_items
+        self.cache_dir = cache_dir
+        self._items: OrderedDict[str, np.ndarray] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(text: str, model: str) -> str:
+        raw = f"{model}\x00{normalize_text(text)}".encode("utf-8")
+        return hashlib.sha256(raw).hexdigest()
+
+    def _path(self, key: str) -> Optional[str]:
+        if not self.cache_dir:
+            return None
+        return os.path.join(self.cache_dir, key[:2], f"{key}.npy")
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        with self._lock:
+            vector = self._items.get(key)
+            if vector is not None:
+                self._items.move_to_end(key)
+                self.hits += 1
+                return vector
+
+        path = self._path(key)
+        if path and os.path.exists(path):
+            try:
+                vector = np.load(path, allow_pickle=False)
+            except Exception as e:
+                print(f"Embedding cache read error: {e}")
+            else:
+                self._remember(key, vector)
+                with self._lock:
+                    self.disk_hits += 1
+                return vector
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key: str, vector) -> np.ndarray:
+        compact = np.asarray(vector, dtype=np.float16)
+        self._remember(key, compact)
+        path = self._path(key)
+        if path:
+            try:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                tmp_path = f"{path}.{os.getpid()}.tmp"
+                with open(tmp_path, "wb") as f:
+                    np.save(f, compact, allow_pickle=False)
+                os.replace(tmp_path, path)
+            except Exception as e:
+                print(f"Embedding cache write error: {e}")
+        return compact
+
+    def _remember(self, key: str, vector: np.ndarray) -> None:
+        with self._lock:
+            self._items[key] = vector
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "items": len(self._items),
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+            }
+
+
+async def fetch_embeddings(texts: list[str], model: str) -> list[list[float]]:
+    """Call the Azure OpenAI embeddings deployment for a batch of inputs."""
+    url = f"{base_url()}/openai/deployments/{model}/embeddings"
+    params = {"api-version": api_version()}
+    async with pooled("azure") as client:
+        r = await client.post(url, params=params, headers=json_headers(), content=dumps({"input": texts}), timeout=60)
+        r.raise_for_status()
+        response = loads(r.content)
+    tokens = (response.get("usage") or {}).get("prompt_tokens") or 0
+    usage.record(model, embedding_calls=1, embedding_tokens=tokens)
+    data = sorted(response.get("data", []), key=lambda item: item.get("index", 0))
+    return [item["embedding"] for item in data]
+
+
+class EmbeddingService:
+    """
+    Async embedding client with caching and micro-batching.
+
+    Concurrent ``embed`` calls that arrive within ``batch_window`` seconds
+    are coalesced into a single upstream request (up to ``max_batch``
+    inputs), and identical texts in flight share one future.
+    """
+
+    def __init__(
+        self,
+        model: Optional[str] = None,
+        cache: Optional[EmbeddingCache] = None,
+        batch_window: float = 0.01,
+        max_batch: int = 64,
+        fetch: Optional[Fetcher] = None,
+    ):
+        self.model = model or embedding_model()
+        self.cache = cache or EmbeddingCache()
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self._fetch = fetch or fetch_embeddings
+        self._pending: dict[str, tuple[str, asyncio.Future]] = {}
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self.upstream_calls = 0
+
+    async def embed(self, text: str) -> np.ndarray:
+        """Return the embedding for ``text`` as a float32 vector."""
+        key = self.cache.key(text, self.model)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached.astype(np.float32)
+
+        pending = self._pending.get(key)
+        if pending is None:
+            loop = asyncio.get_running_loop()
+            future = loop.create_future()
+            self._pending[key] = (normalize_text(text), future)
+            if len(self._pending) >= self.max_batch:
+                # Hand the full batch off now, so the next text starts a new one
+                # and no request exceeds the upstream's input limit
+                self._dispatch(loop)
+            elif self._flush_handle is None:
+                self._schedule_flush(loop, self.batch_window)
+        else:
+            future = pending[1]
+
+        vector = await asyncio.shield(future)
+        return vector.astype(np.float32)
+
+    async def embed_many(self, texts: list[str]) -> list[np.ndarray]:
+        return list(await asyncio.gather(*(self.embed(text) for text in texts)))
+
+    def _schedule_flush(self, loop: asyncio.AbstractEventLoop, delay: float) -> None:
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+        self._flush_handle = loop.call_later(delay, self._dispatch, loop)
+
+    def _dispatch(self, loop: asyncio.AbstractEventLoop) -> None:
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batch, self._pending = self._pending, {}
+        if batch:
+            loop.create_task(self._flush(batch))
+
+    async def _flush(self, batch: dict[str, tuple[str, asyncio.Future]]) -> None:
+        keys = list(batch)
+        texts = [batch[key][0] for key in keys]
+        try:
+            self.upstream_calls += 1
+            vectors = await self._fetch(texts, self.model)
+            if len(vectors) != len(keys):
+                raise RuntimeError(f"Expected {len(keys)} embeddings, got {len(vectors)}")
+        except Exception as e:
+            print(f"Embedding batch error: {e}")
+            for key in keys:
+                future = batch[key][1]
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for key, vector in zip(keys, vectors):
+            compact = self.cache.put(key, vector)
+            future = batch[key][1]
+            if not future.done():
+                future.set_result(compact)
+
+    def stats(self) -> dict:
+        return {"model": self.model, "upstream_calls": self.upstream_calls, **self.cache.stats()}
+
+
+class CachedEmbeddings:
+    """
+    Wrap a LangChain-style embeddings object (``embed_query`` /
+    ``embed_documents``) with the shared LRU + disk cache. Used for the local
+    FAISS path, which embeds synchronously.
+    """
+
+    def __init__(self, inner, model: str, cache: Optional[EmbeddingCache] = None):
+        self.inner = inner
+        self.model = model
+        self.cache = cache or _shared_cache()
+
+    def embed_query(self, text: str) -> list[float]:
+        key = self.cache.key(text, self.model)
+        vector = self.cache.get(key)
+        if vector is None:
+            vector = self.cache.put(key, self.inner.embed_query(text))
+        return vector.astype(np.float32).tolist()
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        keys = [self.cache.key(text, self.model) for text in texts]
+        found = [self.cache.get(key) for key in keys]
+        missing = [i for i, vector in enumerate(found) if vector is None]
+        if missing:
+            fresh = self.inner.embed_documents([texts[i] for i in missing])
+            for i, vector in zip(missing, fresh):
+                found[i] = self.cache.put(keys[i], vector)
+        return [vector.astype(np.float32).tolist() for vector in found]
+
+    def __call__(self, text: str) -> list[float]:
+        return self.embed_query(text)
+
+
+_cache: Optional[EmbeddingCache] = None
+_service: Optional[EmbeddingService] = None
+
+
+def _shared_cache() -> EmbeddingCache:
+    global _cache
+    if _cache is None:
+        _cache = EmbeddingCache(
+            max_items=int(os.getenv("EMBEDDING_CACHE_SIZE", "4096")),
+            cache_dir=os.getenv("EMBEDDING_CACHE_DIR", ".cache/embeddings") or None,
+        )
+    return _cache
+
+
+def get_embedding_service() -> EmbeddingService:
+    """Return the process-wide embedding service."""
+    global _service
+    if _service is None:
+        _service = EmbeddingService(
+            cache=_shared_cache(),
+            batch_window=float(os.getenv("EMBEDDING_BATCH_WINDOW_MS", "10")) / 1000,
+            max_batch=int(os.getenv("EMBEDDING_MAX_BATCH", "64")),
+        )
+    return _service
@@ -0,0 +1,294 @@
+"""
+Precomputed FAQ answers served without any LLM call.
+
+``build_faq_store.py`` answers the most frequent question clusters offline
+(from a seed file and/or recorded traffic) and writes a compact store
+directory:
+
+    manifest.json   search index version, answer fingerprint, embedding
+                    model and audio format the store was built for
+    entries.json    question, variants, answer, doc ids and audio file
+    vectors.npy     L2-normalized float16 embeddings of every variant
+    rows.npy        entry index of each vector row
+    audio/          pre-synthesized reply audio, one file per entry
+
+``FaqStore.lookup`` embeds an incoming question through the shared embedding
+service (so hybrid search reuses the cached vector) and returns the entry
+whose nearest variant clears ``FAQ_STORE_THRESHOLD``. The store is only
+served while its manifest matches the running prompt/deployment fingerprint
+and embedding model, and while the search index version it was built
+against is still current; the version is re-checked every
+``FAQ_STORE_CHECK_SECONDS`` and a changed index takes the store out of
+service until it is rebuilt.
+"""
+
+import asyncio
+import hashlib
+import os
+import shutil
+import time
+from typing import Awaitable, Callable, Optional
+
+import numpy as np
+
+from . import metrics, profiling
+from .ai_search import search_index_version
+from .azure import audio_content_type
+from .embeddings import embedding_model, get_embedding_service
+from .serialization import dumps, loads
+
+
+Embedder = Callable[[str], Awaitable[np.ndarray]]
+
+_AUDIO_EXTENSIONS = {"audio/mpeg": ".mp3", "audio/ogg": ".ogg"}
+
+
+def answer_fingerprint(system_prompt: str, deployment: str, formatted: bool) -> str:
+    """Digest of everything besides the question that shapes a stored answer."""
+    raw = f"{system_prompt}\n{deployment}\n{formatted}".encode("utf-8")
+    return hashlib.sha256(raw).hexdigest()[:16]
+
+
+def tts_signature() -> str:
+    """TTS deployment, voice and format the pre-synthesized audio must match."""
+    return ":".join((
+        os.getenv("AZURE_TTS_DEPLOYMENT", "gpt-4o-mini-tts"),
+        os.getenv("AZURE_TTS_VOICE", "alloy"),
+        audio_content_type(),
+    ))
+
+
+def audio_extension(content_type: str) -> str:
+    return _AUDIO_EXTENSIONS.get(content_type, ".bin")
+
+
+def _answer_key(answer: str) -> str:
+    return hashlib.sha256(answer.strip().encode("utf-8")).hexdigest()
+
+
+def _read_json(path: str):
+    with open(path, "rb") as f:
+        return loads(f.read())
+
+
+def write_store(
+    path: str,
+    manifest: dict,
+    entries: list[dict],
+    vectors: np.ndarray,
+    rows: np.ndarray,
+    audio: dict[int, bytes],
+) -> None:
+    """
+    Write a store directory, replacing any existing one in a single rename.
+
+    Args:
+        path: Store directory
+        manifest: Build metadata (index version, fingerprint, ...)
+        entries: One dict per answer; ``audio`` file names are filled in here
+        vectors: Normalized variant embeddings, one row per variant
+        rows: Entry index for each row of ``vectors``
+        audio: Synthesized reply audio by entry index
+    """
+    tmp_path = f"{path.rstrip(os.sep)}.tmp-{os.getpid()}"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(os.path.join(tmp_path, "audio"))
+    extension = audio_extension(manifest.get("audio_format", ""))
+    for index, entry in enumerate(entries):
+        entry["audio"] = None
+        if index in audio:
+            entry["audio"] = f"{entry['id']}{extension}"
+            with open(os.path.join(tmp_path, "audio", entry["audio"]), "wb") as f:
+                f.write(audio[index])
+    np.save(os.path.join(tmp_path, "vectors.npy"), np.asarray(vectors, dtype=np.float16), allow_pickle=False)
+    np.save(os.path.join(tmp_path, "rows.npy"), np.asarray(rows, dtype=np.int32), allow_pickle=False)
+    with open(os.path.join(tmp_path, "entries.json"), "wb") as f:
+        f.write(dumps(entries))
+    # Manifest last: a directory without one is never loaded
+    with open(os.path.join(tmp_path, "manifest.json"), "wb") as f:
+        f.write(dumps({**manifest, "entries": len(entries), "variants": int(len(rows))}))
+
+    old_path = f"{path.rstrip(os.sep)}.old-{os.getpid()}"
+    if os.path.exists(path):
+        os.replace(path, old_path)
+    os.replace(tmp_path, path)
+    shutil.rmtree(old_path, ignore_errors=True)
+
+
+class FaqStore:
+    """
+    Read side of a store built by ``build_faq_store.py``.
+
+    Args:
+        path: Store directory
+        fingerprint: ``answer_fingerprint`` of the running configuration
+        threshold: Minimum cosine similarity to serve a stored answer
+        check_interval: Seconds between search index version checks
+        embed: Coroutine embedding a question; defaults to the shared
+            embedding service
+        index_version: Callable returning the live search index version
+    """
+
+    def __init__(
+        self,
+        path: str,
+        fingerprint: str,
+        threshold: float = 0.92,
+        check_interval: float = 300.0,
+        embed: Optional[Embedder] = None,
+        index_version: Callable[[], str] = search_index_version,
+    ):
+        self.path = path
+        self.fingerprint = fingerprint
+        self.threshold = threshold
+        self.check_interval = check_interval
+        self._embed = embed or get_embedding_service().embed
+        self._index_version = index_version
+        self.manifest: dict = {}
+        self.entries: list[dict] = []
+        self.vectors: Optional[np.ndarray] = None
+        self.rows: Optional[np.ndarray] = None
+        self.active = False
+        self.stale = False
+        self.audio_enabled = False
+        self._by_answer: dict[str, dict] = {}
+        self._audio: dict[str, bytes] = {}
+        self._checked = 0.0
+        self._check_task: Optional[asyncio.Task] = None
+        self.hits = 0
+        self.misses = 0
+
+    def load(self) -> bool:
+        """Load the store from disk; returns whether it can be served."""
+        if not os.path.exists(os.path.join(self.path, "manifest.json")):
+            return False
+        try:
+            manifest = _read_json(os.path.join(self.path, "manifest.json"))
+            entries = _read_json(os.path.join(self.path, "entries.json"))
+            vectors = np.load(os.path.join(self.path, "vectors.npy"), allow_pickle=False)
+            rows = np.load(os.path.join(self.path, "rows.npy"), allow_pickle=False)
+        except Exception as e:
+            print(f"FAQ store load error: {e}")
+            return False
+        if manifest.get("fingerprint") != self.fingerprint:
+            print("FAQ store was built for a different prompt or deployment; rebuild it to serve answers")
+            return False
+        if manifest.get("embedding_model") != embedding_model():
+            print("FAQ store was built with a different embedding model; rebuild it to serve answers")
+            return False
+
+        self.manifest = manifest
+        self.entries = entries
+        self.vectors = vectors.astype(np.float32)
+        self.rows = rows
+        self._by_answer = {_answer_key(entry["answer"]): entry for entry in entries}
+        self.audio_enabled = manifest.get("tts") == tts_signature()
+        self.active = bool(entries) and len(vectors) == len(rows) > 0
+        self._checked = time.monotonic()
+        print(
+            f"FAQ store: {len(entries)} answers, {len(rows)} variants "
+            f"(index version {manifest.get('index_version')}, audio {'on' if self.audio_enabled else 'off'})"
+        )
+        return self.active
+
+    async def check_freshness(self) -> bool:
+        """Compare the live index version with the one the store was built for."""
+        try:
+            current = await asyncio.to_thread(self._index_version)
+        except Exception as e:
+            # Keep the last known state; an unreachable index is not a new one
+            print(f"FAQ store freshness check failed: {e}")
+            return not self.stale
+        finally:
+            self._checked = time.monotonic()
+        stale = current != self.manifest.get("index_version")
+        if stale and not self.stale:
+            metrics.incr("faq_store.stale")
+            print(
+                f"FAQ store is stale (built for {self.manifest.get('index_version')}, "
+                f"index is now {current}); rebuild it with build_faq_store.py"
+            )
+        self.stale = stale
+        return not stale
+
+    def _maybe_check(self) -> None:
+        if time.monotonic() - self._checked < self.check_interval:
+            return
+        if self._check_task is None or self._check_task.done():
+            self._checked = time.monotonic()
+            self._check_task = asyncio.create_task(self.check_freshness())
+
+    @profiling.traced("faq_store")
+    async def lookup(self, question: str, threshold: Optional[float] = None) -> Optional[dict]:
+        """
+        Stored entry for ``question`` (with its ``similarity``), or None.
+
+        ``threshold`` overrides ``FAQ_STORE_THRESHOLD``, e.g. to accept
+        looser matches while search or the LLM is unavailable.
+        """
+        if not self.active:
+            return None
+        self._maybe_check()
+        if self.stale:
+            return None
+        metrics.incr("faq_store.lookups")
+        try:
+            query = np.asarray(await self._embed(question), dtype=np.float32)
+        except Exception as e:
+            print(f"FAQ store embedding error: {e}")
+            return None
+        norm = float(np.linalg.norm(query))
+        if not norm:
+            return None
+        similarities = self.vectors @ (query / norm)
+        row = int(np.argmax(similarities))
+        similarity = float(similarities[row])
+        metrics.observe("faq_store.similarity", similarity)
+        if similarity < (self.threshold if threshold is None else threshold):
+            self.misses += 1
+            metrics.incr("faq_store.misses")
+            return None
+        self.hits += 1
+        metrics.incr("faq_store.hits")
+        return {**self.entries[int(self.rows[row])], "similarity": similarity}
+
+    def audio_for(self, answer: str) -> Optional[bytes]:
+        """Pre-synthesized audio when ``answer`` is a stored answer."""
+        if not self.active or self.stale or not self.audio_enabled:
+            return None
+        entry = self._by_answer.get(_answer_key(answer))
+        if not entry or not entry.get("audio"):
+            return None
+        audio = self._audio.get(entry["audio"])
+        if audio is None:
+            try:
+                with open(os.path.join(self.path, "audio", entry["audio"]), "rb") as f:
+                    audio = f.read()
+            except OSError as e:
+                print(f"FAQ store audio read error: {e}")
+                return None
+            self._audio[entry["audio"]] = audio
+        metrics.incr("faq_store.audio_hits")
+        return audio
+
+    def stats(self) -> dict:
+        return {
+            "active": self.active,
+            "stale": self.stale,
+            "entries": len(self.entries),
+            "index_version": self.manifest.get("index_version"),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+def create_faq_store(fingerprint: str) -> FaqStore:
+    """Load the store from ``FAQ_STORE_DIR`` if one has been built."""
+    store = FaqStore(
+        os.getenv("FAQ_STORE_DIR", "faq_store"),
+        fingerprint,
+        threshold=float(os.getenv("FAQ_STORE_THRESHOLD", "0.92")),
+        check_interval=float(os.getenv("FAQ_STORE_CHECK_SECONDS", "300")),
+    )
+    store.load()
+    return store
@@ -0,0 +1,78 @@
+"""
+Client addresses behind reverse proxies.
+
+App Service, Front Door and most load balancers connect to the app
+themselves, so the socket peer is the proxy and every user would share one
+scheduler/usage key. When the peer is listed in ``TRUSTED_PROXIES``
+(comma-separated addresses or CIDR ranges, or ``*`` for any), the client is
+taken from ``CLIENT_IP_HEADER`` (default ``X-Forwarded-For``): the
+right-most address that is not itself a trusted proxy. Without
+``TRUSTED_PROXIES`` the header is ignored, since clients can set it freely.
+"""
+
+import ipaddress
+import os
+from typing import Optional
+
+
+_cache: tuple[str, list] = ("", [])
+
+
+def _trusted() -> list:
+    global _cache
+    raw = os.getenv("TRUSTED_PROXIES", "").strip()
+    if raw != _cache[0]:
+        networks = []
+        for part in raw.split(","):
+            part = part.strip()
+            if part == "*":
+                networks.append("*")
+            elif part:
+                try:
+                    networks.append(ipaddress.ip_network(part, strict=False))
+                except ValueError:
+                    print(f"Warning: Ignoring invalid TRUSTED_PROXIES entry: {part}")
+        _cache = (raw, networks)
+    return _cache[1]
+
+
+def _is_trusted(address: str, networks: list) -> bool:
+    if "*" in networks:
+        return True
+    try:
+        ip = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    return any(ip in network for network in networks)
+
+
+def client_header() -> str:
+    return os.getenv("CLIENT_IP_HEADER", "x-forwarded-for").strip().lower()
+
+
+def _address(hop: str) -> str:
+    # App Service appends the client port ("1.2.3.4:5678"); IPv6 may be bracketed
+    return hop.rsplit(":", 1)[0] if hop.count(":") == 1 else hop.strip("[]")
+
+
+def client_ip(peer: Optional[str], forwarded: Optional[str]) -> Optional[str]:
+    """
+    Address of the client that sent a request.
+
+    Args:
+        peer: Socket peer address
+        forwarded: Value of ``CLIENT_IP_HEADER``, if the request had one
+    """
+    networks = _trusted()
+    if not peer or not forwarded or not networks or not _is_trusted(peer, networks):
+        return peer
+    hops = [_address(hop.strip()) for hop in forwarded.split(",") if hop.strip()]
+    if not hops:
+        return peer
+    if "*" in networks:
+        # Every hop counts as trusted, so the original client is the first one
+        return hops[0]
+    for address in reversed(hops):
+        if not _is_trusted(address, networks):
+            return address
+    return hops[0]
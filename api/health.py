@@ -0,0 +1,384 @@
+"""
+Upstream health: circuit breakers fed by real calls and background probes.
+
+Every call to Azure OpenAI (chat, STT, TTS), Azure Search and the Graph API
+reports its outcome and latency to that upstream's ``CircuitBreaker``
+(``watched`` / ``observe``). After ``HEALTH_FAILURES_TO_OPEN`` consecutive
+failures, or an error rate of ``HEALTH_ERROR_RATE_TO_OPEN`` over at least
+``HEALTH_MIN_CALLS`` calls in the last ``HEALTH_WINDOW_SECONDS``, the
+breaker opens: guarded calls fail at once with ``UpstreamUnavailable``
+instead of waiting for a timeout, and routes fall back (FAQ store, text
+instead of voice, a "try again later" reply). After ``HEALTH_OPEN_SECONDS``
+one trial call is let through; its outcome closes or re-opens the breaker.
+Probes only check that a service answers, not that a given deployment
+works, so a successful probe closes a circuit only if probes opened it.
+The fast-tier chat deployment has its own breaker (``LLM_FAST``): its rate
+limits must not open the large deployment's circuit that escalation needs.
+
+A ``HealthProber`` probes each upstream every
+``HEALTH_PROBE_INTERVAL_SECONDS`` with a cheap authenticated GET (model
+list, document count, phone number), skipping upstreams that served real
+traffic during the interval. Probe URLs can be pointed elsewhere (e.g. at
+``mock_upstreams.py``) with ``HEALTH_PROBE_<NAME>_URL``. Only one worker
+probes per interval (a lease in the state backend) and the others read its
+results, so probe load is fixed per interval: ``/health?deep=1`` and
+``/whatsapp/diagnose`` only read the cached state, however often they are
+polled.
+"""
+
+import asyncio
+import os
+import time
+from collections import deque
+from functools import wraps
+from typing import Callable, Optional
+
+import httpx
+from fastapi import HTTPException
+
+from . import metrics
+from .clients import get_client
+from .serialization import dumps, loads
+from .state import namespace
+
+
+LLM = "llm"
+LLM_FAST = "llm_fast"
+STT = "stt"
+TTS = "tts"
+SEARCH = "search"
+GRAPH = "graph"
+
+UPSTREAMS = (LLM, LLM_FAST, STT, TTS, SEARCH, GRAPH)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# ``(url, headers)`` for an upstream's probe request
+Target = Callable[[], tuple[str, dict]]
+
+
+class UpstreamUnavailable(HTTPException):
+    """Raised instead of calling an upstream whose circuit is open."""
+
+    def __init__(self, name: str):
+        super().__init__(status_code=503, detail=f"Upstream {name} is temporarily unavailable")
+        self.name = name
+
+
+def failed_status(status: int) -> bool:
+    """Whether an HTTP error status means the upstream is unhealthy, not that the request was bad."""
+    return status >= 500 or status in (401, 403, 408, 429)
+
+
+def _is_failure(exc: BaseException) -> bool:
+    if isinstance(exc, UpstreamUnavailable):
+        return False
+    cause = exc if isinstance(exc, httpx.HTTPStatusError) else exc.__cause__
+    if isinstance(cause, httpx.HTTPStatusError):
+        return failed_status(cause.response.status_code)
+    return True
+
+
+class CircuitBreaker:
+    """
+    Recent outcomes of one upstream and the open/closed decision.
+
+    Args:
+        name: Upstream name, used in metrics
+        failures_to_open: Consecutive failures that open the circuit
+        error_rate_to_open: Error rate over the window that opens it
+        min_calls: Calls in the window before the error rate counts
+        open_seconds: Time before a trial call is let through
+        window_seconds: Age of the outcomes that count
+    """
+
+    def __init__(
+        self,
+        name: str,
+        failures_to_open: int = 5,
+        error_rate_to_open: float = 0.5,
+        min_calls: int = 10,
+        open_seconds: float = 30.0,
+        window_seconds: float = 300.0,
+    ):
+        self.name = name
+        self.failures_to_open = failures_to_open
+        self.error_rate_to_open = error_rate_to_open
+        self.min_calls = min_calls
+        self.open_seconds = open_seconds
+        self.window_seconds = window_seconds
+        self.state = CLOSED
+        self.opened_at: Optional[float] = None
+        self.retry_at = 0.0
+        self.consecutive_failures = 0
+        self.last_call: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self.probe: Optional[dict] = None
+        self._opened_by_probe = False
+        # (time, ok, ms) of real calls, newest last
+        self._calls: deque = deque(maxlen=200)
+
+    def available(self) -> bool:
+        """Whether a call would be let through (without claiming the trial)."""
+        return self.state == CLOSED or time.time() >= self.retry_at
+
+    def allow(self) -> bool:
+        """Whether to make a call now; claims the single trial of an open circuit."""
+        if self.state == CLOSED:
+            return True
+        now = time.time()
+        if now < self.retry_at:
+            metrics.incr(f"health.{self.name}.rejected")
+            return False
+        # One trial per cooldown; an abandoned trial just waits for the next one
+        self.state = HALF_OPEN
+        self.retry_at = now + self.open_seconds
+        return True
+
+    def record(self, ok: bool, ms: Optional[float] = None, error: Optional[str] = None, probe: bool = False) -> None:
+        now = time.time()
+        if not probe:
+            self.last_call = now
+            self._calls.append((now, ok, ms))
+            if ms is not None and ok:
+                metrics.observe(f"health.{self.name}.latency_ms", ms)
+        if ok and probe and not (self.state != CLOSED and self._opened_by_probe):
+            return
+        if ok:
+            self.consecutive_failures = 0
+            if self.state != CLOSED:
+                print(f"Upstream {self.name} recovered")
+                metrics.incr(f"health.{self.name}.closed")
+            self.state = CLOSED
+            self.opened_at = None
+            return
+        self.consecutive_failures += 1
+        self.last_error = error
+        metrics.incr(f"health.{self.name}.failures")
+        if self.state == CLOSED and not self._should_open(now):
+            return
+        if self.state == CLOSED:
+            print(f"Upstream {self.name} unhealthy, opening circuit: {error}")
+            metrics.incr(f"health.{self.name}.opened")
+            self.opened_at = now
+        if self.state != OPEN or not probe:
+            # Failed probes of an open circuit do not postpone its next trial
+            self.retry_at = now + self.open_seconds
+            self._opened_by_probe = probe
+        self.state = OPEN
+
+    def _should_open(self, now: float) -> bool:
+        if self.consecutive_failures >= self.failures_to_open:
+            return True
+        recent = [ok for at, ok, _ in self._calls if at > now - self.window_seconds]
+        if len(recent) < self.min_calls:
+            return False
+        return recent.count(False) / len(recent) >= self.error_rate_to_open
+
+    def stats(self) -> dict:
+        now = time.time()
+        recent = [(ok, ms) for at, ok, ms in self._calls if at > now - self.window_seconds]
+        latencies = sorted(ms for ok, ms in recent if ok and ms is not None)
+
+        def pct(p: float) -> Optional[float]:
+            if not latencies:
+                return None
+            return round(latencies[min(len(latencies) - 1, int(p * len(latencies)))], 1)
+
+        errors = sum(1 for ok, _ in recent if not ok)
+        return {
+            "state": self.state,
+            "available": self.available(),
+            "opened_at": self.opened_at,
+            "consecutive_failures": self.consecutive_failures,
+            "last_error": self.last_error,
+            "calls": len(recent),
+            "error_rate": round(errors / len(recent), 3) if recent else None,
+            "p50_ms": pct(0.50),
+            "p95_ms": pct(0.95),
+            "last_call_age_s": round(now - self.last_call, 1) if self.last_call else None,
+            "probe": self.probe,
+        }
+
+
+_breakers: dict[str, CircuitBreaker] = {}
+
+
+def breaker(name: str) -> CircuitBreaker:
+    """Process-wide breaker for ``name``, configured from HEALTH_* variables."""
+    entry = _breakers.get(name)
+    if entry is None:
+        entry = _breakers[name] = CircuitBreaker(
+            name,
+            failures_to_open=int(os.getenv("HEALTH_FAILURES_TO_OPEN", "5")),
+            error_rate_to_open=float(os.getenv("HEALTH_ERROR_RATE_TO_OPEN", "0.5")),
+            min_calls=int(os.getenv("HEALTH_MIN_CALLS", "10")),
+            open_seconds=float(os.getenv("HEALTH_OPEN_SECONDS", "30")),
+            window_seconds=float(os.getenv("HEALTH_WINDOW_SECONDS", "300")),
+        )
+    return entry
+
+
+def available(name: str) -> bool:
+    """Cheap routing check: False while ``name``'s circuit is open."""
+    return breaker(name).available()
+
+
+def observe(name: str, ok: bool, ms: Optional[float] = None, error: Optional[str] = None) -> None:
+    """Report the outcome of a real call to ``name``."""
+    breaker(name).record(ok, ms, error)
+
+
+def watched(name: str | Callable[..., str], guard: bool = True):
+    """
+    Report outcomes and latency of the decorated coroutine to ``name``'s breaker.
+
+    ``name`` may also be a function of the call's arguments returning the
+    upstream name, for calls whose breaker depends on the target (e.g. the
+    chat deployment). With ``guard`` the call fails fast with
+    ``UpstreamUnavailable`` while the circuit is open.
+    """
+
+    def decorate(func):
+        @wraps(func)
+        async def wrapper(*args, **kwargs):
+            upstream = name(*args, **kwargs) if callable(name) else name
+            current = breaker(upstream)
+            if guard and not current.allow():
+                raise UpstreamUnavailable(upstream)
+            started = time.perf_counter()
+            try:
+                result = await func(*args, **kwargs)
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:
+                failed = _is_failure(exc)
+                current.record(not failed, (time.perf_counter() - started) * 1000, str(exc)[:200] if failed else None)
+                raise
+            current.record(True, (time.perf_counter() - started) * 1000)
+            return result
+
+        return wrapper
+
+    return decorate
+
+
+class HealthProber:
+    """
+    Periodic probes of upstream availability and latency.
+
+    Args:
+        targets: ``{upstream: target}``; upstreams whose targets resolve to
+            the same URL share one request
+        interval: Seconds between probe rounds (0 disables probing)
+        timeout: Per-probe timeout in seconds
+    """
+
+    def __init__(self, targets: dict[str, Target], interval: float = 30.0, timeout: float = 5.0):
+        self.targets = targets
+        self.interval = interval
+        self.timeout = timeout
+        self.rounds = 0
+        self._state = namespace("health")
+        self._applied: dict[str, float] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def _resolve(self, name: str) -> tuple[str, dict]:
+        url, headers = self.targets[name]()
+        override = os.getenv(f"HEALTH_PROBE_{name.upper()}_URL")
+        return (override or url), headers
+
+    async def _probe(self, url: str, headers: dict) -> dict:
+        started = time.perf_counter()
+        result = {"at": time.time()}
+        try:
+            r = await get_client("health").get(url, headers=headers, timeout=self.timeout)
+            # Same rule as real calls: a 404 from the probe URL is not an outage
+            result.update(ok=not failed_status(r.status_code), status=r.status_code)
+            if not result["ok"]:
+                result["error"] = f"HTTP {r.status_code}"
+        except httpx.HTTPError as e:
+            result.update(ok=False, error=f"{type(e).__name__}: {e}"[:200])
+        result["ms"] = round((time.perf_counter() - started) * 1000, 1)
+        return result
+
+    async def probe_all(self) -> dict[str, dict]:
+        """One probe per distinct URL for upstreams without recent real traffic."""
+        cutoff = time.time() - self.interval
+        groups: dict[tuple, list[str]] = {}
+        results: dict[str, dict] = {}
+        for name in self.targets:
+            current = breaker(name)
+            if current.state == CLOSED and current.last_call and current.last_call > cutoff:
+                continue
+            try:
+                url, headers = self._resolve(name)
+            except Exception as e:
+                results[name] = {"at": time.time(), "ok": False, "error": str(e)}
+                continue
+            groups.setdefault((url, tuple(sorted(headers.items()))), []).append(name)
+        probed = await asyncio.gather(*(self._probe(url, dict(headers)) for url, headers in groups))
+        for names, result in zip(groups.values(), probed):
+            for name in names:
+                results[name] = result
+                metrics.observe(f"health.{name}.probe_ms", result["ms"])
+        return results
+
+    async def run_once(self) -> None:
+        """Probe if this worker holds the round's lease, else adopt the shared results."""
+        ttl = max(1, int(self.interval))
+        if await self._state.add("lease", str(os.getpid()).encode(), ttl):
+            results = await self.probe_all()
+            shared = loads(await self._state.get("results") or b"{}")
+            shared.update(results)
+            await self._state.set("results", dumps(shared), ttl * 4)
+            self.rounds += 1
+        else:
+            shared = loads(await self._state.get("results") or b"{}")
+        for name, result in shared.items():
+            if name not in self.targets or result["at"] <= self._applied.get(name, 0):
+                continue
+            self._applied[name] = result["at"]
+            current = breaker(name)
+            current.probe = result
+            current.record(result["ok"], result.get("ms"), result.get("error"), probe=True)
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.run_once()
+            except Exception as e:
+                print(f"Health probe error: {e}")
+            await asyncio.sleep(self.interval)
+
+    def start(self) -> None:
+        if self.interval > 0 and self.targets:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    def report(self) -> dict:
+        """Cached state of every upstream; never calls out."""
+        upstreams = {name: breaker(name).stats() for name in UPSTREAMS if name in self.targets or name in _breakers}
+        return {
+            "interval_seconds": self.interval,
+            "rounds": self.rounds,
+            "degraded": sorted(name for name, stats in upstreams.items() if stats["state"] != CLOSED),
+            "upstreams": upstreams,
+        }
+
+
+def create_prober(targets: dict[str, Target]) -> HealthProber:
+    return HealthProber(
+        targets,
+        interval=float(os.getenv("HEALTH_PROBE_INTERVAL_SECONDS", "30")),
+        timeout=float(os.getenv("HEALTH_PROBE_TIMEOUT_SECONDS", "5")),
+    )
@@ -0,0 +1,231 @@
+"""
+Local intent router.
+
+Classifies a message on the CPU before any retrieval or LLM call so that
+greetings, acknowledgements, canned FAQs and clearly off-topic chatter are
+answered without touching Azure Search or Azure OpenAI. Tiers, in order:
+
+1. Keyword/regex rules for small talk (English, Roman Urdu, Urdu script)
+2. Canned FAQ patterns loaded from ``INTENT_FAQ_PATH`` (default
+   ``intent_faqs.json``, not shipped: copy ``intent_faqs.example.json``
+   once its answers are confirmed). The file is ``{"faqs": [...]}`` or a
+   bare list of ``{"intent", "patterns", "answer", "examples"}`` entries;
+   ``patterns`` are case-insensitive regexes tried against the raw and the
+   normalized message, ``examples`` feed tier 4
+3. Off-topic detection for messages with no banking vocabulary
+4. Optional nearest-centroid match over a small local sentence encoder
+   (``INTENT_EMBEDDING_MODEL``, requires ``sentence-transformers``)
+"""
+
+import json
+import os
+import re
+import unicodedata
+from typing import Optional
+
+from . import metrics
+
+
+GREETING_REPLY = "Assalam-o-Alaikum! Welcome to Bank Islami. How can I help you today?"
+OUT_OF_SCOPE_REPLY = "Please ask questions related to Bank Islami. Bank Islami se mutalaq sawal pouchain"
+
+_REPLIES = {
+    "greeting": GREETING_REPLY,
+    "thanks": "You're welcome! Is there anything else I can help you with? Koi aur sawal ho to zaroor pouchain.",
+    "acknowledgement": "Is there anything else I can help you with regarding Bank Islami?",
+    "goodbye": "Thank you for contacting Bank Islami. Allah Hafiz!",
+    "off_topic": OUT_OF_SCOPE_REPLY,
+}
+
+# Whole-message greeting/goodbye patterns; matched against normalized text.
+_GREETING = re.compile(
+    r"^(hi|hello|hey|salam|salaam|slam|aoa|a o a|as+alam+ ?(o|u)? ?alaikum|as+alam+ ?(o|u)? ?alykum|"
+    r"good (morning|afternoon|evening)|السلام علیکم|السلام عليكم|سلام|ہیلو)( (there|sir|madam|team|ji))?$"
+)
+_GOODBYE = re.compile(
+    r"^(bye|goodbye|good bye|allah hafiz|khuda hafiz|take care|see you|اللہ حافظ|خدا حافظ)$"
+)
+
+# Thanks/acknowledgements may be combined ("ok thanks", "theek hai shukriya"),
+# so they are matched word by word. Yes/no style replies are deliberately
+# absent: they usually answer the assistant's own follow-up question.
+_THANKS_WORDS = {
+    "thanks", "thank", "thx", "ty", "shukriya", "shukria", "jazakallah", "jazak", "khair",
+    "شکریہ", "جزاک",
+}
+_ACK_WORDS = {
+    "ok", "okay", "k", "alright", "fine", "sure", "great", "nice", "cool", "got", "noted",
+    "understood", "acha", "achha", "theek", "thik", "hai", "ٹھیک", "ہے", "اچھا",
+}
+_FILLER_WORDS = {
+    "you", "so", "very", "much", "a", "lot", "it", "sir", "madam", "allah", "bohat", "bahut",
+    "بہت", "اللہ",
+}
+
+_BANKING_TERMS = re.compile(
+    r"\b(bank|islami|account|acc|a/c|card|debit|credit|atm|branch|loan|financ\w*|ijarah|"
+    r"murabaha|musharakah|mudarabah|profit|rate|deposit|withdraw\w*|transfer|cheque|"
+    r"balance|statement|app|internet banking|roshan|remittance|car|house|home|"
+    r"zakat|sukuk|takaful|fee|charges|limit|cnic|nicop|pin|otp|helpline|timing\w*|"
+    r"khata|qarz|raqam|paisa|paise)\b|اکاؤنٹ|بینک|کارڈ|قرض|منافع|برانچ",
+    re.IGNORECASE,
+)
+
+_OFF_TOPIC = re.compile(
+    r"\b(weather|cricket|football|match score|movie|film|song|lyrics|poem|joke|recipe|"
+    r"cook\w*|girlfriend|boyfriend|horoscope|celebrity|actor|actress|politics|election|"
+    r"write (me )?(a |an )?(code|essay|story)|python|javascript|homework|game)\b",
+    re.IGNORECASE,
+)
+
+_PUNCTUATION = re.compile(r"[^\w\s/]+", re.UNICODE)
+_SPACES = re.compile(r"\s+")
+_STRETCHED = re.compile(r"([^\W\d_])\1{2,}")
+
+
+def normalize(text: str) -> str:
+    text = unicodedata.normalize("NFKC", text or "").casefold()
+    text = _PUNCTUATION.sub(" ", text)
+    text = _STRETCHED.sub(r"\1", text)  # "hiii", "okkk", "thanksss"
+    return _SPACES.sub(" ", text).strip()
+
+
+def _small_talk(normalized: str) -> Optional[str]:
+    if _GREETING.match(normalized):
+        return "greeting"
+    if _GOODBYE.match(normalized):
+        return "goodbye"
+    words = set(normalized.split())
+    if words - _FILLER_WORDS and words <= _THANKS_WORDS | _ACK_WORDS | _FILLER_WORDS:
+        return "thanks" if words & _THANKS_WORDS else "acknowledgement"
+    return None
+
+
+def _is_symbol_only(text: str) -> bool:
+    """Emoji, stickers and punctuation with no letters or digits."""
+    return bool(text.strip()) and not any(ch.isalnum() for ch in text)
+
+
+class IntentRouter:
+    """
+    CPU-only classifier returning a ready answer for locally served intents.
+
+    Args:
+        faqs: Canned entries ``{"intent", "patterns": [regex, ...], "answer",
+            "examples": [phrase, ...]}``
+        encoder: Optional object with ``encode(list[str]) -> array`` used for
+            the nearest-centroid tier
+        centroid_threshold: Minimum cosine similarity for a centroid match
+    """
+
+    def __init__(self, faqs: Optional[list[dict]] = None, encoder=None, centroid_threshold: float = 0.8):
+        self.faqs = []
+        for faq in faqs or []:
+            patterns = [re.compile(p, re.IGNORECASE) for p in faq.get("patterns", [])]
+            self.faqs.append({**faq, "compiled": patterns})
+        self.encoder = encoder
+        self.centroid_threshold = centroid_threshold
+        self._centroids = None
+        if encoder is not None:
+            self._build_centroids()
+
+    def _build_centroids(self) -> None:
+        import numpy as np
+
+        names, vectors = [], []
+        for faq in self.faqs:
+            examples = faq.get("examples") or []
+            if not examples:
+                continue
+            encoded = np.asarray(self.encoder.encode(examples), dtype=np.float32)
+            centroid = encoded.mean(axis=0)
+            vectors.append(centroid / (np.linalg.norm(centroid) or 1.0))
+            names.append(faq)
+        if vectors:
+            self._centroids = (names, np.stack(vectors))
+
+    def classify(self, text: str) -> Optional[dict]:
+        """
+        Classify ``text``.
+
+        Returns:
+            ``{"intent", "answer", "tier"}`` when the message can be served
+            locally, otherwise None (continue with retrieval + LLM)
+        """
+        if _is_symbol_only(text):
+            return {"intent": "acknowledgement", "answer": _REPLIES["acknowledgement"], "tier": "rules"}
+
+        normalized = normalize(text)
+        if not normalized:
+            return None
+
+        name = _small_talk(normalized)
+        if name:
+            return {"intent": name, "answer": _REPLIES[name], "tier": "rules"}
+
+        for faq in self.faqs:
+            if any(p.search(text) or p.search(normalized) for p in faq["compiled"]):
+                return {"intent": faq["intent"], "answer": faq["answer"], "tier": "faq"}
+
+        if not _BANKING_TERMS.search(normalized) and _OFF_TOPIC.search(normalized):
+            return {"intent": "off_topic", "answer": _REPLIES["off_topic"], "tier": "rules"}
+
+        if self._centroids is not None:
+            import numpy as np
+
+            names, matrix = self._centroids
+            vector = np.asarray(self.encoder.encode([text]), dtype=np.float32)[0]
+            vector = vector / (np.linalg.norm(vector) or 1.0)
+            scores = matrix @ vector
+            best = int(scores.argmax())
+            if scores[best] >= self.centroid_threshold:
+                faq = names[best]
+                return {"intent": faq["intent"], "answer": faq["answer"], "tier": "centroid"}
+
+        return None
+
+    def canned_answers(self) -> list[str]:
+        """Every answer this router can return, e.g. to pre-synthesize audio."""
+        answers = [*_REPLIES.values(), *(faq["answer"] for faq in self.faqs if faq.get("answer"))]
+        return list(dict.fromkeys(answers))
+
+    def route(self, text: str) -> Optional[dict]:
+        """Classify and record how much traffic is served locally."""
+        metrics.incr("intent.total")
+        result = self.classify(text)
+        if result:
+            metrics.incr("intent.local")
+            metrics.incr(f"intent.local.{result['intent']}")
+        return result
+
+
+def _load_faqs(path: str) -> list[dict]:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except FileNotFoundError:
+        print(f"Intent FAQ tier disabled: {path} not found (see intent_faqs.example.json)")
+        return []
+    except Exception as e:
+        print(f"Warning: Could not load intent FAQs: {e}")
+        return []
+    return data.get("faqs", []) if isinstance(data, dict) else data
+
+
+def create_intent_router() -> IntentRouter:
+    """Build the router from INTENT_* environment variables."""
+    faqs = _load_faqs(os.getenv("INTENT_FAQ_PATH", "intent_faqs.json"))
+    encoder = None
+    model_name = os.getenv("INTENT_EMBEDDING_MODEL")
+    if model_name:
+        try:
+            from sentence_transformers import SentenceTransformer
+
+            encoder = SentenceTransformer(model_name, device="cpu")
+        except Exception as e:
+            print(f"Warning: Intent embedding model unavailable: {e}")
+    return IntentRouter(
+        faqs,
+        encoder=encoder,
+        centroid_threshold=float(os.getenv("INTENT_CENTROID_THRESHOLD", "0.8")),
+    )
@@ -0,0 +1,107 @@
+"""
+In-process metrics registry.
+
+Counters and histograms are kept per worker process and exposed as JSON
+from the /metrics endpoint.
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterator
+
+
+_RESERVOIR_SIZE = 1024
+
+
+class Histogram:
+    """Running count/sum plus a bounded reservoir for percentile estimates."""
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.total = 0.0
+        self._recent: list[float] = []
+        self._next = 0
+
+    def observe(self, value: float) -> None:
+        self.count += 1
+        self.total += value
+        if len(self._recent) < _RESERVOIR_SIZE:
+            self._recent.append(value)
+        else:
+            self._recent[self._next] = value
+            self._next = (self._next + 1) % _RESERVOIR_SIZE
+
+    def snapshot(self) -> dict:
+        ordered = sorted(self._recent)
+
+        def pct(p: float) -> float:
+            if not ordered:
+                return 0.0
+            return ordered[min(len(ordered) - 1, int(p * len(ordered)))]
+
+        return {
+            "count": self.count,
+            "mean": self.total / self.count if self.count else 0.0,
+            "p50": pct(0.50),
+            "p95": pct(0.95),
+            "p99": pct(0.99),
+            "max": ordered[-1] if ordered else 0.0,
+        }
+
+
+class Registry:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.counters: dict[str, float] = {}
+        self.histograms: dict[str, Histogram] = {}
+
+    def incr(self, name: str, value: float = 1) -> None:
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def observe(self, name: str, value: float) -> None:
+        with self._lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+            histogram.observe(value)
+
+    def ratio(self, numerator: str, denominator: str) -> float:
+        with self._lock:
+            total = self.counters.get(denominator, 0)
+            return self.counters.get(numerator, 0) / total if total else 0.0
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            counters = dict(sorted(self.counters.items()))
+            histograms = {
+                name: histogram.snapshot()
+                for name, histogram in sorted(self.histograms.items())
+            }
+        return {"counters": counters, "histograms": histograms}
+
+
+registry = Registry()
+
+
+def incr(name: str, value: float = 1) -> None:
+    registry.incr(name, value)
+
+
+def observe(name: str, value: float) -> None:
+    registry.observe(name, value)
+
+
+@contextmanager
+def timer(name: str) -> Iterator[None]:
+    """Record the wall-clock duration of the block in milliseconds."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        registry.observe(name, (time.perf_counter() - start) * 1000)
+
+
+def snapshot() -> dict:
+    return registry.snapshot()
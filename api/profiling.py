@@ -0,0 +1,440 @@
+"""
+Opt-in profiling: slow-request sampling, on-demand profiles and event-loop
+lag monitoring.
+
+Nothing here runs unless configured:
+
+``PROFILE_SLOW_MS``
+    Requests and webhook jobs are traced; a trace records the time spent in
+    each ``traced`` stage (search, LLM, STT, TTS, ...) and, while it is
+    active, a sampler thread takes a stack sample of the event loop thread
+    every ``PROFILE_SAMPLE_MS``. Samples are attributed to the trace whose
+    task is running, so they show where a request burned the loop itself
+    (CPU work or a blocking call) rather than where it awaited I/O, which
+    the stage breakdown already covers. Traces slower than the threshold
+    are kept (the last ``PROFILE_KEEP``) for ``/admin/slow``.
+
+``LOOP_LAG_THRESHOLD_MS``
+    A heartbeat task records ``loop.lag_ms``; a watchdog thread notices a
+    missed heartbeat while the loop is still stuck and captures the stack
+    that is blocking it (``loop.blocked``).
+
+``ADMIN_TOKEN``
+    Enables ``/admin/profile``: a time-boxed cProfile of the loop thread
+    (``.prof`` for pstats/snakeviz) or a stack-sampling profile in folded
+    format (flamegraph.pl, speedscope).
+
+When tracing is off, ``traced`` costs one context variable lookup.
+"""
+
+import asyncio
+import cProfile
+import functools
+import io
+import marshal
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator, Optional
+
+from . import metrics
+
+
+_MAX_DEPTH = 64
+_TOP_STACKS = 20
+# Frames from this package are labelled "api/<file>" to tell them from libraries
+_PACKAGE_DIR = os.path.dirname(os.path.abspath(__file__))
+_PACKAGE_PREFIX = os.path.basename(_PACKAGE_DIR) + "/"
+
+
+def slow_threshold_ms() -> float:
+    return float(os.getenv("PROFILE_SLOW_MS", "0"))
+
+
+def sample_interval() -> float:
+    return float(os.getenv("PROFILE_SAMPLE_MS", "10")) / 1000
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    name = os.path.basename(code.co_filename)
+    if code.co_filename.startswith(_PACKAGE_DIR):
+        name = _PACKAGE_PREFIX + name
+    return f"{name}:{code.co_name}:{frame.f_lineno}"
+
+
+def _folded(frame) -> Optional[str]:
+    """Root-first ``a;b;c`` stack of ``frame``, None when the loop is idle."""
+    labels = []
+    while frame is not None and len(labels) < _MAX_DEPTH:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    if not labels:
+        return None
+    # Waiting in the selector is idle time, not work
+    if labels[0].startswith("selectors.py:select:"):
+        return None
+    return ";".join(reversed(labels))
+
+
+def _app_frame(labels: list[str]) -> str:
+    """Innermost frame label from this package, else the innermost frame."""
+    for label in reversed(labels):
+        if label.startswith(_PACKAGE_PREFIX):
+            return label
+    return labels[-1] if labels else "unknown"
+
+
+class RequestTrace:
+    """Stage timings and loop stack samples of one request or job."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.started = time.perf_counter()
+        self.started_at = time.time()
+        self.status: Optional[int] = None
+        self.stages: dict[str, float] = {}
+        self.stacks: Counter = Counter()
+        self.tasks: list[asyncio.Task] = []
+
+    def add_stage(self, name: str, ms: float) -> None:
+        self.stages[name] = self.stages.get(name, 0.0) + ms
+
+    def record(self, total_ms: float) -> dict:
+        interval_ms = sample_interval() * 1000
+        return {
+            "name": self.name,
+            "at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(self.started_at)),
+            "status": self.status,
+            "total_ms": round(total_ms, 1),
+            "stages_ms": {name: round(ms, 1) for name, ms in self.stages.items()},
+            "unaccounted_ms": round(max(0.0, total_ms - sum(self.stages.values())), 1),
+            "loop_ms": round(sum(self.stacks.values()) * interval_ms, 1),
+            "stacks": [
+                {"stack": stack, "ms": round(count * interval_ms, 1)}
+                for stack, count in self.stacks.most_common(_TOP_STACKS)
+            ],
+        }
+
+
+_trace: ContextVar[Optional[RequestTrace]] = ContextVar("profiling_trace", default=None)
+
+
+class _LoopSampler:
+    """
+    Thread sampling the event loop thread's stack while anyone needs it.
+
+    Consumers are active request traces (attributed by running task) and a
+    running ``stacks`` profile (everything).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread: Optional[int] = None
+        self._tasks: dict[asyncio.Task, RequestTrace] = {}
+        self.profile: Optional[Counter] = None
+
+    def attach(self, task: asyncio.Task, trace: RequestTrace) -> None:
+        with self._lock:
+            self._tasks[task] = trace
+        trace.tasks.append(task)
+        self._ensure_running()
+
+    def detach(self, trace: RequestTrace) -> None:
+        with self._lock:
+            for task in trace.tasks:
+                self._tasks.pop(task, None)
+
+    def start_profile(self) -> None:
+        self.profile = Counter()
+        self._ensure_running()
+
+    def stop_profile(self) -> Counter:
+        profile, self.profile = self.profile or Counter(), None
+        return profile
+
+    def _ensure_running(self) -> None:
+        if self._thread is None:
+            self._loop = asyncio.get_running_loop()
+            self._loop_thread = threading.get_ident()
+            self._thread = threading.Thread(target=self._run, name="loop-sampler", daemon=True)
+            self._thread.start()
+        self._wake.set()
+
+    def _run(self) -> None:
+        while True:
+            if not self._tasks and self.profile is None:
+                self._wake.clear()
+                self._wake.wait()
+            time.sleep(sample_interval())
+            frame = sys._current_frames().get(self._loop_thread)
+            stack = _folded(frame) if frame is not None else None
+            if stack is None:
+                continue
+            profile = self.profile
+            if profile is not None:
+                profile[stack] += 1
+            task = asyncio.current_task(self._loop)
+            with self._lock:
+                trace = self._tasks.get(task) if task is not None else None
+            if trace is not None:
+                trace.stacks[stack] += 1
+
+
+_sampler = _LoopSampler()
+
+
+class SlowRequestLog:
+    """The most recent traces over the slow threshold."""
+
+    def __init__(self, keep: int = 50):
+        self.samples: deque = deque(maxlen=keep)
+
+    def add(self, sample: dict) -> None:
+        self.samples.append(sample)
+        metrics.incr("profile.slow_requests")
+
+    def snapshot(self) -> list[dict]:
+        return list(reversed(self.samples))
+
+
+slow_requests = SlowRequestLog(int(os.getenv("PROFILE_KEEP", "50")))
+
+
+@contextmanager
+def trace(name: str) -> Iterator[Optional[RequestTrace]]:
+    """
+    Trace the block as one request when slow-request sampling is on; kept
+    in ``slow_requests`` if it takes longer than ``PROFILE_SLOW_MS``.
+    """
+    threshold = slow_threshold_ms()
+    if threshold <= 0:
+        yield None
+        return
+    current = RequestTrace(name)
+    token = _trace.set(current)
+    task = asyncio.current_task()
+    if task is not None:
+        _sampler.attach(task, current)
+    try:
+        yield current
+    finally:
+        _trace.reset(token)
+        _sampler.detach(current)
+        total_ms = (time.perf_counter() - current.started) * 1000
+        if total_ms >= threshold:
+            slow_requests.add(current.record(total_ms))
+
+
+def traced(stage: str):
+    """Decorate a coroutine function so its time counts as ``stage`` in the active trace."""
+
+    def decorate(fn):
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            current = _trace.get()
+            if current is None:
+                return await fn(*args, **kwargs)
+            task = asyncio.current_task()
+            if task is not None and task not in current.tasks:
+                # Work fanned out to another task still belongs to this request
+                _sampler.attach(task, current)
+            started = time.perf_counter()
+            try:
+                return await fn(*args, **kwargs)
+            finally:
+                current.add_stage(stage, (time.perf_counter() - started) * 1000)
+
+        return wrapper
+
+    return decorate
+
+
+class SlowRequestMiddleware:
+    """ASGI middleware tracing each HTTP request as ``METHOD /path``."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        with trace(f"{scope['method']} {scope['path']}") as current:
+
+            async def traced_send(message) -> None:
+                if message["type"] == "http.response.start" and current is not None:
+                    current.status = message["status"]
+                await send(message)
+
+            await self.app(scope, receive, traced_send)
+
+
+class LoopMonitor:
+    """
+    Event-loop lag heartbeat plus a watchdog that catches blocking calls.
+
+    Args:
+        threshold_ms: Lag that counts as the loop being blocked
+        interval: Seconds between heartbeats
+        keep: Blocked-loop events to remember
+    """
+
+    def __init__(self, threshold_ms: float, interval: float = 0.1, keep: int = 50):
+        self.threshold_ms = threshold_ms
+        self.interval = interval
+        self.events: deque = deque(maxlen=keep)
+        self._beat = time.monotonic()
+        self._reported = 0.0
+        self._task: Optional[asyncio.Task] = None
+        self._stop = threading.Event()
+        self._loop_thread: Optional[int] = None
+
+    def start(self) -> None:
+        self._loop_thread = threading.get_ident()
+        self._beat = time.monotonic()
+        self._task = asyncio.create_task(self._heartbeat())
+        threading.Thread(target=self._watch, name="loop-watchdog", daemon=True).start()
+
+    async def stop(self) -> None:
+        self._stop.set()
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    async def _heartbeat(self) -> None:
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            lag_ms = max(0.0, (time.perf_counter() - started - self.interval) * 1000)
+            metrics.observe("loop.lag_ms", lag_ms)
+            self._beat = time.monotonic()
+
+    def _watch(self) -> None:
+        limit = self.interval + self.threshold_ms / 1000
+        while not self._stop.wait(self.threshold_ms / 2000):
+            beat = self._beat
+            stalled = time.monotonic() - beat
+            if stalled < limit or beat == self._reported:
+                continue
+            # Once per stall, while the culprit is still on the stack
+            self._reported = beat
+            frame = sys._current_frames().get(self._loop_thread)
+            stack = _folded(frame) if frame is not None else None
+            if stack is None:
+                # Back in the selector: the stall ended before we looked
+                continue
+            metrics.incr("loop.blocked")
+            labels = stack.split(";")
+            event = {
+                "at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+                "blocked_ms": round((stalled - self.interval) * 1000, 1),
+                "where": _app_frame(labels),
+                "stack": labels,
+            }
+            self.events.append(event)
+            print(f"Event loop blocked for over {event['blocked_ms']} ms in {event['where']} ({labels[-1]})")
+
+    def snapshot(self) -> list[dict]:
+        return list(reversed(self.events))
+
+
+def create_loop_monitor() -> Optional[LoopMonitor]:
+    """Monitor from ``LOOP_LAG_THRESHOLD_MS``; None when it is unset."""
+    threshold = float(os.getenv("LOOP_LAG_THRESHOLD_MS", "0"))
+    return LoopMonitor(threshold) if threshold > 0 else None
+
+
+CPROFILE = "cprofile"
+STACKS = "stacks"
+
+
+class ProfileSession:
+    """
+    One time-boxed profile at a time.
+
+    ``cprofile`` instruments every call on the loop thread (high overhead,
+    exact counts); ``stacks`` samples the loop thread's stack every
+    ``PROFILE_SAMPLE_MS`` (low overhead, async-friendly).
+    """
+
+    def __init__(self):
+        self.mode: Optional[str] = None
+        self.started_at: Optional[float] = None
+        self.seconds = 0.0
+        self.result: Optional[bytes] = None
+        self.result_mode: Optional[str] = None
+        self._profiler: Optional[cProfile.Profile] = None
+        self._last_profiler: Optional[cProfile.Profile] = None
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    @property
+    def running(self) -> bool:
+        return self.mode is not None
+
+    def start(self, mode: str, seconds: float) -> None:
+        if self.running:
+            raise RuntimeError("A profile is already running")
+        if mode == CPROFILE:
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+        elif mode == STACKS:
+            _sampler.start_profile()
+        else:
+            raise ValueError(f"Unknown profile mode: {mode}")
+        self.mode = mode
+        self.seconds = seconds
+        self.started_at = time.time()
+        self._timer = asyncio.get_running_loop().call_later(seconds, self.stop)
+        print(f"Profiling ({mode}) for {seconds:g} s")
+
+    def stop(self) -> bool:
+        """Finish the running profile; False if none was running."""
+        if not self.running:
+            return False
+        if self._timer:
+            self._timer.cancel()
+        if self.mode == CPROFILE:
+            self._profiler.disable()
+            self._profiler.create_stats()
+            # Same bytes as Profile.dump_stats, loadable with pstats.Stats(path)
+            self.result = marshal.dumps(self._profiler.stats)
+            self._last_profiler, self._profiler = self._profiler, None
+        else:
+            folded = _sampler.stop_profile()
+            self.result = "".join(f"{stack} {count}\n" for stack, count in folded.most_common()).encode("utf-8")
+        self.result_mode, self.mode, self._timer = self.mode, None, None
+        print(f"Profile ({self.result_mode}) finished: {len(self.result)} bytes")
+        return True
+
+    def summary(self, limit: int = 30) -> str:
+        """Readable top of the last result."""
+        if self.result is None:
+            return ""
+        if self.result_mode == STACKS:
+            return "\n".join(self.result.decode("utf-8").splitlines()[:limit])
+        out = io.StringIO()
+        pstats.Stats(self._last_profiler, stream=out).sort_stats("cumulative").print_stats(limit)
+        return out.getvalue()
+
+    def status(self) -> dict:
+        return {
+            "running": self.running,
+            "mode": self.mode,
+            "seconds": self.seconds if self.running else None,
+            "remaining": (
+                round(max(0.0, self.started_at + self.seconds - time.time()), 1) if self.running else None
+            ),
+            "result": {"mode": self.result_mode, "bytes": len(self.result)} if self.result is not None else None,
+        }
@@ -0,0 +1,43 @@
+"""
+Prompt assembly for Azure OpenAI chat completions.
+
+Azure OpenAI caches the longest previously seen prompt prefix (in 128-token
+steps once a prompt passes 1024 tokens), so messages are laid out from most
+to least stable: the long system prompt and fixed instructions first in a
+byte-identical form, then the retrieval context in a deterministic order,
+then conversation history, and the user's question last.
+"""
+
+from .intents import OUT_OF_SCOPE_REPLY
+
+
+DEFAULT_SYSTEM_PROMPT = (
+    "You are a helpful Bank Islami customer service assistant. "
+    "Provide accurate information about banking products and services. "
+    "Keep replies concise and helpful. Reply in the same language as the user."
+)
+
+RAG_INSTRUCTIONS = (
+    "Use ONLY the context provided. If the answer is not in the context, "
+    f"reply with: {OUT_OF_SCOPE_REPLY}"
+)
+
+
+def _canonical(text: str) -> str:
+    """Normalize line endings and trailing whitespace so the prefix is byte-stable."""
+    lines = str(text or "").replace("\r\n", "\n").replace("\r", "\n").split("\n")
+    return "\n".join(line.rstrip() for line in lines).strip()
+
+
+def build_system_prompt(base_prompt: str | None) -> str:
+    """Static RAG system prompt; build once and reuse for every request."""
+    return f"{_canonical(base_prompt or DEFAULT_SYSTEM_PROMPT)}\n\n{RAG_INSTRUCTIONS}"
+
+
+def build_user_prompt(question: str, context: str, history: str = "") -> str:
+    """Variable part of the prompt: context, then history, question last."""
+    parts = [f"Context:\n{context.strip()}"]
+    if history:
+        parts.append(f"Conversation so far:\n{history.strip()}")
+    parts.append(f"Question: {question.strip()}")
+    return "\n\n".join(parts)
@@ -0,0 +1,147 @@
+"""
+Opt-in traffic recorder for load and regression testing.
+
+With ``TRAFFIC_RECORD_PATH`` set, every inbound webhook payload and every
+upstream HTTP exchange (status, latency, size) is appended with a timestamp
+to a compact JSONL log, gzip-compressed when the path ends in ``.gz``. A
+``{pid}`` placeholder in the path gives each worker process its own file.
+
+Payloads are sanitized before they are written: phone numbers, WhatsApp ids
+and profile names become keyed hashes (HMAC-SHA256) and long digit runs and
+e-mail addresses in message text are masked, so the traffic mix and
+conversation shape survive but customer data does not. The key is
+``TRAFFIC_RECORD_SALT`` when set (keep it secret; it makes ids match across
+logs and restarts), otherwise a random key per log that is never written
+anywhere, so a hashed phone number cannot be brute-forced from the log.
+``replay_traffic.py`` re-drives a recorded log against local stand-ins.
+"""
+
+import gzip
+import hashlib
+import hmac
+import os
+import re
+import secrets
+import threading
+import time
+from typing import Any, Optional
+
+import httpx
+
+from .serialization import dumps_str
+
+
+_IDENTITY_KEYS = {"from", "wa_id", "recipient_id", "display_phone_number", "phone_number_id", "name"}
+_DIGITS = re.compile(r"\d{5,}")
+_EMAIL = re.compile(r"[\w.+-]+@[\w-]+\.[\w.-]+")
+_FLUSH_EVERY = 32
+
+
+def _mask_text(text: str) -> str:
+    text = _EMAIL.sub("user@example.com", text)
+    return _DIGITS.sub(lambda m: "0" * len(m.group()), text)
+
+
+def sanitize(value: Any, salt: str, key: str = "") -> Any:
+    """Copy of a webhook payload with identities hashed (keyed by ``salt``) and message text masked."""
+    if not salt:
+        raise ValueError("sanitize needs a non-empty salt")
+    if isinstance(value, dict):
+        return {k: sanitize(v, salt, k) for k, v in value.items()}
+    if isinstance(value, list):
+        return [sanitize(item, salt, key) for item in value]
+    if not isinstance(value, str):
+        return value
+    if key in _IDENTITY_KEYS:
+        return "u" + hmac.new(salt.encode("utf-8"), value.encode("utf-8"), hashlib.sha256).hexdigest()[:16]
+    if key in {"body", "title", "caption", "text"}:
+        return _mask_text(value)
+    return value
+
+
+class TrafficRecorder:
+    """
+    Append-only JSONL event log.
+
+    Args:
+        path: Log file; ``.gz`` enables compression, ``{pid}`` is replaced
+            by the worker's process id
+        salt: Secret key for identity hashes; a random one (stable for this
+            log only) when empty
+    """
+
+    def __init__(self, path: str, salt: str = ""):
+        self.path = path.replace("{pid}", str(os.getpid()))
+        self.salt = salt or secrets.token_hex(32)
+        self.events = 0
+        self._lock = threading.Lock()
+        self._pending = 0
+        if self.path.endswith(".gz"):
+            self._file = gzip.open(self.path, "at", encoding="utf-8")
+        else:
+            self._file = open(self.path, "a", encoding="utf-8")
+
+    def record(self, kind: str, **fields: Any) -> None:
+        line = dumps_str({"t": round(time.time(), 4), "k": kind, **fields})
+        with self._lock:
+            self._file.write(line + "\n")
+            self.events += 1
+            self._pending += 1
+            if self._pending >= _FLUSH_EVERY:
+                self._file.flush()
+                self._pending = 0
+
+    def webhook(self, payload: dict) -> None:
+        self.record("webhook", p=sanitize(payload, self.salt))
+
+    async def on_request(self, request: httpx.Request) -> None:
+        request.extensions["recorder_start"] = time.perf_counter()
+
+    def response_hook(self, upstream: str):
+        """httpx response event hook tagging exchanges with ``upstream``."""
+
+        async def on_response(response: httpx.Response) -> None:
+            started = response.request.extensions.get("recorder_start")
+            self.record(
+                "upstream",
+                u=upstream,
+                m=response.request.method,
+                path=_mask_text(response.request.url.path),
+                s=response.status_code,
+                ms=round((time.perf_counter() - started) * 1000, 2) if started else None,
+                b=int(response.headers.get("content-length") or 0),
+            )
+
+        return on_response
+
+    def close(self) -> None:
+        with self._lock:
+            if not self._file.closed:
+                self._file.close()
+
+
+_recorder: Optional[TrafficRecorder] = None
+_configured = False
+
+
+def get_recorder() -> Optional[TrafficRecorder]:
+    """The process-wide recorder, or None unless ``TRAFFIC_RECORD_PATH`` is set."""
+    global _recorder, _configured
+    if not _configured:
+        _configured = True
+        path = os.getenv("TRAFFIC_RECORD_PATH", "").strip()
+        if path:
+            salt = os.getenv("TRAFFIC_RECORD_SALT", "")
+            _recorder = TrafficRecorder(path, salt)
+            print(f"Recording traffic to {_recorder.path}")
+            if not salt:
+                print("TRAFFIC_RECORD_SALT not set: identity hashes use a random key and only match within this log")
+    return _recorder
+
+
+def close_recorder() -> None:
+    global _recorder, _configured
+    if _recorder is not None:
+        _recorder.close()
+    _recorder = None
+    _configured = False
@@ -8,29 +8,66 @@ Features:
 """
 
 import asyncio
+import hmac
 import json
 import os
+import time
+import uuid
+from contextlib import asynccontextmanager
 
-from fastapi import FastAPI, File, HTTPException, Query, Request, UploadFile
-from fastapi.responses import JSONResponse, Response
+from fastapi import FastAPI, File, HTTPException, Query, Request, UploadFile, WebSocket
+from fastapi.responses import Response, StreamingResponse
 # from azure.communication.messages import NotificationMessagesClient
 
 from .azure import (
     audio_content_type,
+    base_url,
     generate_text,
+    probe_target as openai_probe_target,
+    stream_speech,
     synthesize_speech,
     transcribe_audio,
 )
-from .ai_search import build_rag_context, search_tool
+from . import health, metrics, profiling, usage
+from .batch import AnswerCache, create_answer_cache, run_batch
+from .audio import (
+    AudioTooLong,
+    NoSpeechDetected,
+    encode_voice_note,
+    ffmpeg_path,
+    prepare_for_stt,
+    shutdown_pool,
+    warm_pool,
+)
+from .clients import aclose_clients, warm_connections
+from .recorder import close_recorder, get_recorder
+from .ai_search import probe_target as search_probe_target, retrieve_context, search_tool
+from .context import count_tokens
+from .faq_store import answer_fingerprint, create_faq_store
+from .formatting import format_response
+from .forwarding import client_header, client_ip
+from .intents import OUT_OF_SCOPE_REPLY, create_intent_router
+from .prompts import DEFAULT_SYSTEM_PROMPT, build_system_prompt, build_user_prompt
+from .scheduler import BATCH, PUSH, TEXT, VOICE, SchedulerBusy, create_scheduler
+from .serialization import FastJSONResponse, dumps, request_json
+from .sessions import create_session_store
+from .state import namespace
+from .tasks import TaskRegistry
+from .tiers import FAST, LARGE, create_tier_policy
+from .voice import VoiceSession
+from .warmup import create_warmup
 from .whatsapp import (
     debug_access_token,
     download_media,
     get_audio,
+    graph_base,
     parse_message,
+    probe_target as graph_probe_target,
     push_text,
     reply_audio,
     reply_text,
 )
+from .uploads import UploadLimitMiddleware, UploadTooLarge, max_upload_bytes, max_upload_seconds, spool_upload
 from .ui import UI_HTML
 from dotenv import load_dotenv
 
@@ -53,6 +90,53 @@ load_dotenv()
 #     print("ACS SEND RESPONSE:", resp)
 
 
+NO_SPEECH_REPLY = (
+    "Sorry, I could not hear anything in your voice message. "
+    "Please record it again or type your question."
+)
+
+VOICE_UNAVAILABLE_REPLY = (
+    "Sorry, I can't listen to voice messages right now. "
+    "Please type your question instead."
+)
+
+UNAVAILABLE_REPLY = (
+    "Sorry, I can't look that up right now because one of our services is temporarily unavailable. "
+    "Please try again in a few minutes."
+)
+
+BUSY_REPLY = (
+    "You have sent too many messages at once. "
+    "Please wait for my replies before sending more."
+)
+
+
+def _require_admin(request: Request) -> None:
+    """403 unless the request carries ``ADMIN_TOKEN``."""
+    expected = os.getenv("ADMIN_TOKEN", "")
+    given = request.headers.get("x-admin-token") or request.headers.get("authorization", "").removeprefix("Bearer ")
+    if not expected or not hmac.compare_digest(given.encode(), expected.encode()):
+        raise HTTPException(status_code=403, detail="Forbidden")
+
+
+def _client_key(request: Request | WebSocket) -> str:
+    """Scheduler and usage sender key for an HTTP client (see ``api.forwarding``)."""
+    peer = request.client.host if request.client else None
+    address = client_ip(peer, request.headers.get(client_header()))
+    return f"ip:{address}" if address else "anonymous"
+
+
+async def _json_object(request: Request) -> dict:
+    """Parse a JSON object body with the fast decoder; 400 on anything else."""
+    try:
+        payload = await request_json(request)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail="Invalid JSON body") from exc
+    if not isinstance(payload, dict):
+        raise HTTPException(status_code=400, detail="Expected a JSON object")
+    return payload
+
+
 def _load_voice_config() -> dict:
     """Load voice configuration from JSON file."""
     path = os.getenv("VOICE_CONFIG_PATH", "bankislami_voice_config.json")
@@ -60,33 +144,139 @@ def _load_voice_config() -> dict:
         return json.load(f)
 
 
-def create_app() -> FastAPI:
-    app = FastAPI(title="Bank Islami AI Bot - Azure OpenAI + Search")
-    
-    # Load configuration
+def load_system_prompt() -> str:
+    """System prompt from the voice config, or the built-in default."""
     try:
         voice_config = _load_voice_config()
         system_prompt = voice_config.get("system_prompt", {}).get("content")
         if not system_prompt:
-            system_prompt = (
-                "You are a helpful Bank Islami customer service assistant. "
-                "Provide accurate information about banking products and services. "
-                "Keep replies concise and helpful. Reply in the same language as the user."
-            )
+            system_prompt = DEFAULT_SYSTEM_PROMPT
     except Exception as e:
         print(f"Warning: Could not load voice config: {e}")
-        system_prompt = (
-            "You are a helpful Bank Islami customer service assistant. "
-            "Provide accurate information about banking products and services. "
-            "Keep replies concise and helpful. Reply in the same language as the user."
-        )
+        system_prompt = DEFAULT_SYSTEM_PROMPT
+    return system_prompt
+
+
+def format_responses_enabled() -> bool:
+    return os.getenv("FORMAT_RESPONSES", "").strip().lower() in {"1", "true", "yes"}
+
+
+def create_app() -> FastAPI:
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        jobs.resume()
+        if loop_monitor:
+            loop_monitor.start()
+        # /ready turns green once connections, pools and caches are warm
+        warmup.start()
+        prober.start()
+        yield
+        await prober.stop()
+        await warmup.stop()
+        if loop_monitor:
+            await loop_monitor.stop()
+        profile_session.stop()
+        # Stop taking webhook jobs, drain in-flight replies, persist the rest
+        await jobs.shutdown(float(os.getenv("SHUTDOWN_DRAIN_SECONDS", "20")))
+        await aclose_clients()
+        shutdown_pool()
+        close_recorder()
+        usage.get_usage_store().flush()
+
+    app = FastAPI(
+        title="Bank Islami AI Bot - Azure OpenAI + Search",
+        lifespan=lifespan,
+        default_response_class=FastJSONResponse,
+    )
+
+    @app.exception_handler(SchedulerBusy)
+    async def scheduler_busy(request: Request, exc: SchedulerBusy) -> FastJSONResponse:
+        return FastJSONResponse({"error": str(exc)}, status_code=429)
+
+    app.add_middleware(usage.UsageMiddleware)
+
+    # Off unless PROFILE_SLOW_MS / LOOP_LAG_THRESHOLD_MS are set
+    if profiling.slow_threshold_ms() > 0:
+        app.add_middleware(profiling.SlowRequestMiddleware)
+    loop_monitor = profiling.create_loop_monitor()
+    profile_session = profiling.ProfileSession()
 
-    async def process_query(user_text: str) -> str:
+    # Multipart framing and the text field ride on top of the file itself
+    app.add_middleware(
+        UploadLimitMiddleware, paths=("/message", "/audio"), max_bytes=max_upload_bytes() + 64 * 1024
+    )
+    
+    # Built once so the cached prompt prefix is byte-identical across requests
+    rag_system_prompt = build_system_prompt(load_system_prompt())
+
+    format_responses = format_responses_enabled()
+
+    sessions = create_session_store()
+    processed_messages = namespace("wamid")
+    intent_router = create_intent_router()
+    tier_policy = create_tier_policy()
+
+    # Keyed on everything besides the question that shapes a generated answer
+    answer_cache = create_answer_cache(
+        f"{rag_system_prompt}\n{tier_policy.large_deployment}\n{tier_policy.fast_deployment}\n{format_responses}"
+    )
+    scheduler = create_scheduler()
+    faq_store = create_faq_store(
+        answer_fingerprint(rag_system_prompt, tier_policy.large_deployment, format_responses)
+    )
+    faq_fallback_threshold = float(os.getenv("FAQ_STORE_FALLBACK_THRESHOLD", "0.85"))
+
+    # Upstream latency/error probes; results feed the circuit breakers in api.health
+    probe_targets = {
+        health.LLM: openai_probe_target,
+        health.STT: openai_probe_target,
+        health.TTS: openai_probe_target,
+        health.SEARCH: search_probe_target,
+    }
+    if os.getenv("ACCESS_TOKEN"):
+        probe_targets[health.GRAPH] = graph_probe_target
+    prober = health.create_prober(probe_targets)
+
+    async def generate_tiered(user_text: str, user_prompt: str, scores: list[float] | None) -> str:
+        """Answer on the tier chosen for ``user_text``, escalating if the fast tier fails."""
+        tier, reason = tier_policy.choose(user_text, scores)
+        metrics.incr("llm.tier.total")
+        metrics.incr(f"llm.tier.{tier}")
+        metrics.incr(f"llm.tier_reason.{reason}")
+        if tier == FAST:
+            try:
+                with metrics.timer("llm.fast.latency_ms"):
+                    return await generate_text(
+                        user_prompt=user_prompt,
+                        system_prompt=rag_system_prompt,
+                        use_tools=False,
+                        deployment=tier_policy.deployment(FAST),
+                        max_tokens=tier_policy.max_tokens[FAST],
+                    )
+            except Exception as e:
+                print(f"Fast tier failed, escalating: {e}")
+                metrics.incr("llm.tier_escalations")
+        with metrics.timer("llm.large.latency_ms"):
+            return await generate_text(
+                user_prompt=user_prompt,
+                system_prompt=rag_system_prompt,
+                use_tools=False,
+                deployment=tier_policy.deployment(LARGE) or None,
+                max_tokens=tier_policy.max_tokens[LARGE],
+            )
+
+    async def process_query(
+        user_text: str,
+        sender: str | None = None,
+        answer_cache: AnswerCache | None = None,
+    ) -> str:
         """
         Process user query with RAG context from Azure AI Search.
         
         Args:
             user_text: User's message or transcribed text
+            sender: Conversation key (WhatsApp ``from``) for session memory
+            answer_cache: Reuse and store answers for stateless queries
             
         Returns:
             Response text from GPT-4o with RAG context
@@ -94,41 +284,211 @@ def create_app() -> FastAPI:
         if not user_text or not user_text.strip():
             return "Please provide a message or question."
         
-        # Handle greetings
-        normalized = user_text.strip().lower()
-        if normalized in {"hi", "hello", "hey", "salam", "assalamualaikum", "asalamualaikum"}:
-            return "Assalam-o-Alaikum! Welcome to Bank Islami. How can I help you today?"
+        # Greetings, acknowledgements, canned FAQs and off-topic chatter are
+        # answered locally without touching Azure Search or GPT
+        intent = intent_router.route(user_text)
+        if intent:
+            usage.record(intent_answers=1)
+            return intent["answer"]
+        
+        if answer_cache and not sender:
+            cached = await answer_cache.get(user_text)
+            if cached is not None:
+                usage.record(cached_answers=1)
+                return cached
+        
+        session = await sessions.load(sender) if sender else None
+        follow_up = bool(session) and sessions.is_follow_up(user_text, session)
+        
+        # While search or the LLM is down, looser FAQ matches beat no answer
+        degraded = not health.available(health.LLM) or (not follow_up and not health.available(health.SEARCH))
+        if degraded:
+            metrics.incr("health.degraded_queries")
         
-        # Build RAG context from Azure AI Search
-        rag_context = await build_rag_context(user_text)
+        # Frequent questions are served from the precomputed FAQ store
+        if not follow_up:
+            faq = await faq_store.lookup(user_text, faq_fallback_threshold if degraded else None)
+            if faq:
+                usage.record(faq_answers=1)
+                if session is not None:
+                    # No context is kept, so the next message searches afresh
+                    await sessions.record(sender, session, user_text, faq["answer"], faq.get("doc_ids"), "")
+                return faq["answer"]
+        if degraded:
+            return UNAVAILABLE_REPLY
+        
+        # Follow-ups reuse the previous retrieval; everything else searches
+        if follow_up:
+            metrics.incr("session.retrieval_reused")
+            retrieval = {"text": session["context"], "doc_ids": session["doc_ids"], "scores": None}
+        else:
+            retrieval = await retrieve_context(user_text)
+        rag_context = retrieval["text"]
         if not rag_context:
-            return "Please ask questions related to Bank Islami. Bank Islami se mutalaq sawal pouchain"
+            return OUT_OF_SCOPE_REPLY
         
         # Generate response using GPT-4o with RAG context
         try:
-            rag_system_prompt = (
-                f"{system_prompt}\n\n"
-                "Use ONLY the context provided. If the answer is not in the context, "
-                "reply with: Please ask questions related to Bank Islami. Bank Islami se mutalaq sawal pouchain"
-            )
-            response = await generate_text(
-                user_prompt=(
-                    f"Question: {user_text}\n\n"
-                    f"Context:\n{rag_context}"
-                ),
-                system_prompt=rag_system_prompt,
-                use_tools=False
+            history = sessions.history_text(session) if session else ""
+            response = await generate_tiered(
+                user_text, build_user_prompt(user_text, rag_context, history), retrieval.get("scores")
             )
             
+            # Only real model answers are cached; fallbacks must not outlive this request
+            generated = bool(response)
             if response is None:
                 # Function was called, use fallback
                 response = "I need to search our knowledge base for the most current information."
+            elif format_responses:
+                response = format_response(response)
             
+            if session is not None and response:
+                await sessions.record(
+                    sender, session, user_text, response, retrieval["doc_ids"], rag_context
+                )
+            elif answer_cache and not sender and generated and response:
+                await answer_cache.put(user_text, response)
             return response or "Sorry, I could not generate a response."
         except Exception as e:
             print(f"Error generating response: {e}")
             return "I apologize, there was an issue processing your request. Please try again."
 
+    # Canned intent replies, synthesized once during warm-up
+    canned_audio: dict[str, bytes] = {}
+
+    async def speak(text: str) -> bytes:
+        """Reply audio, pre-synthesized for FAQ store answers and canned replies."""
+        stored = faq_store.audio_for(text)
+        if stored:
+            usage.record(faq_audio_replies=1)
+            return stored
+        stored = canned_audio.get(text)
+        if stored:
+            usage.record(canned_audio_replies=1)
+            return stored
+        return await synthesize_speech(text)
+
+    # ==================== WARM-UP ====================
+
+    async def warm_canned_audio() -> int:
+        semaphore = asyncio.Semaphore(4)
+
+        async def synthesize(text: str) -> None:
+            async with semaphore:
+                canned_audio[text] = await synthesize_speech(text)
+
+        texts = dict.fromkeys([*intent_router.canned_answers(), OUT_OF_SCOPE_REPLY])
+        await asyncio.gather(*(synthesize(text) for text in texts))
+        return len(canned_audio)
+
+    async def warm_query() -> dict:
+        """One real retrieval plus a 1-token completion per chat tier (also primes the prompt cache)."""
+        question = os.getenv("WARMUP_QUERY", "What accounts does BankIslami offer?")
+        retrieval = await retrieve_context(question)
+        tiers = (LARGE, FAST) if tier_policy.enabled else (LARGE,)
+        await asyncio.gather(*(
+            generate_text(
+                user_prompt=build_user_prompt(question, retrieval["text"]),
+                system_prompt=rag_system_prompt,
+                use_tools=False,
+                deployment=tier_policy.deployment(tier) or None,
+                max_tokens=1,
+            )
+            for tier in tiers
+        ))
+        return {"documents": len(retrieval["doc_ids"]), "tiers": list(tiers)}
+
+    async def warm_faq_store() -> dict:
+        if faq_store.active:
+            await faq_store.check_freshness()
+        return {"active": faq_store.active, "stale": faq_store.stale}
+
+    warmup_steps = {
+        "azure_connections": lambda: warm_connections(
+            "azure", base_url(), int(os.getenv("WARMUP_CONNECTIONS", "4"))
+        ),
+        "tokenizer": lambda: asyncio.to_thread(count_tokens, "warm-up"),
+        "faq_store": warm_faq_store,
+        "query": warm_query,
+    }
+    if os.getenv("ACCESS_TOKEN"):
+        warmup_steps["graph_connections"] = lambda: warm_connections("graph", graph_base(), 2)
+    if ffmpeg_path():
+        warmup_steps["audio_workers"] = warm_pool
+    if os.getenv("WARMUP_CANNED_AUDIO", "1").strip().lower() not in {"0", "false", "no"}:
+        warmup_steps["canned_audio"] = warm_canned_audio
+    warmup = create_warmup(warmup_steps)
+
+    # Last BUSY_REPLY per sender, so a flood of shed messages gets one notice
+    busy_notified: dict[str, float] = {}
+    busy_reply_seconds = float(os.getenv("SCHED_BUSY_REPLY_SECONDS", "60"))
+
+    async def notify_busy(sender: str, recipient: str) -> None:
+        now = time.monotonic()
+        for key, at in list(busy_notified.items()):
+            if now - at >= busy_reply_seconds:
+                del busy_notified[key]
+        if sender in busy_notified:
+            return
+        busy_notified[sender] = now
+        await reply_text(recipient, BUSY_REPLY)
+
+    async def handle_message(msg: dict) -> None:
+        """Reply to one parsed WhatsApp message (runs as a background job)."""
+        endpoint = f"webhook {msg.get('type')}"
+        with metrics.timer("webhook.job_ms"), profiling.trace(endpoint), usage.scope(endpoint, msg.get("from")):
+            try:
+                recipient = os.getenv("RECIPIENT_WAID") or msg["from"]
+                kind = VOICE if msg["type"] == "audio" else TEXT
+                # Queued fairly behind this sender's earlier messages, not everyone's
+                async with scheduler.slot(kind, msg["from"]):
+                    if msg["type"] == "text":
+                        # Handle text message - respond with text only
+                        answer = await process_query(msg["text"], msg["from"])
+                        await reply_text(recipient, answer)
+                        return
+
+                    if msg["type"] == "audio":
+                        if not health.available(health.STT):
+                            await reply_text(recipient, VOICE_UNAVAILABLE_REPLY)
+                            return
+                        # Handle voice message - respond with voice only
+                        audio_bytes = await download_media(msg["media_id"])
+                        try:
+                            audio_bytes, filename, media_type = await prepare_for_stt(
+                                audio_bytes, "audio", msg.get("media_type") or None
+                            )
+                        except NoSpeechDetected:
+                            # Silent or noise-only note: skip STT and the LLM entirely
+                            await reply_text(recipient, NO_SPEECH_REPLY)
+                            return
+                        transcript = await transcribe_audio(audio_bytes, filename, media_type)
+                        print(f"Voice message transcribed: {transcript}")
+                
+                        answer = await process_query(transcript, msg["from"])
+                        if not health.available(health.TTS):
+                            # A text answer beats none while TTS is down
+                            await reply_text(recipient, answer)
+                            return
+                
+                        # Send audio reply only
+                        audio_out = await speak(answer)
+                        audio_out, out_type = await encode_voice_note(audio_out, audio_content_type())
+                        await reply_audio(recipient, audio_out, out_type)
+                        return
+            except SchedulerBusy as exc:
+                # Already de-duplicated, so it will not be redelivered: say why it is dropped
+                metrics.incr("webhook.shed")
+                print(f"Webhook message dropped: {exc}")
+                try:
+                    await notify_busy(msg["from"], recipient)
+                except Exception as reply_exc:
+                    print(f"Webhook handler error: {reply_exc}")
+            except Exception as exc:
+                print(f"Webhook handler error: {exc}")
+
+    jobs = TaskRegistry(handle_message, os.getenv("PENDING_JOBS_PATH", "pending_jobs.jsonl"))
+
     # ==================== ENDPOINTS ====================
     
     @app.get("/")
@@ -137,17 +497,49 @@ def create_app() -> FastAPI:
         return Response(content=UI_HTML, media_type="text/html")
 
     @app.get("/health")
-    def health() -> JSONResponse:
-        """Health check endpoint."""
-        return JSONResponse({"ok": True, "version": "2.0", "rag": "Azure AI Search"})
+    def health_check(deep: bool = False) -> FastJSONResponse:
+        """
+        Liveness; ``?deep=1`` adds the cached upstream probe and breaker state.
+
+        Never calls an upstream, so it can be polled as often as needed.
+        """
+        report = {"ok": True, "version": "2.0", "rag": "Azure AI Search"}
+        if deep:
+            report.update(prober.report())
+        return FastJSONResponse(report)
+
+    @app.get("/ready")
+    def ready() -> FastJSONResponse:
+        """Readiness: 503 until warm-up has finished and again while draining for shutdown."""
+        report = warmup.report()
+        report["ready"] = warmup.ready and jobs.accepting
+        return FastJSONResponse(report, status_code=200 if report["ready"] else 503)
+
+    @app.get("/metrics")
+    def metrics_report() -> FastJSONResponse:
+        """In-process counters and latency/token histograms for this worker."""
+        report = metrics.snapshot()
+        report["intent_local_fraction"] = metrics.registry.ratio("intent.local", "intent.total")
+        report["vad_skipped_audio_fraction"] = metrics.registry.ratio(
+            "vad.skipped_seconds_total", "vad.audio_seconds_total"
+        )
+        report["llm_cached_token_fraction"] = metrics.registry.ratio(
+            "llm.cached_tokens_total", "llm.prompt_tokens_total"
+        )
+        report["faq_store_hit_fraction"] = metrics.registry.ratio("faq_store.hits", "faq_store.lookups")
+        report["faq_store"] = faq_store.stats()
+        report["llm_fast_tier_fraction"] = metrics.registry.ratio("llm.tier.fast", "llm.tier.total")
+        report["scheduler"] = scheduler.stats()
+        return FastJSONResponse(report)
 
     # ==================== UNIFIED MESSAGE ENDPOINT ====================
     
     @app.post("/message")
     async def unified_message(
+        request: Request,
         text: str | None = Query(default=None),
         file: UploadFile | None = File(default=None)
-    ) -> JSONResponse:
+    ) -> FastJSONResponse:
         """
         Unified endpoint for both text and voice message interaction.
         
@@ -158,6 +550,10 @@ def create_app() -> FastAPI:
         Returns:
             JSON response with text and/or audio reply
         """
+        async with scheduler.slot(VOICE if file else TEXT, _client_key(request)):
+            return await _unified_message(text, file)
+
+    async def _unified_message(text: str | None, file: UploadFile | None) -> FastJSONResponse:
         message_text = None
         
         # Handle text input
@@ -166,25 +562,32 @@ def create_app() -> FastAPI:
         
         # Handle audio input
         if file:
+            upload = None
             try:
-                audio_bytes = await file.read()
-                if audio_bytes:
-                    message_text = await transcribe_audio(
-                        audio_bytes, 
-                        file.filename or "audio", 
-                        file.content_type
+                upload = await spool_upload(file)
+                if upload.size:
+                    audio, filename, media_type = await prepare_for_stt(
+                        upload, file.filename or "audio", file.content_type, max_upload_seconds()
                     )
+                    message_text = await transcribe_audio(audio, filename, media_type)
                     print(f"Transcribed audio: {message_text}")
+            except (UploadTooLarge, AudioTooLong) as e:
+                return FastJSONResponse({"error": str(e)}, status_code=413)
+            except health.UpstreamUnavailable as e:
+                return FastJSONResponse({"error": e.detail}, status_code=503)
             except Exception as e:
                 print(f"Audio transcription error: {e}")
-                return JSONResponse(
+                return FastJSONResponse(
                     {"error": "Failed to process audio", "details": str(e)},
                     status_code=400
                 )
+            finally:
+                if upload:
+                    upload.close()
         
         # Validate we have some input
         if not message_text:
-            return JSONResponse(
+            return FastJSONResponse(
                 {"error": "Please provide either text or audio"},
                 status_code=400
             )
@@ -194,23 +597,23 @@ def create_app() -> FastAPI:
             response_text = await process_query(message_text)
         except Exception as e:
             print(f"Query processing error: {e}")
-            return JSONResponse(
+            return FastJSONResponse(
                 {"error": "Failed to process query", "details": str(e)},
                 status_code=500
             )
         
         # Generate audio response
         try:
-            audio_response = await synthesize_speech(response_text)
+            audio_response = await speak(response_text)
         except Exception as e:
             print(f"TTS error: {e}")
             # Return text-only if TTS fails
-            return JSONResponse({
+            return FastJSONResponse({
                 "text": response_text,
                 "warning": "Audio generation failed"
             })
         
-        return JSONResponse({
+        return FastJSONResponse({
             "text": response_text,
             "audio": {
                 "format": audio_content_type(),
@@ -221,26 +624,112 @@ def create_app() -> FastAPI:
     # ==================== LEGACY ENDPOINTS ====================
     
     @app.post("/text")
-    async def text_reply(payload: dict) -> JSONResponse:
+    async def text_reply(request: Request) -> FastJSONResponse:
         """Legacy text-only endpoint."""
+        payload = await _json_object(request)
         user_text = str(payload.get("text") or "").strip()
         if not user_text:
             raise HTTPException(status_code=400, detail="Missing text")
-        answer = await process_query(user_text)
-        return JSONResponse({"text": answer})
+        async with scheduler.slot(TEXT, _client_key(request)):
+            answer = await process_query(user_text)
+        return FastJSONResponse({"text": answer})
+
+    @app.post("/text/batch")
+    async def text_batch(request: Request) -> StreamingResponse:
+        """
+        Answer many questions in one request, streamed as NDJSON.
+        
+        Body: ``{"questions": [...], "concurrency": 8, "refresh": false}``.
+        Each line is one answered question as it completes; the last line is
+        ``{"summary": ...}`` with latency and throughput. Answers are cached
+        in shared state unless ``refresh`` is set.
+        """
+        payload = await _json_object(request)
+        questions = payload.get("questions")
+        if not isinstance(questions, list) or not questions:
+            raise HTTPException(status_code=400, detail="Missing questions")
+        limit = int(os.getenv("BATCH_MAX_QUESTIONS", "5000"))
+        if len(questions) > limit:
+            raise HTTPException(status_code=413, detail=f"At most {limit} questions per batch")
+        concurrency = payload.get("concurrency")
+        if concurrency is not None:
+            if isinstance(concurrency, bool) or not isinstance(concurrency, (int, str)):
+                raise HTTPException(status_code=400, detail="concurrency must be an integer")
+            try:
+                concurrency = int(concurrency)
+            except ValueError as exc:
+                raise HTTPException(status_code=400, detail="concurrency must be an integer") from exc
+            concurrency = max(1, min(concurrency, int(os.getenv("BATCH_MAX_CONCURRENCY", "32"))))
+        cache = None if payload.get("refresh") else AnswerCache(
+            answer_cache.store, answer_cache.fingerprint, answer_cache.ttl
+        )
+
+        # One sender per batch caller: batches queue behind each other, not behind users
+        batch_sender = _client_key(request)
+
+        async def answer(question: str) -> str:
+            async with scheduler.slot(BATCH, batch_sender):
+                return await process_query(question, answer_cache=cache)
+
+        async def lines():
+            async for result in run_batch(questions, answer, concurrency):
+                if "summary" in result and cache:
+                    result["summary"]["answer_cache"] = cache.stats()
+                yield dumps(result) + b"\n"
+
+        return StreamingResponse(lines(), media_type="application/x-ndjson")
 
     @app.post("/audio")
-    async def audio_reply(file: UploadFile = File(...)) -> Response:
+    async def audio_reply(request: Request, file: UploadFile = File(...)) -> Response:
         """Legacy audio endpoint."""
-        audio_bytes = await file.read()
-        if not audio_bytes:
-            raise HTTPException(status_code=400, detail="Missing audio file")
+        async with scheduler.slot(VOICE, _client_key(request)):
+            return await _audio_reply(file)
 
-        transcript = await transcribe_audio(audio_bytes, file.filename or "", file.content_type)
+    async def _audio_reply(file: UploadFile) -> Response:
+        try:
+            upload = await spool_upload(file)
+        except UploadTooLarge as exc:
+            raise HTTPException(status_code=413, detail=str(exc)) from exc
+        try:
+            if not upload.size:
+                raise HTTPException(status_code=400, detail="Missing audio file")
+            try:
+                audio, filename, media_type = await prepare_for_stt(
+                    upload, file.filename or "", file.content_type, max_upload_seconds()
+                )
+            except NoSpeechDetected as exc:
+                raise HTTPException(status_code=400, detail=str(exc)) from exc
+            except AudioTooLong as exc:
+                raise HTTPException(status_code=413, detail=str(exc)) from exc
+            transcript = await transcribe_audio(audio, filename, media_type)
+        finally:
+            upload.close()
         answer = await process_query(transcript)
-        audio_out = await synthesize_speech(answer)
+        audio_out = await speak(answer)
         return Response(content=audio_out, media_type=audio_content_type())
 
+    @app.websocket("/voice")
+    async def voice(websocket: WebSocket) -> None:
+        """
+        Full-duplex voice chat: stream 16 kHz PCM in, receive transcripts and
+        streamed TTS audio back; talking over a reply interrupts it.
+        """
+        await websocket.accept()
+        sender = f"voice:{uuid.uuid4().hex}"
+
+        async def transcribe(wav: bytes) -> str:
+            return await transcribe_audio(wav, "segment.wav", "audio/wav")
+
+        async def answer(text: str) -> str:
+            with profiling.trace("WS /voice turn"):
+                async with scheduler.slot(VOICE, _client_key(websocket)):
+                    return await process_query(text, sender)
+
+        session = VoiceSession(websocket, transcribe, answer, stream_speech, audio_content_type())
+        # One usage record per connection
+        with usage.scope("WS /voice", _client_key(websocket)):
+            await session.run()
+
     @app.get("/tts")
     async def tts(text: str = Query(min_length=1)) -> Response:
         """Text-to-speech endpoint."""
@@ -248,13 +737,92 @@ def create_app() -> FastAPI:
         return Response(content=audio_out, media_type=audio_content_type())
 
     @app.get("/media/{media_id}")
-    def media(media_id: str) -> Response:
+    async def media(media_id: str) -> Response:
         """Retrieve cached audio media."""
-        item = get_audio(media_id)
+        item = await get_audio(media_id)
         if not item:
             raise HTTPException(status_code=404, detail="Not found")
         return Response(content=item["buffer"], media_type=item["content_type"])
 
+    # ==================== ADMIN ====================
+    
+    if os.getenv("ADMIN_TOKEN"):
+
+        @app.get("/admin/slow")
+        def admin_slow(request: Request) -> FastJSONResponse:
+            """Recent requests over PROFILE_SLOW_MS and event-loop stalls."""
+            _require_admin(request)
+            return FastJSONResponse({
+                "slow_threshold_ms": profiling.slow_threshold_ms(),
+                "requests": profiling.slow_requests.snapshot(),
+                "loop_blocked": loop_monitor.snapshot() if loop_monitor else None,
+            })
+
+        @app.get("/admin/usage")
+        def admin_usage(
+            request: Request,
+            by: str = Query(default=usage.ENDPOINT, pattern="^(sender|endpoint|deployment)$"),
+            hours: float = Query(default=24, gt=0),
+            since: float | None = None,
+            until: float | None = None,
+            top: int = Query(default=50, ge=1, le=1000),
+            key: str | None = None,
+            timeline: bool = False,
+        ) -> FastJSONResponse:
+            """
+            Tokens, audio seconds, search calls and cost aggregated by
+            ``by``; ``since``/``until`` are Unix times (default: the last
+            ``hours``).
+            """
+            _require_admin(request)
+            if since is None:
+                since = (until or time.time()) - hours * 3600
+            return FastJSONResponse(
+                usage.get_usage_store().query(by, since, until, top, key, timeline)
+            )
+
+        @app.get("/admin/profile")
+        def admin_profile_status(request: Request) -> FastJSONResponse:
+            _require_admin(request)
+            return FastJSONResponse(profile_session.status())
+
+        @app.post("/admin/profile/start")
+        async def admin_profile_start(
+            request: Request,
+            mode: str = Query(default=profiling.STACKS, pattern="^(cprofile|stacks)$"),
+            seconds: float = Query(default=30, gt=0),
+        ) -> FastJSONResponse:
+            """Profile the event loop for ``seconds`` (capped by PROFILE_MAX_SECONDS)."""
+            _require_admin(request)
+            seconds = min(seconds, float(os.getenv("PROFILE_MAX_SECONDS", "120")))
+            try:
+                profile_session.start(mode, seconds)
+            except RuntimeError as exc:
+                raise HTTPException(status_code=409, detail=str(exc)) from exc
+            return FastJSONResponse(profile_session.status())
+
+        @app.post("/admin/profile/stop")
+        async def admin_profile_stop(request: Request) -> FastJSONResponse:
+            _require_admin(request)
+            profile_session.stop()
+            return FastJSONResponse(profile_session.status())
+
+        @app.get("/admin/profile/result")
+        def admin_profile_result(request: Request, summary: bool = False) -> Response:
+            """Last profile: ``.prof`` (cprofile) or folded stacks; ``summary`` for a readable top."""
+            _require_admin(request)
+            if profile_session.result is None:
+                raise HTTPException(status_code=404, detail="No finished profile")
+            if summary:
+                return Response(content=profile_session.summary(), media_type="text/plain")
+            is_stacks = profile_session.result_mode == profiling.STACKS
+            filename = "profile.folded" if is_stacks else "profile.prof"
+            return Response(
+                content=profile_session.result,
+                media_type="text/plain" if is_stacks else "application/octet-stream",
+                headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+            )
+
     # ==================== WHATSAPP WEBHOOK ====================
     
     @app.get("/webhook")
@@ -270,59 +838,41 @@ def create_app() -> FastAPI:
         return Response(status_code=403, content="Forbidden", media_type="text/plain")
 
     @app.post("/webhook")
-    async def webhook_events(request: Request) -> JSONResponse:
+    async def webhook_events(request: Request) -> FastJSONResponse:
         """
         WhatsApp webhook for receiving messages (text and voice).
         Handles both text messages and voice messages (audio).
         """
         try:
-            payload = await request.json()
+            payload = await request_json(request)
         except Exception:
-            return JSONResponse({"ok": True})
+            return FastJSONResponse({"ok": True})
 
         print("Webhook payload received")
+        recorder = get_recorder()
+        if recorder:
+            recorder.webhook(payload)
 
         msg = parse_message(payload)
         if not msg:
-            return JSONResponse({"ok": True})
+            return FastJSONResponse({"ok": True})
 
-        async def handle_message() -> None:
-            """Handle incoming message asynchronously."""
-            try:
-                recipient = os.getenv("RECIPIENT_WAID") or msg["from"]
-                
-                if msg["type"] == "text":
-                    # Handle text message - respond with text only
-                    answer = await process_query(msg["text"])
-                    await reply_text(recipient, answer)
-                    return
-
-                if msg["type"] == "audio":
-                    # Handle voice message - respond with voice only
-                    audio_bytes = await download_media(msg["media_id"])
-                    transcript = await transcribe_audio(
-                        audio_bytes, 
-                        "audio", 
-                        msg.get("media_type") or None
-                    )
-                    print(f"Voice message transcribed: {transcript}")
-                    
-                    answer = await process_query(transcript)
-                    
-                    # Send audio reply only
-                    audio_out = await synthesize_speech(answer)
-                    await reply_audio(recipient, audio_out, audio_content_type())
-                    return
-            except Exception as exc:
-                print(f"Webhook handler error: {exc}")
+        # While draining for shutdown, let Meta redeliver to another instance
+        if not jobs.accepting:
+            return FastJSONResponse({"ok": False}, status_code=503)
+
+        # Meta retries deliveries; process each message id once across workers
+        if msg.get("id") and not await processed_messages.add(msg["id"], b"1", 24 * 60 * 60):
+            metrics.incr("webhook.duplicates")
+            return FastJSONResponse({"ok": True})
 
-        asyncio.create_task(handle_message())
-        return JSONResponse({"ok": True})
+        jobs.submit(msg)
+        return FastJSONResponse({"ok": True})
 
     # ==================== WHATSAPP UTILITIES ====================
     
     @app.get("/whatsapp/diagnose")
-    async def whatsapp_diagnose(check_token: bool = False) -> JSONResponse:
+    async def whatsapp_diagnose(check_token: bool = False) -> FastJSONResponse:
         """Diagnose WhatsApp configuration."""
         report = {
             "has_access_token": bool(os.getenv("ACCESS_TOKEN")),
@@ -333,23 +883,27 @@ def create_app() -> FastAPI:
             "has_app_secret": bool(os.getenv("APP_SECRET")),
             "has_recipient_waid": bool(os.getenv("RECIPIENT_WAID")),
             "version": os.getenv("VERSION") or os.getenv("META_API_VERSION") or "v20.0",
+            # Cached by the background prober; costs no Graph call
+            "graph_health": health.breaker(health.GRAPH).stats(),
         }
         if check_token:
             try:
                 report["token_debug"] = await debug_access_token()
             except Exception as exc:
                 report["token_debug_error"] = str(exc)
-        return JSONResponse(report)
+        return FastJSONResponse(report)
 
     @app.post("/whatsapp/push")
-    async def whatsapp_push(payload: dict) -> JSONResponse:
-        """Push a text message to WhatsApp."""
+    async def whatsapp_push(request: Request) -> FastJSONResponse:
+        """Push a text message to WhatsApp. Body: ``{"text": ..., "to": ...}``."""
+        payload = await _json_object(request)
         text = str(payload.get("text") or "").strip()
         to_number = str(payload.get("to") or "").strip() or None
         if not text:
             raise HTTPException(status_code=400, detail="Missing text")
-        await push_text(text, to_number)
-        return JSONResponse({"ok": True})
+        async with scheduler.slot(PUSH, _client_key(request)):
+            await push_text(text, to_number)
+        return FastJSONResponse({"ok": True})
 
     # ==================== ACS (AZURE COMMUNICATION SERVICES) ====================
 #     
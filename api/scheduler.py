@@ -0,0 +1,251 @@
+"""
+Fair, priority-aware admission for conversational work.
+
+Every expensive unit of work (answering a text, the whole voice note
+pipeline, one batch question, a WhatsApp push) first takes a slot from the
+``FairScheduler``. Work belongs to a priority class (``text``, ``voice``,
+``batch``, ``push``, in that order) and a sender. A slot is granted when
+the global limit, the class limit and the sender's per-class limit all have
+room; among waiting work, higher classes go first and, within a class,
+senders are served round-robin, so one sender's backlog only delays that
+sender. A sender whose per-class queue is full is shed with
+``SchedulerBusy``. Time spent waiting is recorded per class
+(``sched.<class>.wait_ms``).
+
+    python -m api.scheduler    # simulated abusive sender, FIFO vs fair
+"""
+
+import asyncio
+import os
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Optional
+
+from . import metrics, profiling
+
+
+TEXT = "text"
+VOICE = "voice"
+BATCH = "batch"
+PUSH = "push"
+
+PRIORITY = (TEXT, VOICE, BATCH, PUSH)
+
+# (concurrency, per-sender concurrency, per-sender queue); 0 means unbounded
+_DEFAULTS = {
+    TEXT: (32, 2, 20),
+    VOICE: (8, 1, 10),
+    BATCH: (8, 0, 0),
+    PUSH: (4, 0, 0),
+}
+
+
+class SchedulerBusy(Exception):
+    """Raised when a sender already has too much work queued in a class."""
+
+    def __init__(self, kind: str):
+        super().__init__(f"Too many queued {kind} requests from this sender")
+        self.kind = kind
+
+
+class _Class:
+    def __init__(self, limit: int, sender_limit: int, sender_queue: int):
+        self.limit = limit
+        self.sender_limit = sender_limit
+        self.sender_queue = sender_queue
+        self.running = 0
+        self.per_sender: dict[str, int] = {}
+        # sender -> waiting futures; insertion order is the round-robin order
+        self.queues: OrderedDict[str, deque] = OrderedDict()
+
+    def queued(self) -> int:
+        return sum(len(queue) for queue in self.queues.values())
+
+
+class FairScheduler:
+    """
+    Per-class, per-sender fair slot allocation.
+
+    Args:
+        max_concurrency: Slots across all classes
+        classes: ``{class: (concurrency, per_sender, queue_per_sender)}``;
+            0 disables a bound
+    """
+
+    def __init__(self, max_concurrency: int = 48, classes: Optional[dict] = None):
+        self.max_concurrency = max_concurrency
+        self.running = 0
+        self.classes = {kind: _Class(*limits) for kind, limits in (classes or _DEFAULTS).items()}
+
+    def _has_room(self, cls: _Class, sender: str) -> bool:
+        if cls.limit and cls.running >= cls.limit:
+            return False
+        return not cls.sender_limit or cls.per_sender.get(sender, 0) < cls.sender_limit
+
+    @profiling.traced("sched_wait")
+    async def acquire(self, kind: str, sender: str) -> float:
+        """Wait for a slot; returns the time waited in seconds."""
+        cls = self.classes[kind]
+        started = time.perf_counter()
+        queue = cls.queues.get(sender)
+        if cls.sender_queue and queue and len(queue) >= cls.sender_queue:
+            metrics.incr(f"sched.{kind}.shed")
+            raise SchedulerBusy(kind)
+        future = asyncio.get_running_loop().create_future()
+        cls.queues.setdefault(sender, deque()).append(future)
+        self._dispatch()
+        if not future.done():
+            try:
+                await future
+            except asyncio.CancelledError:
+                if future.done() and not future.cancelled():
+                    # Granted just as we were cancelled: hand the slot on
+                    self.release(kind, sender)
+                else:
+                    self._forget(cls, sender, future)
+                raise
+        waited = time.perf_counter() - started
+        metrics.observe(f"sched.{kind}.wait_ms", waited * 1000)
+        return waited
+
+    def release(self, kind: str, sender: str) -> None:
+        cls = self.classes[kind]
+        cls.running -= 1
+        self.running -= 1
+        count = cls.per_sender.get(sender, 0) - 1
+        if count > 0:
+            cls.per_sender[sender] = count
+        else:
+            cls.per_sender.pop(sender, None)
+        self._dispatch()
+
+    @asynccontextmanager
+    async def slot(self, kind: str, sender: Optional[str]) -> AsyncIterator[None]:
+        """Hold a ``kind`` slot for ``sender`` for the duration of the block."""
+        sender = sender or "anonymous"
+        await self.acquire(kind, sender)
+        try:
+            yield
+        finally:
+            self.release(kind, sender)
+
+    def _grant(self, cls: _Class, sender: str) -> None:
+        cls.running += 1
+        self.running += 1
+        cls.per_sender[sender] = cls.per_sender.get(sender, 0) + 1
+
+    def _forget(self, cls: _Class, sender: str, future: asyncio.Future) -> None:
+        queue = cls.queues.get(sender)
+        if queue is None:
+            return
+        try:
+            queue.remove(future)
+        except ValueError:
+            pass
+        if not queue:
+            del cls.queues[sender]
+
+    def _dispatch(self) -> None:
+        while not self.max_concurrency or self.running < self.max_concurrency:
+            for kind in (*PRIORITY, *(k for k in self.classes if k not in PRIORITY)):
+                cls = self.classes.get(kind)
+                if cls is None or not cls.queues or (cls.limit and cls.running >= cls.limit):
+                    continue
+                sender = next((s for s in cls.queues if self._has_room(cls, s)), None)
+                if sender is None:
+                    continue
+                queue = cls.queues.pop(sender)
+                future = queue.popleft()
+                if queue:
+                    # Back of the line: the next grant goes to another sender
+                    cls.queues[sender] = queue
+                if future.done():
+                    # Cancelled in the same tick as a release: drop it, grant nothing
+                    break
+                self._grant(cls, sender)
+                future.set_result(None)
+                break
+            else:
+                return
+
+    def stats(self) -> dict:
+        return {
+            "running": self.running,
+            "classes": {
+                kind: {
+                    "running": cls.running,
+                    "queued": cls.queued(),
+                    "senders_waiting": len(cls.queues),
+                }
+                for kind, cls in self.classes.items()
+            },
+        }
+
+
+def create_scheduler() -> FairScheduler:
+    """Scheduler from SCHED_* environment variables."""
+    classes = {}
+    for kind, (limit, sender_limit, sender_queue) in _DEFAULTS.items():
+        prefix = f"SCHED_{kind.upper()}"
+        classes[kind] = (
+            int(os.getenv(f"{prefix}_CONCURRENCY", str(limit))),
+            int(os.getenv(f"{prefix}_PER_SENDER", str(sender_limit))),
+            int(os.getenv(f"{prefix}_QUEUE_PER_SENDER", str(sender_queue))),
+        )
+    return FairScheduler(int(os.getenv("SCHED_MAX_CONCURRENCY", "48")), classes)
+
+
+async def _simulate(fair: bool, duration: float = 6.0) -> dict:
+    """Normal text senders at a steady rate while one sender floods voice notes and texts."""
+    scheduler = FairScheduler()
+    fifo = asyncio.Semaphore(scheduler.max_concurrency)
+    latencies = metrics.Histogram()
+    shed = 0
+
+    async def job(kind: str, sender: str, seconds: float, record: bool) -> None:
+        nonlocal shed
+        started = time.perf_counter()
+        try:
+            if fair:
+                async with scheduler.slot(kind, sender):
+                    await asyncio.sleep(seconds)
+            else:
+                async with fifo:
+                    await asyncio.sleep(seconds)
+        except SchedulerBusy:
+            shed += 1
+            return
+        if record:
+            latencies.observe((time.perf_counter() - started) * 1000)
+
+    # The abuser: 300 voice notes (2 s each) and 300 texts at once
+    abuse = []
+    for _ in range(300):
+        abuse.append(asyncio.create_task(job(VOICE, "abuser", 2.0, False)))
+        abuse.append(asyncio.create_task(job(TEXT, "abuser", 0.3, False)))
+    # Everyone else: 20 senders, 10 texts/s in total, 0.3 s each
+    normal = []
+    started = time.perf_counter()
+    while time.perf_counter() - started < duration:
+        normal.append(asyncio.create_task(job(TEXT, f"user{len(normal) % 20}", 0.3, True)))
+        await asyncio.sleep(0.1)
+    await asyncio.gather(*normal)
+    for task in abuse:
+        task.cancel()
+    await asyncio.gather(*abuse, return_exceptions=True)
+    return {"normal_text_ms": latencies.snapshot(), "shed": shed}
+
+
+def _benchmark() -> None:
+    for fair in (False, True):
+        result = asyncio.run(_simulate(fair))
+        ms = result["normal_text_ms"]
+        print(
+            f"{'fair' if fair else 'fifo':5} normal text: n={ms['count']} p50={ms['p50']:.0f} ms "
+            f"p95={ms['p95']:.0f} ms p99={ms['p99']:.0f} ms  (abuser requests shed: {result['shed']})"
+        )
+
+
+if __name__ == "__main__":
+    _benchmark()
@@ -0,0 +1,158 @@
+"""
+JSON serialization for the hot request/response paths.
+
+Routes, the Azure and Graph clients, session storage and the traffic log all
+go through ``dumps``/``loads`` here. orjson is used when it is installed and
+the standard library otherwise; both produce compact UTF-8 JSON with
+non-ASCII text left unescaped. ``FastJSONResponse`` is the app's default
+response class.
+
+    python -m api.serialization    # micro-benchmark on representative payloads
+"""
+
+import json
+import time
+from typing import Any
+
+from fastapi import Request
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - depends on the environment
+    orjson = None
+
+
+JSON_HEADERS = {"Content-Type": "application/json"}
+
+
+def _default(value: Any) -> Any:
+    # numpy scalars/arrays and similar objects that expose a plain equivalent
+    if hasattr(value, "tolist"):
+        return value.tolist()
+    if hasattr(value, "item"):
+        return value.item()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+if orjson is not None:
+    _OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+    def dumps(value: Any) -> bytes:
+        """Serialize ``value`` to compact UTF-8 JSON bytes."""
+        return orjson.dumps(value, default=_default, option=_OPTIONS)
+
+    def loads(data: bytes | bytearray | memoryview | str) -> Any:
+        """Parse JSON from bytes or text."""
+        return orjson.loads(data)
+
+else:
+
+    def dumps(value: Any) -> bytes:
+        """Serialize ``value`` to compact UTF-8 JSON bytes."""
+        return json.dumps(value, default=_default, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+    def loads(data: bytes | bytearray | memoryview | str) -> Any:
+        """Parse JSON from bytes or text."""
+        if isinstance(data, memoryview):
+            data = data.tobytes()
+        return json.loads(data)
+
+
+def dumps_str(value: Any) -> str:
+    """``dumps`` as text, for JSON embedded in strings (e.g. tool messages)."""
+    return dumps(value).decode("utf-8")
+
+
+async def request_json(request: Request) -> Any:
+    """Parse a request body without Starlette's stdlib ``request.json()``."""
+    return loads(await request.body())
+
+
+class FastJSONResponse(JSONResponse):
+    """``JSONResponse`` rendered with ``dumps``."""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+def _bench_payloads() -> dict[str, Any]:
+    message = {
+        "from": "923001234567",
+        "id": "wamid.HBgMOTIzMDAxMjM0NTY3FQIAEhgUM0E",
+        "timestamp": "1718000000",
+        "type": "text",
+        "text": {"body": "Roshan Digital Account kholne ke liye kya documents chahiye?"},
+    }
+    webhook = {
+        "object": "whatsapp_business_account",
+        "entry": [{
+            "id": "1234567890",
+            "changes": [{
+                "field": "messages",
+                "value": {
+                    "messaging_product": "whatsapp",
+                    "metadata": {"display_phone_number": "923001112222", "phone_number_id": "1098765432"},
+                    "contacts": [{"profile": {"name": "Customer"}, "wa_id": "923001234567"}],
+                    "messages": [message],
+                },
+            }],
+        }],
+    }
+    context = "\n\n".join(
+        f"Source: Accounts FAQ {i}\nContent: " + "BankIslami offers Shariah-compliant current and savings accounts. " * 12
+        for i in range(5)
+    )
+    chat_request = {
+        "messages": [
+            {"role": "system", "content": "You are BankIslami's virtual banking assistant. " * 20},
+            {"role": "user", "content": f"Context:\n{context}\n\nQuestion: What accounts do you offer?"},
+        ],
+        "temperature": 0.3,
+        "top_p": 0.95,
+    }
+    chat_response = {
+        "id": "chatcmpl-123",
+        "object": "chat.completion",
+        "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": "BankIslami offers: 1. Current Account 2. Savings Account " * 6}}],
+        "usage": {"prompt_tokens": 1800, "completion_tokens": 120, "prompt_tokens_details": {"cached_tokens": 1024}},
+    }
+    histogram = {"count": 1000, "mean": 812.4, "p50": 640.2, "p95": 1900.7, "p99": 2600.1, "max": 3100.0}
+    metrics_report = {
+        "counters": {f"counter.{i}": i * 3.0 for i in range(40)},
+        "histograms": {f"latency.{i}_ms": histogram for i in range(25)},
+    }
+    return {
+        "webhook (~0.5 KB)": webhook,
+        "chat request (~5 KB)": chat_request,
+        "chat response (~0.6 KB)": chat_response,
+        "metrics (~3 KB)": metrics_report,
+    }
+
+
+def _benchmark(rounds: int = 5000) -> None:
+    def stdlib_dumps(value: Any) -> bytes:
+        return json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+    print(f"backend: {'orjson' if orjson is not None else 'stdlib'}")
+    for name, payload in _bench_payloads().items():
+        encoded = dumps(payload)
+        timings = {}
+        for label, fn, arg in (
+            ("dumps", dumps, payload),
+            ("stdlib dumps", stdlib_dumps, payload),
+            ("loads", loads, encoded),
+            ("stdlib loads", json.loads, encoded),
+        ):
+            start = time.perf_counter()
+            for _ in range(rounds):
+                fn(arg)
+            timings[label] = (time.perf_counter() - start) / rounds * 1e6
+        print(
+            f"{name:26} {len(encoded):6d} B  dumps {timings['dumps']:6.1f} us (stdlib {timings['stdlib dumps']:6.1f})"
+            f"  loads {timings['loads']:6.1f} us (stdlib {timings['stdlib loads']:6.1f})"
+        )
+
+
+if __name__ == "__main__":
+    _benchmark()
@@ -0,0 +1,170 @@
+"""
+Per-sender conversation memory.
+
+Each WhatsApp sender gets a small session record: a rolling summary of
+older turns, the last few question/answer pairs and the last retrieval
+(document ids plus the assembled context) so follow-up questions can reuse
+it instead of searching again. Records are JSON, zlib-compressed, and kept
+in a pluggable backend with TTL and a global size cap.
+"""
+
+import os
+import re
+import zlib
+from typing import Optional
+
+from .serialization import dumps, loads
+from .state import MemoryState, StateBackend, get_state, namespace
+
+
+# Words pointing back at the previous answer; interrogatives ("kitna",
+# "kaise", "what about") are not enough on their own
+_ANAPHORA = re.compile(
+    r"\b(it|its|this|that|these|those|they|them|same|iska|iski|iske|uska|uski|uske|"
+    r"isko|usko|is ka|us ka)\b|^(and|also|more|aur|mazeed|explain|details?)\b",
+    re.IGNORECASE,
+)
+
+_WORD = re.compile(r"[a-z0-9]+")
+
+# Function words and filler (English and Roman Urdu) that name nothing new
+_STOPWORDS = frozenset(
+    """a about also am an and any are as at be but by can could detail details do does
+    else explain for from give have how i if in is it its kindly know let me more
+    much my need of on or please share should so some tell than that the their them
+    then there these they this those to us want was what when where which who why
+    will with would you your
+    aap ab acha agar aur baare bare bata batain bataen bataein batao bhi chahiye
+    dein do hai hain hay ho hoga hota hoti iska iske iski is isko jaye ka kab kaise
+    kar karein karna karoon karun kese ke ki kia kitna kitni kitne ko koi kya kyun
+    liye main mazeed mein mera meri mujhe na nahi par pe raha rahi se sakta sakte
+    sakti tha thi uska uske uski us usko wala wali wo woh ye yeh""".split()
+)
+
+
+def _content_words(text: str) -> set[str]:
+    """Lower-cased words that carry meaning, crudely singularized."""
+    words = set()
+    for word in _WORD.findall(text.lower()):
+        if word in _STOPWORDS or len(word) < 3 or word.isdigit():
+            continue
+        words.add(word[:-1] if len(word) > 3 and word.endswith("s") else word)
+    return words
+
+
+class SessionStore:
+    """
+    Conversation memory keyed by sender id.
+
+    Args:
+        backend: Storage backend (``api.state`` memory or redis)
+        ttl: Seconds of inactivity after which a session expires
+        max_turns: Question/answer pairs kept verbatim
+        max_turn_chars: Per-message character cap for stored turns
+        max_summary_chars: Size cap for the rolling summary of older turns
+        follow_up_overlap: Share of a follow-up's content words that must
+            already occur in the previous question, answer or context
+    """
+
+    def __init__(
+        self,
+        backend: StateBackend,
+        ttl: int = 1800,
+        max_turns: int = 4,
+        max_turn_chars: int = 400,
+        max_summary_chars: int = 600,
+        follow_up_overlap: float = 0.75,
+    ):
+        self.backend = backend
+        self.ttl = ttl
+        self.max_turns = max_turns
+        self.max_turn_chars = max_turn_chars
+        self.max_summary_chars = max_summary_chars
+        self.follow_up_overlap = follow_up_overlap
+
+    async def load(self, sender: str) -> dict:
+        raw = await self.backend.get(sender)
+        if not raw:
+            return {"summary": "", "turns": [], "doc_ids": [], "context": ""}
+        return loads(zlib.decompress(raw))
+
+    async def save(self, sender: str, session: dict) -> None:
+        raw = zlib.compress(dumps(session))
+        await self.backend.set(sender, raw, self.ttl)
+
+    async def clear(self, sender: str) -> None:
+        await self.backend.delete(sender)
+
+    async def record(
+        self,
+        sender: str,
+        session: dict,
+        question: str,
+        answer: str,
+        doc_ids: Optional[list[str]] = None,
+        context: Optional[str] = None,
+    ) -> None:
+        """Append a turn, folding the oldest turns into the summary."""
+        turns = session.get("turns", [])
+        turns.append([question[: self.max_turn_chars], answer[: self.max_turn_chars]])
+        summary = session.get("summary", "")
+        while len(turns) > self.max_turns:
+            old_question, _ = turns.pop(0)
+            summary = f"{summary} | {old_question}" if summary else old_question
+        session["summary"] = summary[-self.max_summary_chars:]
+        session["turns"] = turns
+        if context is not None:
+            session["context"] = context
+            session["doc_ids"] = list(doc_ids or [])
+        await self.save(sender, session)
+
+    def is_follow_up(self, text: str, session: dict) -> bool:
+        """
+        Short messages that refer back ("it", "iske", "and ...") and name
+        nothing new continue the previous topic.
+
+        A message whose content words mostly do not occur in the last
+        question, answer or retrieved context (e.g. "What are the charges
+        for this service?" after a car-financing answer) is a new question
+        and is searched afresh.
+        """
+        if not session.get("context") or not session.get("turns"):
+            return False
+        if len(text.split()) > 8 or not _ANAPHORA.search(text):
+            return False
+        words = _content_words(text)
+        if not words:
+            # Pure reference: "tell me more about it", "iske baare mein batao"
+            return True
+        question, answer = session["turns"][-1]
+        known = _content_words(f"{question}\n{answer}\n{session['context']}")
+        return len(words & known) / len(words) >= self.follow_up_overlap
+
+    @staticmethod
+    def history_text(session: dict) -> str:
+        lines = []
+        if session.get("summary"):
+            lines.append(f"Earlier topics: {session['summary']}")
+        for question, answer in session.get("turns", []):
+            lines.append(f"User: {question}")
+            lines.append(f"Assistant: {answer}")
+        return "\n".join(lines)
+
+    def stats(self) -> dict:
+        stats = getattr(self.backend, "stats", None)
+        return stats() if stats else {}
+
+
+def create_session_store() -> SessionStore:
+    """Build the session store configured by SESSION_* environment variables."""
+    if isinstance(get_state(), MemoryState):
+        # Sessions get their own LRU so they cannot evict media or caches.
+        backend = MemoryState(max_bytes=int(os.getenv("SESSION_MAX_BYTES", str(32 * 1024 * 1024))))
+    else:
+        backend = namespace("session")
+    return SessionStore(
+        backend,
+        ttl=int(os.getenv("SESSION_TTL_SECONDS", "1800")),
+        max_turns=int(os.getenv("SESSION_MAX_TURNS", "4")),
+        follow_up_overlap=float(os.getenv("SESSION_FOLLOW_UP_OVERLAP", "0.75")),
+    )
@@ -0,0 +1,205 @@
+"""
+Shared state for media, caches, sessions and webhook de-duplication.
+
+With a single worker the in-process ``MemoryState`` is enough. When the app
+runs with several worker processes (see ``serve.py``) every worker must see
+the same media buffers, sessions and processed-message ids, so
+``STATE_BACKEND=redis`` switches all of them to Redis at ``REDIS_URL``.
+``SqliteState`` is a file-backed store for offline tools that need their
+data to outlive the process without a Redis server.
+Values are bytes; callers handle their own serialization.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Protocol
+
+
+class StateBackend(Protocol):
+    async def get(self, key: str) -> Optional[bytes]: ...
+
+    async def set(self, key: str, value: bytes, ttl: int) -> None: ...
+
+    async def add(self, key: str, value: bytes, ttl: int) -> bool: ...
+
+    async def delete(self, key: str) -> None: ...
+
+
+class MemoryState:
+    """Process-local LRU store with per-key TTL, bounded by total stored bytes."""
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._items: OrderedDict[str, tuple[bytes, float]] = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    async def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return None
+            value, expires_at = item
+            if expires_at <= time.time():
+                self._drop(key)
+                return None
+            self._items.move_to_end(key)
+            return value
+
+    async def set(self, key: str, value: bytes, ttl: int) -> None:
+        with self._lock:
+            self._store(key, value, ttl)
+
+    async def add(self, key: str, value: bytes, ttl: int) -> bool:
+        """Set ``key`` only if it is absent or expired; True if it was set."""
+        with self._lock:
+            item = self._items.get(key)
+            if item is not None and item[1] > time.time():
+                return False
+            self._store(key, value, ttl)
+            return True
+
+    async def delete(self, key: str) -> None:
+        with self._lock:
+            if key in self._items:
+                self._drop(key)
+
+    def _store(self, key: str, value: bytes, ttl: int) -> None:
+        if key in self._items:
+            self._drop(key)
+        self._items[key] = (value, time.time() + ttl)
+        self._bytes += len(value)
+        while self._bytes > self.max_bytes and len(self._items) > 1:
+            self._drop(next(iter(self._items)))
+            self.evictions += 1
+
+    def _drop(self, key: str) -> None:
+        value, _ = self._items.pop(key)
+        self._bytes -= len(value)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"backend": "memory", "keys": len(self._items), "bytes": self._bytes, "evictions": self.evictions}
+
+
+class RedisState:
+    """Redis-backed store shared by all worker processes (requires ``redis``)."""
+
+    def __init__(self, url: str):
+        import redis.asyncio as redis
+
+        self._redis = redis.from_url(url)
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return await self._redis.get(key)
+
+    async def set(self, key: str, value: bytes, ttl: int) -> None:
+        await self._redis.set(key, value, ex=ttl)
+
+    async def add(self, key: str, value: bytes, ttl: int) -> bool:
+        return bool(await self._redis.set(key, value, ex=ttl, nx=True))
+
+    async def delete(self, key: str) -> None:
+        await self._redis.delete(key)
+
+    async def aclose(self) -> None:
+        await self._redis.aclose()
+
+    def stats(self) -> dict:
+        return {"backend": "redis"}
+
+
+class SqliteState:
+    """Single-file store with per-key TTL; survives restarts, not shared across hosts."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, value BLOB NOT NULL, expires_at REAL NOT NULL)"
+        )
+        self._db.commit()
+
+    async def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT value FROM state WHERE key = ? AND expires_at > ?", (key, time.time())
+            ).fetchone()
+        return bytes(row[0]) if row else None
+
+    async def set(self, key: str, value: bytes, ttl: int) -> None:
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO state VALUES (?, ?, ?)", (key, value, time.time() + ttl)
+            )
+
+    async def add(self, key: str, value: bytes, ttl: int) -> bool:
+        """Set ``key`` only if it is absent or expired; True if it was set."""
+        now = time.time()
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM state WHERE key = ? AND expires_at <= ?", (key, now))
+            cursor = self._db.execute(
+                "INSERT OR IGNORE INTO state VALUES (?, ?, ?)", (key, value, now + ttl)
+            )
+        return cursor.rowcount == 1
+
+    async def delete(self, key: str) -> None:
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM state WHERE key = ?", (key,))
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+    def stats(self) -> dict:
+        with self._lock:
+            (keys,) = self._db.execute("SELECT COUNT(*) FROM state WHERE expires_at > ?", (time.time(),)).fetchone()
+        return {"backend": "sqlite", "path": self.path, "keys": keys}
+
+
+class Namespace:
+    """Key-prefixed view of a backend, e.g. ``media:`` or ``session:``."""
+
+    def __init__(self, backend: StateBackend, prefix: str):
+        self.backend = backend
+        self.prefix = prefix
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return await self.backend.get(self.prefix + key)
+
+    async def set(self, key: str, value: bytes, ttl: int) -> None:
+        await self.backend.set(self.prefix + key, value, ttl)
+
+    async def add(self, key: str, value: bytes, ttl: int) -> bool:
+        return await self.backend.add(self.prefix + key, value, ttl)
+
+    async def delete(self, key: str) -> None:
+        await self.backend.delete(self.prefix + key)
+
+    def stats(self) -> dict:
+        stats = getattr(self.backend, "stats", None)
+        return stats() if stats else {}
+
+
+_backend: Optional[StateBackend] = None
+
+
+def get_state() -> StateBackend:
+    """Return the process-wide state backend configured by STATE_BACKEND."""
+    global _backend
+    if _backend is None:
+        name = os.getenv("STATE_BACKEND", os.getenv("SESSION_BACKEND", "memory")).strip().lower()
+        if name == "redis":
+            _backend = RedisState(os.getenv("REDIS_URL", "redis://localhost:6379/0"))
+        else:
+            _backend = MemoryState(max_bytes=int(os.getenv("STATE_MAX_BYTES", str(64 * 1024 * 1024))))
+    return _backend
+
+
+def namespace(prefix: str) -> Namespace:
+    return Namespace(get_state(), f"{prefix}:")
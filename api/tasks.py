@@ -0,0 +1,102 @@
+"""
+Background job registry with graceful draining.
+
+Webhook replies run after the HTTP response has been sent. The registry
+tracks those tasks so that, on shutdown, the app stops accepting new jobs,
+lets in-flight work finish up to a deadline, and writes whatever is still
+unfinished to ``PENDING_JOBS_PATH`` so the next start can resume it.
+"""
+
+import asyncio
+import os
+from typing import Awaitable, Callable, Optional
+
+from .serialization import dumps_str, loads
+
+
+Handler = Callable[[dict], Awaitable[None]]
+
+
+class TaskRegistry:
+    """
+    Track fire-and-forget jobs; each job is a JSON-serializable dict handled
+    by ``handler``.
+
+    Args:
+        handler: Coroutine function processing one job
+        pending_path: JSONL file for jobs left unfinished at shutdown
+    """
+
+    def __init__(self, handler: Handler, pending_path: Optional[str] = None):
+        self.handler = handler
+        self.pending_path = pending_path
+        self.accepting = True
+        self._tasks: dict[asyncio.Task, dict] = {}
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._tasks)
+
+    def submit(self, job: dict) -> bool:
+        """Start ``job`` in the background; False once shutdown has begun."""
+        if not self.accepting:
+            return False
+        task = asyncio.create_task(self._run(job))
+        self._tasks[task] = job
+        task.add_done_callback(self._tasks.pop)
+        return True
+
+    async def _run(self, job: dict) -> None:
+        try:
+            await self.handler(job)
+        except asyncio.CancelledError:
+            raise
+        except Exception as exc:
+            print(f"Background job error: {exc}")
+
+    async def drain(self, timeout: float) -> list[dict]:
+        """
+        Stop accepting jobs and wait up to ``timeout`` seconds for in-flight
+        ones. Jobs still running afterwards are cancelled and returned.
+        """
+        self.accepting = False
+        if not self._tasks:
+            return []
+        _, pending = await asyncio.wait(list(self._tasks), timeout=timeout)
+        unfinished = [self._tasks[task] for task in pending if task in self._tasks]
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+        return unfinished
+
+    def persist(self, jobs: list[dict]) -> None:
+        if not jobs or not self.pending_path:
+            return
+        with open(self.pending_path, "a", encoding="utf-8") as f:
+            for job in jobs:
+                f.write(dumps_str(job) + "\n")
+        print(f"Persisted {len(jobs)} unfinished job(s) to {self.pending_path}")
+
+    def resume(self) -> int:
+        """Re-submit jobs persisted by a previous shutdown."""
+        if not self.pending_path or not os.path.exists(self.pending_path):
+            return 0
+        # Claim the file atomically so only one worker resumes these jobs.
+        claimed = f"{self.pending_path}.{os.getpid()}"
+        try:
+            os.replace(self.pending_path, claimed)
+        except OSError:
+            return 0
+        resumed = 0
+        with open(claimed, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip() and self.submit(loads(line)):
+                    resumed += 1
+        os.remove(claimed)
+        if resumed:
+            print(f"Resumed {resumed} job(s) from {self.pending_path}")
+        return resumed
+
+    async def shutdown(self, timeout: float) -> None:
+        self.persist(await self.drain(timeout))
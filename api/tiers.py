@@ -0,0 +1,143 @@
+"""
+Model tiering for RAG answers.
+
+Short, single-fact questions whose retrieval is clearly confident are sent to
+a small, fast chat deployment (``AZURE_GPT_FAST_DEPLOYMENT``); multi-part,
+comparative or long questions and weak or ambiguous retrievals go to the
+large deployment (``AZURE_GPT_DEPLOYMENT``). Tiering is off unless a fast
+deployment is configured. Each tier has its own ``max_tokens`` cap
+(``LLM_FAST_MAX_TOKENS``, ``LLM_LARGE_MAX_TOKENS``; 0 means uncapped).
+
+Retrieval confidence uses the search scores of the retrieved documents: the
+best score must reach ``TIER_FAST_MIN_SCORE`` and beat the runner-up by
+``TIER_FAST_MIN_MARGIN`` (a ratio), so a question whose context is spread
+over several similar documents is treated as uncertain. Scores are on the
+search service's scale (BM25, hybrid RRF or semantic reranker 0-4). Only the
+reranker scale is fixed, so with ``AZURE_SEARCH_SEMANTIC_CONFIG`` the minimum
+defaults to 2.0 (a relevant match); for BM25 or RRF scores there is no
+portable default and the fast tier stays off until the minimum is set.
+"""
+
+import os
+import re
+from typing import Optional
+
+
+FAST = "fast"
+LARGE = "large"
+
+# Semantic reranker scores run 0-4; 2 and above is a relevant match
+RERANKER_MIN_SCORE = 2.0
+
+# Signals of a question with several parts or one that needs synthesis across
+# documents (English and Roman Urdu).
+_MULTI_PART = re.compile(
+    r"\b(and|also|both|compare|comparison|difference|differences|versus|vs|between|"
+    r"aur|ya|farq|muqabla|dono|bhi)\b",
+    re.IGNORECASE,
+)
+_QUESTION_MARKS = re.compile(r"[?؟]")
+
+
+class TierPolicy:
+    """
+    Rules choosing the chat deployment for one question.
+
+    Args:
+        large_deployment: Deployment for everything that is not clearly simple
+        fast_deployment: Small, fast deployment; None disables tiering
+        fast_max_words: Longest question (in words) eligible for the fast tier
+        fast_min_score: Minimum best search score for the fast tier
+        fast_min_margin: Minimum ratio of best to second-best search score
+        fast_max_tokens: Completion token cap for the fast tier
+        large_max_tokens: Completion token cap for the large tier
+    """
+
+    def __init__(
+        self,
+        large_deployment: str,
+        fast_deployment: Optional[str] = None,
+        fast_max_words: int = 16,
+        fast_min_score: float = RERANKER_MIN_SCORE,
+        fast_min_margin: float = 1.2,
+        fast_max_tokens: Optional[int] = 300,
+        large_max_tokens: Optional[int] = None,
+    ):
+        self.large_deployment = large_deployment
+        self.fast_deployment = fast_deployment
+        self.fast_max_words = fast_max_words
+        self.fast_min_score = fast_min_score
+        self.fast_min_margin = fast_min_margin
+        self.max_tokens = {FAST: fast_max_tokens, LARGE: large_max_tokens}
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.fast_deployment)
+
+    def deployment(self, tier: str) -> str:
+        return self.fast_deployment if tier == FAST and self.fast_deployment else self.large_deployment
+
+    def choose(self, question: str, scores: Optional[list[float]]) -> tuple[str, str]:
+        """
+        Pick a tier for ``question`` given its retrieval scores.
+
+        Args:
+            question: User question
+            scores: Search scores of the retrieved documents, best first;
+                None when the retrieval was reused and its confidence is
+                unknown
+
+        Returns:
+            ``(tier, reason)``; the reason is a short metric-friendly label
+        """
+        if not self.enabled:
+            return LARGE, "disabled"
+        text = question.strip()
+        if "\n" in text or len(_QUESTION_MARKS.findall(text)) > 1 or _MULTI_PART.search(text):
+            return LARGE, "multi_part"
+        if len(text.split()) > self.fast_max_words:
+            return LARGE, "long"
+        if not scores:
+            return LARGE, "unknown_confidence"
+        best = scores[0]
+        if best < self.fast_min_score:
+            return LARGE, "low_score"
+        if len(scores) > 1 and scores[1] > 0 and best / scores[1] < self.fast_min_margin:
+            return LARGE, "ambiguous"
+        return FAST, "simple"
+
+
+def _optional_int(name: str, default: str) -> Optional[int]:
+    value = int(os.getenv(name, default))
+    return value if value > 0 else None
+
+
+def _fast_min_score() -> Optional[float]:
+    """``TIER_FAST_MIN_SCORE``, the reranker default with semantic ranking, else None."""
+    value = os.getenv("TIER_FAST_MIN_SCORE", "").strip()
+    if value:
+        return float(value)
+    if os.getenv("AZURE_SEARCH_SEMANTIC_CONFIG", "").strip():
+        return RERANKER_MIN_SCORE
+    return None
+
+
+def create_tier_policy() -> TierPolicy:
+    """Build the policy from AZURE_GPT_* and TIER_* environment variables."""
+    fast_deployment = os.getenv("AZURE_GPT_FAST_DEPLOYMENT", "").strip() or None
+    fast_min_score = _fast_min_score()
+    if fast_deployment and fast_min_score is None:
+        print(
+            "Fast model tier disabled: set TIER_FAST_MIN_SCORE to the index's score scale "
+            "(no default without AZURE_SEARCH_SEMANTIC_CONFIG)"
+        )
+        fast_deployment = None
+    return TierPolicy(
+        large_deployment=os.getenv("AZURE_GPT_DEPLOYMENT", ""),
+        fast_deployment=fast_deployment,
+        fast_max_words=int(os.getenv("TIER_FAST_MAX_WORDS", "16")),
+        fast_min_score=fast_min_score if fast_min_score is not None else RERANKER_MIN_SCORE,
+        fast_min_margin=float(os.getenv("TIER_FAST_MIN_MARGIN", "1.2")),
+        fast_max_tokens=_optional_int("LLM_FAST_MAX_TOKENS", "300"),
+        large_max_tokens=_optional_int("LLM_LARGE_MAX_TOKENS", "0"),
+    )
@@ -129,6 +129,7 @@ UI_HTML = """<!DOCTYPE html>
       }
       .btn.send { background: var(--accent); color: #1b1b14; }
       .btn.mic { background: #1b2e27; color: var(--text); border: 1px solid var(--stroke); }
+      .btn.live.active { background: var(--accent-2); color: #07110f; }
       .panel {
         display: grid;
         grid-template-columns: 1fr auto auto;
@@ -167,6 +168,7 @@ UI_HTML = """<!DOCTYPE html>
           <input id="textInput" class="input" placeholder="Type a message" />
           <button class="btn send" id="sendText">Send</button>
           <button class="btn mic" id="recordBtn">Record</button>
+          <button class="btn mic live" id="liveBtn">Live</button>
         </div>
         <div class="panel">
           <input id="audioFile" class="input" type="file" accept="audio/*" />
@@ -291,6 +293,117 @@ UI_HTML = """<!DOCTYPE html>
         await startRecording();
       });
 
+      // Live voice: stream 16 kHz PCM over /voice, play reply audio as it arrives.
+      const liveBtn = document.getElementById("liveBtn");
+      let live = null;
+
+      function downsample(input, fromRate) {
+        const ratio = fromRate / 16000;
+        const out = new Int16Array(Math.floor(input.length / ratio));
+        for (let i = 0; i < out.length; i++) {
+          const s = Math.max(-1, Math.min(1, input[Math.floor(i * ratio)]));
+          out[i] = s < 0 ? s * 0x8000 : s * 0x7fff;
+        }
+        return out;
+      }
+
+      function stopPlayback(session) {
+        session.queue = [];
+        if (session.player) {
+          session.player.pause();
+          session.player = null;
+        }
+      }
+
+      function playNext(session) {
+        if (session.player || !session.queue.length) return;
+        const audio = new Audio(URL.createObjectURL(session.queue.shift()));
+        session.player = audio;
+        audio.onended = () => { session.player = null; playNext(session); };
+        audio.play().catch(() => { session.player = null; playNext(session); });
+      }
+
+      function onLiveMessage(session, event) {
+        if (typeof event.data !== "string") {
+          session.parts.push(event.data);
+          return;
+        }
+        const msg = JSON.parse(event.data);
+        if (msg.type === "ready") {
+          session.format = msg.format;
+          recordHint.textContent = "Live - speak any time";
+        } else if (msg.type === "listening") {
+          recordHint.textContent = "Listening...";
+        } else if (msg.type === "partial") {
+          recordHint.textContent = msg.text;
+        } else if (msg.type === "transcript" && msg.text) {
+          addBubble(msg.text, "outgoing");
+          session.reply = addBubble("...", "incoming");
+        } else if (msg.type === "answer" && session.reply) {
+          session.reply.textContent = msg.text;
+        } else if (msg.type === "audio_start") {
+          session.parts = [];
+        } else if (msg.type === "audio_end") {
+          session.queue.push(new Blob(session.parts, { type: session.format }));
+          playNext(session);
+        } else if (msg.type === "interrupted") {
+          stopPlayback(session);
+        } else if (msg.type === "done") {
+          recordHint.textContent = "Live - speak any time";
+        }
+      }
+
+      async function startLive() {
+        const scheme = location.protocol === "https:" ? "wss://" : "ws://";
+        const stream = await navigator.mediaDevices.getUserMedia({
+          audio: { echoCancellation: true, noiseSuppression: true, channelCount: 1 }
+        });
+        const ctx = new AudioContext();
+        const source = ctx.createMediaStreamSource(stream);
+        const processor = ctx.createScriptProcessor(2048, 1, 1);
+        const ws = new WebSocket(scheme + location.host + "/voice");
+        ws.binaryType = "blob";
+        const session = { ws, ctx, stream, processor, queue: [], parts: [], player: null, format: "audio/mpeg" };
+        ws.onmessage = (event) => onLiveMessage(session, event);
+        ws.onclose = () => stopLive();
+        processor.onaudioprocess = (e) => {
+          if (ws.readyState === WebSocket.OPEN) {
+            ws.send(downsample(e.inputBuffer.getChannelData(0), ctx.sampleRate).buffer);
+          }
+        };
+        source.connect(processor);
+        processor.connect(ctx.destination);
+        live = session;
+        liveBtn.classList.add("active");
+        liveBtn.textContent = "End";
+      }
+
+      function stopLive() {
+        if (!live) return;
+        const session = live;
+        live = null;
+        stopPlayback(session);
+        session.processor.disconnect();
+        session.stream.getTracks().forEach((t) => t.stop());
+        session.ctx.close();
+        if (session.ws.readyState === WebSocket.OPEN) session.ws.close();
+        liveBtn.classList.remove("active");
+        liveBtn.textContent = "Live";
+        recordHint.textContent = "Mic ready";
+      }
+
+      liveBtn.addEventListener("click", async () => {
+        if (live) {
+          stopLive();
+          return;
+        }
+        try {
+          await startLive();
+        } catch (err) {
+          recordHint.textContent = "Mic access denied.";
+        }
+      });
+
     </script>
   </body>
 </html>
@@ -0,0 +1,203 @@
+"""
+Size-bounded, spooled handling of uploaded audio.
+
+``UploadLimitMiddleware`` rejects oversized request bodies on the upload
+routes with 413: up front from ``Content-Length``, or as soon as a chunked
+body crosses the limit, before Starlette's multipart parser has buffered
+the rest. ``spool_upload`` then copies the parsed file into a
+``SpooledUpload`` that stays in memory up to ``UPLOAD_SPOOL_BYTES`` and
+moves to a named temporary file beyond that, so ffmpeg can read it by path
+and the STT request can stream it as multipart. Per-request memory is
+bounded by the spool threshold whatever clients upload.
+"""
+
+import os
+import tempfile
+from typing import BinaryIO, Iterable, Optional
+
+from fastapi import UploadFile
+
+from . import metrics
+from .serialization import dumps
+
+
+_CHUNK = 64 * 1024
+
+
+class UploadTooLarge(Exception):
+    """Raised when an upload exceeds ``UPLOAD_MAX_BYTES``."""
+
+    def __init__(self, limit: int):
+        super().__init__(f"Upload exceeds the {limit} byte limit")
+        self.limit = limit
+
+
+def max_upload_bytes() -> int:
+    return int(os.getenv("UPLOAD_MAX_BYTES", str(25 * 1024 * 1024)))
+
+
+def spool_threshold() -> int:
+    return int(os.getenv("UPLOAD_SPOOL_BYTES", str(1024 * 1024)))
+
+
+def max_upload_seconds() -> Optional[float]:
+    seconds = float(os.getenv("UPLOAD_MAX_SECONDS", "300"))
+    return seconds if seconds > 0 else None
+
+
+class SpooledUpload:
+    """
+    Upload body kept in memory up to ``spool_bytes`` and on disk beyond.
+
+    Args:
+        spool_bytes: In-memory size limit before spilling to a temp file
+        suffix: Temp file suffix (keeps the container hint for ffmpeg)
+    """
+
+    def __init__(self, spool_bytes: int, suffix: str = ""):
+        self.spool_bytes = spool_bytes
+        self.suffix = suffix
+        self.size = 0
+        self.path: Optional[str] = None
+        self._buffer = bytearray()
+        self._file: Optional[BinaryIO] = None
+        self._readers: list[BinaryIO] = []
+
+    def write(self, chunk: bytes) -> None:
+        self.size += len(chunk)
+        if self._file is None and len(self._buffer) + len(chunk) <= self.spool_bytes:
+            self._buffer += chunk
+            return
+        if self._file is None:
+            fd, self.path = tempfile.mkstemp(prefix="upload-", suffix=self.suffix)
+            self._file = os.fdopen(fd, "wb")
+            self._file.write(self._buffer)
+            self._buffer = bytearray()
+            metrics.incr("upload.spilled")
+        self._file.write(chunk)
+
+    def finish(self) -> None:
+        if self._file is not None and not self._file.closed:
+            self._file.close()
+
+    def source(self) -> bytes | str:
+        """The body as bytes, or the temp file path once spilled."""
+        return self.path if self.path else bytes(self._buffer)
+
+    def payload(self) -> bytes | BinaryIO:
+        """The body as bytes, or an open file to stream once spilled."""
+        if not self.path:
+            return bytes(self._buffer)
+        reader = open(self.path, "rb")
+        self._readers.append(reader)
+        return reader
+
+    def close(self) -> None:
+        self.finish()
+        for reader in self._readers:
+            reader.close()
+        self._readers = []
+        if self.path:
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+            self.path = None
+        self._buffer = bytearray()
+
+
+async def spool_upload(
+    file: UploadFile, max_bytes: Optional[int] = None, spool_bytes: Optional[int] = None
+) -> SpooledUpload:
+    """
+    Copy an uploaded file into a ``SpooledUpload`` chunk by chunk.
+
+    Raises:
+        UploadTooLarge: The file is larger than ``max_bytes``
+    """
+    limit = max_upload_bytes() if max_bytes is None else max_bytes
+    suffix = os.path.splitext(file.filename or "")[1][:10]
+    upload = SpooledUpload(spool_threshold() if spool_bytes is None else spool_bytes, suffix)
+    try:
+        while True:
+            chunk = await file.read(_CHUNK)
+            if not chunk:
+                break
+            upload.write(chunk)
+            if upload.size > limit:
+                raise UploadTooLarge(limit)
+        upload.finish()
+    except BaseException:
+        upload.close()
+        raise
+    metrics.observe("upload.bytes", upload.size)
+    return upload
+
+
+class _BodyTooLarge(Exception):
+    pass
+
+
+class UploadLimitMiddleware:
+    """
+    ASGI middleware answering 413 for request bodies over ``max_bytes`` on
+    ``paths``, without reading more of the body than the limit.
+    """
+
+    def __init__(self, app, paths: Iterable[str], max_bytes: Optional[int] = None):
+        self.app = app
+        self.paths = set(paths)
+        self.max_bytes = max_upload_bytes() if max_bytes is None else max_bytes
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http" or scope["path"] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get("headers") or [])
+        try:
+            declared = int(headers.get(b"content-length", b"0"))
+        except ValueError:
+            declared = 0
+        if declared > self.max_bytes:
+            await self._reject(send)
+            return
+
+        received = 0
+        exceeded = False
+        started = False
+
+        async def limited_receive():
+            nonlocal received, exceeded
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    exceeded = True
+                    raise _BodyTooLarge()
+            return message
+
+        async def guarded_send(message) -> None:
+            nonlocal started
+            # The app turns the aborted body into its own error; replace it
+            if exceeded:
+                return
+            started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, guarded_send)
+        except _BodyTooLarge:
+            pass
+        if exceeded and not started:
+            await self._reject(send)
+
+    async def _reject(self, send) -> None:
+        metrics.incr("upload.rejected")
+        body = dumps({"detail": f"Upload exceeds the {self.max_bytes} byte limit"})
+        await send({
+            "type": "http.response.start",
+            "status": 413,
+            "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+        })
+        await send({"type": "http.response.body", "body": body})
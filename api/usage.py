@@ -0,0 +1,314 @@
+"""
+Usage and cost accounting per request, sender, endpoint and deployment.
+
+Each request, webhook job or voice turn runs inside a ``scope`` naming its
+endpoint and sender. Upstream calls report what they consumed with
+``record``: prompt/completion/cached tokens per chat deployment, embedding
+tokens, audio seconds sent to STT and synthesized by TTS, TTS characters
+and search calls, plus answers served without an LLM call (FAQ store,
+answer cache, intent router). When the scope ends its totals become
+per-request histograms in ``/metrics`` (``usage.request.*``) and are added
+to a ``UsageStore``: time buckets of ``USAGE_BUCKET_SECONDS`` kept for
+``USAGE_RETENTION_HOURS``, aggregated by sender, endpoint and deployment
+and queried through ``/admin/usage``. Only requests that recorded
+something are counted in ``requests``. Closed buckets are appended to
+``USAGE_LOG_PATH`` (JSONL) when set, so several workers or restarts can be
+summed offline.
+
+Costs use ``USAGE_PRICES`` (inline JSON or a file path), e.g.::
+
+    {"llm": {"gpt-4o": {"prompt": 2.5, "cached": 1.25, "completion": 10}},
+     "stt_minute": 0.006, "tts_1m_chars": 15, "search_1k": 0}
+
+with token prices per million tokens. Without prices ``cost`` stays 0.
+Batched embedding calls are charged to the request that opened the batch.
+"""
+
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator, Optional
+
+from . import metrics
+from .forwarding import client_header, client_ip
+from .serialization import dumps_str
+
+
+SENDER = "sender"
+ENDPOINT = "endpoint"
+DEPLOYMENT = "deployment"
+DIMENSIONS = (SENDER, ENDPOINT, DEPLOYMENT)
+
+
+def load_prices() -> dict:
+    raw = os.getenv("USAGE_PRICES", "").strip()
+    if not raw:
+        return {}
+    try:
+        if not raw.startswith("{"):
+            with open(raw, "r", encoding="utf-8") as f:
+                raw = f.read()
+        return json.loads(raw)
+    except Exception as e:
+        print(f"Warning: Could not load USAGE_PRICES: {e}")
+        return {}
+
+
+class UsageScope:
+    """Running totals of one request, job or voice turn."""
+
+    def __init__(self, endpoint: str, sender: Optional[str]):
+        self.endpoint = endpoint
+        self.sender = sender or "anonymous"
+        self.totals: dict[str, float] = {}
+        self.deployments: dict[str, dict[str, float]] = {}
+
+    def add(self, amounts: dict[str, float], deployment: Optional[str] = None) -> None:
+        for field, value in amounts.items():
+            if value:
+                self.totals[field] = self.totals.get(field, 0) + value
+        if deployment:
+            per = self.deployments.setdefault(deployment, {})
+            for field, value in amounts.items():
+                if value:
+                    per[field] = per.get(field, 0) + value
+
+
+def _merge(target: dict[str, float], amounts: dict[str, float]) -> None:
+    for field, value in amounts.items():
+        target[field] = target.get(field, 0) + value
+
+
+def _rounded(amounts: dict[str, float]) -> dict[str, float]:
+    return {field: round(value, 6) for field, value in amounts.items()}
+
+
+class UsageStore:
+    """
+    Time-bucketed usage aggregates for this worker.
+
+    Args:
+        bucket_seconds: Width of one bucket
+        retention_seconds: Buckets older than this are dropped (and logged)
+        max_senders: Distinct senders per bucket before the rest are folded
+            into ``"other"``
+        log_path: JSONL file receiving each bucket as it closes
+    """
+
+    def __init__(
+        self,
+        bucket_seconds: int = 300,
+        retention_seconds: int = 72 * 3600,
+        max_senders: int = 10000,
+        log_path: Optional[str] = None,
+    ):
+        self.bucket_seconds = bucket_seconds
+        self.retention_seconds = retention_seconds
+        self.max_senders = max_senders
+        self.log_path = log_path
+        self._lock = threading.Lock()
+        # bucket start -> dimension -> key -> field -> value
+        self._buckets: OrderedDict[int, dict[str, dict[str, dict[str, float]]]] = OrderedDict()
+        self._logged = 0
+
+    def _bucket(self, now: float) -> dict:
+        start = int(now // self.bucket_seconds * self.bucket_seconds)
+        bucket = self._buckets.get(start)
+        if bucket is None:
+            bucket = self._buckets[start] = {dimension: {} for dimension in DIMENSIONS}
+            self._expire(now)
+        return bucket
+
+    def _expire(self, now: float) -> None:
+        closed = [start for start in self._buckets if start + self.bucket_seconds <= now]
+        if self.log_path:
+            self._write([(start, self._buckets[start]) for start in closed if start > self._logged])
+            if closed:
+                self._logged = max(self._logged, closed[-1])
+        for start in closed:
+            if start + self.retention_seconds > now:
+                break
+            del self._buckets[start]
+
+    def _write(self, buckets: list[tuple[int, dict]]) -> None:
+        if not buckets:
+            return
+        try:
+            with open(self.log_path, "a", encoding="utf-8") as f:
+                for start, bucket in buckets:
+                    f.write(dumps_str({"bucket": start, "seconds": self.bucket_seconds, **bucket}) + "\n")
+        except OSError as e:
+            print(f"Usage log write error: {e}")
+
+    def add(self, scope: UsageScope, now: Optional[float] = None) -> None:
+        totals = {**scope.totals, "requests": 1}
+        with self._lock:
+            bucket = self._bucket(time.time() if now is None else now)
+            senders = bucket[SENDER]
+            sender = scope.sender
+            if sender not in senders and len(senders) >= self.max_senders:
+                sender = "other"
+            _merge(senders.setdefault(sender, {}), totals)
+            _merge(bucket[ENDPOINT].setdefault(scope.endpoint, {}), totals)
+            for deployment, amounts in scope.deployments.items():
+                _merge(bucket[DEPLOYMENT].setdefault(deployment, {}), amounts)
+
+    def flush(self) -> None:
+        """Log every bucket not yet written (at shutdown)."""
+        if not self.log_path:
+            return
+        with self._lock:
+            self._write([(start, bucket) for start, bucket in self._buckets.items() if start > self._logged])
+            if self._buckets:
+                self._logged = next(reversed(self._buckets))
+
+    def query(
+        self,
+        by: str = ENDPOINT,
+        since: Optional[float] = None,
+        until: Optional[float] = None,
+        top: int = 50,
+        key: Optional[str] = None,
+        timeline: bool = False,
+    ) -> dict:
+        """
+        Aggregate buckets overlapping ``[since, until)``.
+
+        Args:
+            by: ``sender``, ``endpoint`` or ``deployment``
+            since: Unix time; defaults to everything retained
+            until: Unix time; defaults to now
+            top: Rows to return, largest cost (then tokens) first
+            key: Only this sender/endpoint/deployment
+            timeline: Also return per-bucket totals for the selection
+        """
+        since = 0 if since is None else since
+        until = time.time() if until is None else until
+        rows: dict[str, dict[str, float]] = {}
+        series = []
+        with self._lock:
+            for start, bucket in self._buckets.items():
+                if start + self.bucket_seconds <= since or start >= until:
+                    continue
+                bucket_total: dict[str, float] = {}
+                for name, amounts in bucket[by].items():
+                    if key is not None and name != key:
+                        continue
+                    _merge(rows.setdefault(name, {}), amounts)
+                    _merge(bucket_total, amounts)
+                if timeline and bucket_total:
+                    series.append({"bucket": start, **_rounded(bucket_total)})
+        total: dict[str, float] = {}
+        for amounts in rows.values():
+            _merge(total, amounts)
+        ranked = sorted(
+            rows.items(),
+            key=lambda item: (item[1].get("cost", 0), item[1].get("prompt_tokens", 0)),
+            reverse=True,
+        )
+        result = {
+            "by": by,
+            "since": since,
+            "until": until,
+            "bucket_seconds": self.bucket_seconds,
+            "keys": len(rows),
+            "total": _rounded(total),
+            "rows": [{"key": name, **_rounded(amounts)} for name, amounts in ranked[:top]],
+        }
+        if timeline:
+            result["timeline"] = series
+        return result
+
+
+_scope: ContextVar[Optional[UsageScope]] = ContextVar("usage_scope", default=None)
+_prices: Optional[dict] = None
+_store: Optional[UsageStore] = None
+
+
+def get_usage_store() -> UsageStore:
+    global _store
+    if _store is None:
+        _store = UsageStore(
+            bucket_seconds=int(os.getenv("USAGE_BUCKET_SECONDS", "300")),
+            retention_seconds=int(float(os.getenv("USAGE_RETENTION_HOURS", "72")) * 3600),
+            max_senders=int(os.getenv("USAGE_MAX_SENDERS", "10000")),
+            log_path=os.getenv("USAGE_LOG_PATH") or None,
+        )
+    return _store
+
+
+def _cost(amounts: dict[str, float], deployment: Optional[str]) -> float:
+    global _prices
+    if _prices is None:
+        _prices = load_prices()
+    if not _prices:
+        return 0.0
+    price = (_prices.get("llm") or {}).get(deployment or "") or {}
+    cached = amounts.get("cached_tokens", 0)
+    cost = (amounts.get("prompt_tokens", 0) - cached) * price.get("prompt", 0) / 1e6
+    cost += cached * price.get("cached", price.get("prompt", 0)) / 1e6
+    cost += amounts.get("completion_tokens", 0) * price.get("completion", 0) / 1e6
+    cost += amounts.get("embedding_tokens", 0) * price.get("prompt", 0) / 1e6
+    cost += amounts.get("stt_seconds", 0) / 60 * _prices.get("stt_minute", 0)
+    cost += amounts.get("tts_chars", 0) * _prices.get("tts_1m_chars", 0) / 1e6
+    cost += amounts.get("search_calls", 0) * _prices.get("search_1k", 0) / 1000
+    return cost
+
+
+def record(deployment: Optional[str] = None, **amounts: float) -> None:
+    """
+    Charge ``amounts`` (and their cost) to the current scope.
+
+    Outside any scope the usage is stored on its own as endpoint
+    ``background``.
+    """
+    cost = _cost(amounts, deployment)
+    if cost:
+        amounts["cost"] = cost
+    current = _scope.get()
+    if current is None:
+        current = UsageScope("background", None)
+        current.add(amounts, deployment)
+        get_usage_store().add(current)
+        return
+    current.add(amounts, deployment)
+
+
+@contextmanager
+def scope(endpoint: str, sender: Optional[str]) -> Iterator[UsageScope]:
+    """Account everything recorded in the block to ``endpoint`` and ``sender``."""
+    current = UsageScope(endpoint, sender)
+    token = _scope.set(current)
+    try:
+        yield current
+    finally:
+        _scope.reset(token)
+        if current.totals:
+            get_usage_store().add(current)
+            for field in ("prompt_tokens", "completion_tokens", "stt_seconds", "tts_seconds", "cost"):
+                if field in current.totals:
+                    metrics.observe(f"usage.request.{field}", current.totals[field])
+
+
+class UsageMiddleware:
+    """ASGI middleware opening a usage scope per HTTP request (sender is the client IP, see ``api.forwarding``)."""
+
+    def __init__(self, app, skip: tuple[str, ...] = ("/metrics", "/health", "/admin")):
+        self.app = app
+        self.skip = skip
+
+    async def __call__(self, scope_, receive, send) -> None:
+        if scope_["type"] != "http" or scope_["path"].startswith(self.skip):
+            await self.app(scope_, receive, send)
+            return
+        client = scope_.get("client")
+        header = client_header().encode("latin-1")
+        forwarded = next((value.decode("latin-1") for name, value in scope_["headers"] if name == header), None)
+        address = client_ip(client[0] if client else None, forwarded)
+        sender = f"ip:{address}" if address else None
+        with scope(f"{scope_['method']} {scope_['path']}", sender):
+            await self.app(scope_, receive, send)
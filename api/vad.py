@@ -0,0 +1,181 @@
+"""
+Energy-based voice activity detection.
+
+Works on mono 16-bit PCM. Frames are classified as speech when their
+energy clears both an absolute floor and an adaptive margin above the
+clip's noise floor; clips whose energy barely varies (hiss, hum, fan
+noise) are treated as noise-only regardless of level.
+"""
+
+import numpy as np
+
+
+def frame_energies(samples: np.ndarray, sample_rate: int, frame_ms: int = 30) -> np.ndarray:
+    """Per-frame RMS level in dBFS."""
+    frame = max(1, sample_rate * frame_ms // 1000)
+    count = len(samples) // frame
+    if count == 0:
+        return np.zeros(0, dtype=np.float32)
+    frames = samples[: count * frame].astype(np.float32).reshape(count, frame) / 32768.0
+    rms = np.sqrt(np.mean(frames * frames, axis=1))
+    return 20 * np.log10(np.maximum(rms, 1e-6))
+
+
+def analyze_speech(
+    samples: np.ndarray,
+    sample_rate: int,
+    frame_ms: int = 30,
+    floor_db: float = -45.0,
+    margin_db: float = 12.0,
+    min_dynamic_db: float = 8.0,
+    hangover_frames: int = 8,
+) -> dict:
+    """
+    Locate speech in a clip.
+
+    Args:
+        samples: Mono int16 PCM
+        sample_rate: Samples per second
+        frame_ms: Analysis frame length
+        floor_db: Absolute level below which a frame is silence
+        margin_db: Required level above the estimated noise floor
+        min_dynamic_db: Minimum spread between loud and quiet frames for the
+            clip to contain speech at all
+        hangover_frames: Frames kept after speech to bridge short pauses
+
+    Returns:
+        Dict with ``duration``, ``speech_seconds``, ``speech_ratio`` and the
+        ``start``/``end`` of detected speech in seconds
+    """
+    duration = len(samples) / sample_rate if sample_rate else 0.0
+    energies = frame_energies(samples, sample_rate, frame_ms)
+    empty = {"duration": duration, "speech_seconds": 0.0, "speech_ratio": 0.0, "start": 0.0, "end": 0.0}
+    if len(energies) == 0:
+        return empty
+
+    noise_floor = float(np.percentile(energies, 10))
+    loud = float(np.percentile(energies, 90))
+    if loud - noise_floor < min_dynamic_db:
+        return empty
+
+    threshold = max(floor_db, noise_floor + margin_db)
+    active = energies > threshold
+    if hangover_frames and active.any():
+        # Extend each active frame forward to bridge pauses between words.
+        kernel = np.ones(hangover_frames + 1, dtype=np.int32)
+        active = np.convolve(active.astype(np.int32), kernel)[: len(active)] > 0
+
+    indices = np.flatnonzero(active)
+    if len(indices) == 0:
+        return empty
+    seconds_per_frame = frame_ms / 1000
+    speech_seconds = float(active.sum()) * seconds_per_frame
+    return {
+        "duration": duration,
+        "speech_seconds": speech_seconds,
+        "speech_ratio": speech_seconds / duration if duration else 0.0,
+        "start": float(indices[0]) * seconds_per_frame,
+        "end": min(duration, float(indices[-1] + 1) * seconds_per_frame),
+    }
+
+
+class StreamingVAD:
+    """
+    Incremental voice-activity detector for live mono int16 PCM.
+
+    ``feed`` returns ``(event, sample_offset)`` pairs: ``"start"`` when speech
+    begins, ``"pause"`` after a short gap inside an utterance (a good point
+    to transcribe what came before) and ``"end"`` once the speaker has been
+    silent for ``end_ms`` or the utterance reaches ``max_utterance_ms``.
+    Offsets count samples from the start of the stream.
+
+    Args:
+        sample_rate: Samples per second
+        frame_ms: Analysis frame length
+        floor_db: Absolute level below which a frame is silence
+        margin_db: Required level above the running noise floor
+        start_ms: Voiced time needed before speech counts as started
+        pause_ms: Silence that marks a segment boundary
+        end_ms: Silence that ends the utterance
+        max_utterance_ms: Upper bound on one utterance
+    """
+
+    def __init__(
+        self,
+        sample_rate: int = 16000,
+        frame_ms: int = 30,
+        floor_db: float = -45.0,
+        margin_db: float = 12.0,
+        start_ms: int = 150,
+        pause_ms: int = 300,
+        end_ms: int = 600,
+        max_utterance_ms: int = 30000,
+    ):
+        self.sample_rate = sample_rate
+        self.frame_ms = frame_ms
+        self.frame = max(1, sample_rate * frame_ms // 1000)
+        self.floor_db = floor_db
+        self.margin_db = margin_db
+        self.start_frames = max(1, start_ms // frame_ms)
+        self.pause_frames = max(1, pause_ms // frame_ms)
+        self.end_frames = max(self.pause_frames + 1, end_ms // frame_ms)
+        self.max_frames = max(1, max_utterance_ms // frame_ms)
+        self.noise_db: float | None = None
+        self.in_speech = False
+        self.position = 0
+        self.last_voiced = 0
+        self._pending = b""
+        self._voiced_run = 0
+        self._silent_run = 0
+        self._paused = False
+        self._utterance_frames = 0
+
+    def feed(self, pcm: bytes) -> list[tuple[str, int]]:
+        data = self._pending + pcm
+        frame_bytes = self.frame * 2
+        usable = len(data) - len(data) % frame_bytes
+        self._pending = data[usable:]
+        if not usable:
+            return []
+        samples = np.frombuffer(data[:usable], dtype=np.int16)
+        events = []
+        for level in frame_energies(samples, self.sample_rate, self.frame_ms):
+            events.extend(self._step(float(level)))
+            self.position += self.frame
+        return events
+
+    def _step(self, level: float) -> list[tuple[str, int]]:
+        if self.noise_db is None:
+            self.noise_db = level
+        voiced = level > max(self.floor_db, self.noise_db + self.margin_db)
+        if not voiced:
+            # Track the background level only from non-speech frames
+            self.noise_db = 0.95 * self.noise_db + 0.05 * level
+        else:
+            self.last_voiced = self.position + self.frame
+
+        if not self.in_speech:
+            self._voiced_run = self._voiced_run + 1 if voiced else 0
+            if self._voiced_run >= self.start_frames:
+                self.in_speech = True
+                self._silent_run = 0
+                self._paused = False
+                self._utterance_frames = self._voiced_run
+                return [("start", self.position + self.frame - self._voiced_run * self.frame)]
+            return []
+
+        self._utterance_frames += 1
+        if voiced:
+            self._silent_run = 0
+            self._paused = False
+        else:
+            self._silent_run += 1
+        silence_start = self.position + self.frame - self._silent_run * self.frame
+        if self._silent_run >= self.end_frames or self._utterance_frames >= self.max_frames:
+            self.in_speech = False
+            self._voiced_run = 0
+            return [("end", silence_start if self._silent_run else self.position + self.frame)]
+        if not self._paused and self._silent_run >= self.pause_frames:
+            self._paused = True
+            return [("pause", silence_start)]
+        return []
@@ -0,0 +1,251 @@
+"""
+Full-duplex voice conversations over a WebSocket.
+
+The browser streams 16 kHz mono int16 PCM as binary frames. A streaming VAD
+(``api.vad.StreamingVAD``) splits each utterance at short pauses, and every
+finished segment is transcribed in the background while the user keeps
+talking, so at end-of-utterance only the last segment is still waiting on
+STT. The transcript is answered and the reply is synthesized sentence by
+sentence, with TTS audio streamed back as binary frames as it arrives. Speech
+detected while a reply is in progress (barge-in) cancels the reply.
+
+Server -> client messages are JSON text frames (``ready``, ``listening``,
+``partial``, ``transcript``, ``answer``, ``audio_start``, ``audio_end``,
+``done``, ``interrupted``, ``error``) plus binary audio frames belonging to
+the most recent ``audio_start`` segment. The client may send
+``{"type": "interrupt"}`` or ``{"type": "text", "text": ...}``; text
+frames that are not a JSON object get an ``error`` reply and are ignored.
+"""
+
+import asyncio
+import os
+import re
+import time
+from typing import AsyncIterator, Awaitable, Callable, Optional
+
+from fastapi import WebSocket, WebSocketDisconnect
+
+from . import metrics
+from .audio import STT_SAMPLE_RATE, pcm_to_wav
+from .serialization import dumps_str, loads
+from .vad import StreamingVAD
+
+
+Transcriber = Callable[[bytes], Awaitable[str]]
+Answerer = Callable[[str], Awaitable[str]]
+Synthesizer = Callable[[str], AsyncIterator[bytes]]
+
+_SENTENCE_END = re.compile(r"(?<=[.!?۔])\s+|\n+")
+_BYTES_PER_SAMPLE = 2
+
+
+def split_for_speech(text: str, first_chars: int = 80, max_chars: int = 320) -> list[str]:
+    """
+    Split an answer into TTS chunks at sentence boundaries.
+
+    The first chunk is kept short so the first audio arrives quickly; later
+    chunks are larger to limit the number of TTS round trips.
+    """
+    chunks: list[str] = []
+    current = ""
+    for sentence in _SENTENCE_END.split(text or ""):
+        sentence = sentence.strip()
+        if not sentence:
+            continue
+        limit = first_chars if not chunks else max_chars
+        if current and len(current) + len(sentence) + 1 > limit:
+            chunks.append(current)
+            current = sentence
+        else:
+            current = f"{current} {sentence}".strip()
+        if not chunks and len(current) >= first_chars:
+            chunks.append(current)
+            current = ""
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def _vad_from_env() -> StreamingVAD:
+    return StreamingVAD(
+        sample_rate=STT_SAMPLE_RATE,
+        pause_ms=int(os.getenv("VOICE_PAUSE_MS", "300")),
+        end_ms=int(os.getenv("VOICE_END_SILENCE_MS", "600")),
+        max_utterance_ms=int(os.getenv("VOICE_MAX_UTTERANCE_MS", "30000")),
+    )
+
+
+class VoiceSession:
+    """
+    State for one ``/voice`` connection.
+
+    Args:
+        websocket: Accepted WebSocket
+        transcribe: Coroutine turning WAV bytes into text
+        answer: Coroutine answering a transcript
+        synthesize: Async generator of audio chunks for a piece of text
+        audio_format: Content type of the synthesized audio
+    """
+
+    def __init__(
+        self,
+        websocket: WebSocket,
+        transcribe: Transcriber,
+        answer: Answerer,
+        synthesize: Synthesizer,
+        audio_format: str,
+    ):
+        self.websocket = websocket
+        self.transcribe = transcribe
+        self.answer = answer
+        self.synthesize = synthesize
+        self.audio_format = audio_format
+        self.vad = _vad_from_env()
+        self.preroll = int(STT_SAMPLE_RATE * int(os.getenv("VOICE_PREROLL_MS", "200")) / 1000)
+        self._audio = bytearray()
+        self._audio_start = 0
+        self._segment_start = 0
+        self._segments: list[asyncio.Task] = []
+        self._response: Optional[asyncio.Task] = None
+        self._send_lock = asyncio.Lock()
+
+    async def run(self) -> None:
+        await self._send({"type": "ready", "sample_rate": STT_SAMPLE_RATE, "format": self.audio_format})
+        metrics.incr("voice.sessions")
+        try:
+            while True:
+                message = await self.websocket.receive()
+                if message["type"] == "websocket.disconnect":
+                    break
+                if message.get("bytes"):
+                    await self._on_audio(message["bytes"])
+                elif message.get("text"):
+                    try:
+                        control = loads(message["text"])
+                    except ValueError:
+                        control = None
+                    if not isinstance(control, dict):
+                        metrics.incr("voice.bad_control")
+                        await self._send({"type": "error", "detail": "Control frames must be JSON objects"})
+                        continue
+                    await self._on_control(control)
+        except WebSocketDisconnect:
+            pass
+        finally:
+            self._cancel_response()
+            self._cancel_segments()
+
+    # ---------------------------------------------------------------- input
+
+    async def _on_control(self, message: dict) -> None:
+        kind = message.get("type")
+        if kind == "interrupt":
+            await self._interrupt()
+        elif kind == "text" and str(message.get("text") or "").strip():
+            await self._interrupt()
+            self._start_response([], str(message["text"]).strip(), time.perf_counter())
+
+    async def _on_audio(self, pcm: bytes) -> None:
+        self._audio += pcm
+        for event, offset in self.vad.feed(pcm):
+            if event == "start":
+                # Barge-in: the user talks over the reply
+                await self._interrupt()
+                self._segment_start = max(self._audio_start, offset - self.preroll)
+                # Segments of an utterance that never ended are not transcribed
+                self._cancel_segments()
+                await self._send({"type": "listening"})
+            elif event == "pause":
+                self._cut_segment(offset)
+            elif event == "end":
+                self._cut_segment(offset)
+                segments, self._segments = self._segments, []
+                if segments:
+                    self._start_response(segments, None, time.perf_counter())
+        if not self.vad.in_speech:
+            self._trim()
+
+    def _cut_segment(self, end: int) -> None:
+        start, self._segment_start = self._segment_start, end
+        if end - start < self.vad.frame * self.vad.start_frames:
+            return
+        begin = (start - self._audio_start) * _BYTES_PER_SAMPLE
+        pcm = bytes(self._audio[max(0, begin):(end - self._audio_start) * _BYTES_PER_SAMPLE])
+        metrics.incr("voice.segments")
+        self._segments.append(asyncio.create_task(self._transcribe_segment(pcm)))
+
+    def _cancel_segments(self) -> None:
+        for task in self._segments:
+            task.cancel()
+        self._segments = []
+
+    async def _transcribe_segment(self, pcm: bytes) -> str:
+        with metrics.timer("voice.segment_stt_ms"):
+            text = await self.transcribe(pcm_to_wav(pcm, STT_SAMPLE_RATE))
+        text = (text or "").strip()
+        if text:
+            await self._send({"type": "partial", "text": text})
+        return text
+
+    def _trim(self) -> None:
+        # Outside an utterance only the pre-roll needs to be kept
+        keep = self.preroll * _BYTES_PER_SAMPLE
+        if len(self._audio) > 4 * keep:
+            drop = len(self._audio) - keep
+            del self._audio[:drop]
+            self._audio_start += drop // _BYTES_PER_SAMPLE
+
+    # --------------------------------------------------------------- output
+
+    def _start_response(self, segments: list[asyncio.Task], text: Optional[str], ended_at: float) -> None:
+        self._response = asyncio.create_task(self._respond(segments, text, ended_at))
+
+    def _cancel_response(self) -> bool:
+        if self._response and not self._response.done():
+            self._response.cancel()
+            return True
+        return False
+
+    async def _interrupt(self) -> None:
+        if self._cancel_response():
+            metrics.incr("voice.barge_in")
+            await self._send({"type": "interrupted"})
+
+    async def _respond(self, segments: list[asyncio.Task], text: Optional[str], ended_at: float) -> None:
+        try:
+            if text is None:
+                parts = await asyncio.gather(*segments)
+                text = " ".join(part for part in parts if part).strip()
+                metrics.observe("voice.stt_tail_ms", (time.perf_counter() - ended_at) * 1000)
+                if not text:
+                    await self._send({"type": "transcript", "text": ""})
+                    return
+            await self._send({"type": "transcript", "text": text})
+            answer = await self.answer(text)
+            await self._send({"type": "answer", "text": answer})
+
+            first_audio = True
+            for index, chunk in enumerate(split_for_speech(answer)):
+                await self._send({"type": "audio_start", "segment": index, "format": self.audio_format})
+                async for data in self.synthesize(chunk):
+                    if first_audio:
+                        first_audio = False
+                        metrics.observe("voice.time_to_first_audio_ms", (time.perf_counter() - ended_at) * 1000)
+                    async with self._send_lock:
+                        await self.websocket.send_bytes(data)
+                await self._send({"type": "audio_end", "segment": index})
+            await self._send({"type": "done"})
+        except asyncio.CancelledError:
+            for task in segments:
+                task.cancel()
+            raise
+        except Exception as exc:
+            print(f"Voice response error: {exc}")
+            await self._send({"type": "error", "detail": str(exc)})
+
+    async def _send(self, message: dict) -> None:
+        async with self._send_lock:
+            try:
+                await self.websocket.send_text(dumps_str(message))
+            except (RuntimeError, WebSocketDisconnect):
+                pass
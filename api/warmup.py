@@ -0,0 +1,104 @@
+"""
+Startup warm-up and readiness.
+
+Right after a deploy every upstream connection, client and cache is cold,
+so the first requests pay for DNS, TLS handshakes, process-pool spawns and
+tokenizer loads. ``Warmup`` runs named steps concurrently in the
+background from the app's lifespan (so ``/health`` liveness answers at
+once) and ``/ready`` stays 503 until they have finished or
+``WARMUP_TIMEOUT_SECONDS`` has passed. A failed step is reported but does
+not hold readiness back: an upstream outage is not fixed by keeping every
+instance out of the load balancer.
+"""
+
+import asyncio
+import os
+import time
+from typing import Awaitable, Callable, Optional
+
+from . import metrics, usage
+
+
+Step = Callable[[], Awaitable[object]]
+
+
+def warmup_enabled() -> bool:
+    return os.getenv("WARMUP", "1").strip().lower() not in {"0", "false", "no"}
+
+
+class Warmup:
+    """
+    Named warm-up steps and the resulting readiness state.
+
+    Args:
+        steps: ``{name: coroutine function}``; each result (if any) is
+            reported as the step's detail
+        timeout: Seconds before the app is declared ready regardless
+    """
+
+    def __init__(self, steps: dict[str, Step], timeout: float = 30.0):
+        self.steps = steps
+        self.timeout = timeout
+        self.ready = False
+        self.started_at: Optional[float] = None
+        self.seconds: Optional[float] = None
+        self.results: dict[str, dict] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    async def _step(self, name: str, step: Step) -> None:
+        started = time.perf_counter()
+        try:
+            detail = await step()
+            self.results[name] = {"ok": True}
+            if detail is not None:
+                self.results[name]["detail"] = detail
+        except Exception as e:
+            print(f"Warm-up step {name} failed: {e}")
+            self.results[name] = {"ok": False, "error": str(e)}
+        elapsed = (time.perf_counter() - started) * 1000
+        self.results[name]["ms"] = round(elapsed, 1)
+        metrics.observe(f"warmup.{name}_ms", elapsed)
+
+    async def run(self) -> None:
+        started = time.perf_counter()
+        self.started_at = time.time()
+        # Upstream spend during warm-up is accounted on its own
+        with usage.scope("warmup", "warmup"):
+            pending = [asyncio.create_task(self._step(name, step)) for name, step in self.steps.items()]
+            if pending:
+                done, not_done = await asyncio.wait(pending, timeout=self.timeout)
+                for task in not_done:
+                    task.cancel()
+                for name in self.steps:
+                    self.results.setdefault(name, {"ok": False, "error": "timed out"})
+        self.seconds = round(time.perf_counter() - started, 2)
+        metrics.observe("warmup.total_ms", self.seconds * 1000)
+        self.ready = True
+        failed = [name for name, result in self.results.items() if not result["ok"]]
+        print(f"Warm-up finished in {self.seconds} s" + (f" (failed: {', '.join(failed)})" if failed else ""))
+
+    def start(self) -> None:
+        """Run the steps in the background; ready at once when warm-up is disabled."""
+        if not warmup_enabled() or not self.steps:
+            self.ready = True
+            return
+        self._task = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        if self._task and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    def report(self) -> dict:
+        return {
+            "ready": self.ready,
+            "seconds": self.seconds,
+            "steps": self.results,
+        }
+
+
+def create_warmup(steps: dict[str, Step]) -> Warmup:
+    return Warmup(steps, timeout=float(os.getenv("WARMUP_TIMEOUT_SECONDS", "30")))
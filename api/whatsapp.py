@@ -1,24 +1,21 @@
 import os
 import secrets
-import time
 from typing import Any
 
 import httpx
 
-
-_AUDIO_TTL_SECONDS = 5 * 60
-_audio_store: dict[str, dict[str, Any]] = {}
+from . import health
+from .clients import pooled
+from .serialization import JSON_HEADERS, dumps, loads
+from .state import namespace
 
 
-def _now() -> float:
-  return time.time()
+_AUDIO_TTL_SECONDS = 5 * 60
 
 
-def _cleanup_store() -> None:
-  now = _now()
-  expired = [key for key, item in _audio_store.items() if item["expires_at"] <= now]
-  for key in expired:
-    _audio_store.pop(key, None)
+def _media_store():
+  # Shared across workers so Meta can fetch /media/{id} from any of them.
+  return namespace("media")
 
 
 def require_env(name: str) -> str:
@@ -30,7 +27,8 @@ def require_env(name: str) -> str:
 
 def graph_base() -> str:
   version = os.getenv("META_API_VERSION") or os.getenv("VERSION") or "v20.0"
-  return f"https://graph.facebook.com/{version}"
+  host = (os.getenv("GRAPH_API_BASE") or "https://graph.facebook.com").rstrip("/")
+  return f"{host}/{version}"
 
 
 def base_url() -> str:
@@ -52,26 +50,18 @@ def app_access_token() -> str:
   return f"{app_id}|{app_secret}"
 
 
-def save_audio(buffer: bytes, content_type: str) -> str:
-  _cleanup_store()
+async def save_audio(buffer: bytes, content_type: str) -> str:
   media_id = secrets.token_hex(16)
-  _audio_store[media_id] = {
-    "buffer": buffer,
-    "content_type": content_type,
-    "expires_at": _now() + _AUDIO_TTL_SECONDS,
-  }
+  await _media_store().set(media_id, content_type.encode("ascii") + b"\n" + buffer, _AUDIO_TTL_SECONDS)
   return media_id
 
 
-def get_audio(media_id: str) -> dict[str, Any] | None:
-  _cleanup_store()
-  item = _audio_store.get(media_id)
-  if not item:
+async def get_audio(media_id: str) -> dict[str, Any] | None:
+  raw = await _media_store().get(media_id)
+  if not raw:
     return None
-  if item["expires_at"] <= _now():
-    _audio_store.pop(media_id, None)
-    return None
-  return item
+  content_type, _, buffer = raw.partition(b"\n")
+  return {"buffer": buffer, "content_type": content_type.decode("ascii")}
 
 
 def _iter_messages(payload: dict) -> list[dict[str, Any]]:
@@ -98,6 +88,7 @@ def parse_message(payload: dict) -> dict[str, str] | None:
       if not media_id:
         continue
       return {
+        "id": message.get("id") or "",
         "from": sender,
         "type": "audio",
         "media_id": media_id,
@@ -108,36 +99,43 @@ def parse_message(payload: dict) -> dict[str, str] | None:
       text = (message.get("text") or {}).get("body") or ""
       if not text.strip():
         continue
-      return {"from": sender, "type": "text", "text": text}
+      return {"id": message.get("id") or "", "from": sender, "type": "text", "text": text}
 
     if msg_type == "button":
       text = (message.get("button") or {}).get("text") or ""
       if text.strip():
-        return {"from": sender, "type": "text", "text": text}
+        return {"id": message.get("id") or "", "from": sender, "type": "text", "text": text}
 
     if msg_type == "interactive":
       interactive = message.get("interactive") or {}
       reply = interactive.get("button_reply") or interactive.get("list_reply") or {}
       title = reply.get("title") or ""
       if title.strip():
-        return {"from": sender, "type": "text", "text": title}
+        return {"id": message.get("id") or "", "from": sender, "type": "text", "text": title}
 
   return None
 
 
+def probe_target() -> tuple[str, dict]:
+  """Cheap authenticated Graph request for the health prober: the phone number's id."""
+  return f"{graph_base()}/{require_env('PHONE_NUMBER_ID')}?fields=id", auth_header()
+
+
+@health.watched(health.GRAPH, guard=False)
 async def download_media(media_id: str) -> bytes:
-  async with httpx.AsyncClient(timeout=120) as client:
-    meta = await client.get(f"{graph_base()}/{media_id}", headers=auth_header())
+  async with pooled("graph") as client:
+    meta = await client.get(f"{graph_base()}/{media_id}", headers=auth_header(), timeout=120)
     meta.raise_for_status()
-    media_url = meta.json().get("url")
+    media_url = loads(meta.content).get("url")
     if not media_url:
       raise RuntimeError("WhatsApp media metadata missing URL")
 
-    file = await client.get(media_url, headers=auth_header())
+    file = await client.get(media_url, headers=auth_header(), timeout=120)
     file.raise_for_status()
     return file.content
 
 
+@health.watched(health.GRAPH, guard=False)
 async def reply_text(to_number: str, text: str) -> None:
   payload = {
     "messaging_product": "whatsapp",
@@ -145,8 +143,8 @@ async def reply_text(to_number: str, text: str) -> None:
     "type": "text",
     "text": {"body": text},
   }
-  async with httpx.AsyncClient(timeout=30) as client:
-    r = await client.post(message_url(), json=payload, headers=auth_header())
+  async with pooled("graph") as client:
+    r = await client.post(message_url(), content=dumps(payload), headers={**auth_header(), **JSON_HEADERS}, timeout=30)
     try:
       r.raise_for_status()
     except httpx.HTTPStatusError as exc:
@@ -154,8 +152,9 @@ async def reply_text(to_number: str, text: str) -> None:
       raise RuntimeError(f"WhatsApp reply_text failed: {detail}") from exc
 
 
+@health.watched(health.GRAPH, guard=False)
 async def reply_audio(to_number: str, audio_buffer: bytes, content_type: str) -> None:
-  media_id = save_audio(audio_buffer, content_type)
+  media_id = await save_audio(audio_buffer, content_type)
   media_url = f"{base_url()}/media/{media_id}"
   payload = {
     "messaging_product": "whatsapp",
@@ -163,8 +162,8 @@ async def reply_audio(to_number: str, audio_buffer: bytes, content_type: str) ->
     "type": "audio",
     "audio": {"link": media_url},
   }
-  async with httpx.AsyncClient(timeout=30) as client:
-    r = await client.post(message_url(), json=payload, headers=auth_header())
+  async with pooled("graph") as client:
+    r = await client.post(message_url(), content=dumps(payload), headers={**auth_header(), **JSON_HEADERS}, timeout=30)
     try:
       r.raise_for_status()
     except httpx.HTTPStatusError as exc:
@@ -177,10 +176,10 @@ async def debug_access_token() -> dict:
     "input_token": require_env("ACCESS_TOKEN"),
     "access_token": app_access_token(),
   }
-  async with httpx.AsyncClient(timeout=30) as client:
-    r = await client.get(f"{graph_base()}/debug_token", params=params)
+  async with pooled("graph") as client:
+    r = await client.get(f"{graph_base()}/debug_token", params=params, timeout=30)
     r.raise_for_status()
-    return r.json()
+    return loads(r.content)
 
 
 async def push_text(text: str, to_number: str | None = None) -> None:
@@ -0,0 +1,154 @@
+"""
+Time-to-first-audio for the /voice WebSocket, against mocked upstreams.
+
+    python benchmark_voice.py --turns 10 --latency-ms 20
+
+Starts ``mock_upstreams.py`` and one ``serve.py`` worker, then plays a
+synthetic utterance (two voiced bursts with a short pause, then silence)
+into ``/voice`` in real time. For every turn it measures the time from the
+end of speech to the first audio frame of the reply, and checks barge-in by
+talking over one reply. Requires the ``websockets`` package.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import time
+
+import numpy as np
+import websockets
+
+from api.metrics import Histogram
+from benchmark_workers import _start, _wait_ready
+
+
+SAMPLE_RATE = 16000
+FRAME_SECONDS = 0.02
+
+
+def _noise(seconds: float, rng: np.random.Generator) -> np.ndarray:
+    return rng.normal(0, 80, int(SAMPLE_RATE * seconds))
+
+
+def _voiced(seconds: float, rng: np.random.Generator) -> np.ndarray:
+    t = np.arange(int(SAMPLE_RATE * seconds)) / SAMPLE_RATE
+    envelope = 0.6 + 0.4 * np.sin(2 * np.pi * 4 * t)
+    return 6000 * np.sin(2 * np.pi * 180 * t) * envelope + _noise(seconds, rng)
+
+
+def utterance(rng: np.random.Generator) -> tuple[bytes, float]:
+    """PCM for one spoken turn and the offset (s) where speech ends."""
+    parts = [_noise(0.3, rng), _voiced(1.0, rng), _noise(0.35, rng), _voiced(0.7, rng)]
+    speech_end = sum(len(p) for p in parts) / SAMPLE_RATE
+    parts.append(_noise(1.5, rng))
+    return np.concatenate(parts).clip(-32768, 32767).astype(np.int16).tobytes(), speech_end
+
+
+async def _stream(ws, pcm: bytes, realtime: bool = True) -> float:
+    """Send ``pcm`` in 20 ms frames; returns when sending started."""
+    frame = int(SAMPLE_RATE * FRAME_SECONDS) * 2
+    started = time.perf_counter()
+    for i, offset in enumerate(range(0, len(pcm), frame)):
+        await ws.send(pcm[offset:offset + frame])
+        if realtime:
+            delay = started + (i + 1) * FRAME_SECONDS - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+    return started
+
+
+async def run_turns(url: str, turns: int) -> dict:
+    rng = np.random.default_rng(7)
+    ttfa = Histogram()
+    failures = 0
+    async with websockets.connect(url, max_size=None) as ws:
+        ready = json.loads(await ws.recv())
+        assert ready["type"] == "ready", ready
+        for _ in range(turns):
+            pcm, speech_end = utterance(rng)
+            sender = asyncio.create_task(_stream(ws, pcm))
+            first_audio = None
+            try:
+                while True:
+                    message = await asyncio.wait_for(ws.recv(), timeout=30)
+                    if isinstance(message, bytes):
+                        if first_audio is None:
+                            first_audio = time.perf_counter()
+                        continue
+                    if json.loads(message)["type"] in {"done", "error"}:
+                        break
+            except asyncio.TimeoutError:
+                pass
+            started = await sender
+            if first_audio is None:
+                failures += 1
+            else:
+                ttfa.observe((first_audio - (started + speech_end)) * 1000)
+
+        # Barge-in: talk over the reply as soon as the transcript is back
+        pcm, _ = utterance(rng)
+        interrupted = False
+        sender = asyncio.create_task(_stream(ws, pcm, realtime=False))
+        barge = None
+        try:
+            while True:
+                message = await asyncio.wait_for(ws.recv(), timeout=30)
+                if isinstance(message, bytes):
+                    continue
+                kind = json.loads(message)["type"]
+                if kind == "transcript" and barge is None:
+                    barge = asyncio.create_task(_stream(ws, utterance(rng)[0], realtime=False))
+                elif kind == "interrupted":
+                    interrupted = True
+                elif kind == "done" and barge is not None:
+                    break
+        except asyncio.TimeoutError:
+            pass
+        await sender
+        if barge:
+            await barge
+    return {"time_to_first_audio_ms": ttfa.snapshot(), "failures": failures, "barge_in": interrupted}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark /voice time-to-first-audio")
+    parser.add_argument("--turns", type=int, default=10)
+    parser.add_argument("--latency-ms", type=float, default=20)
+    parser.add_argument("--port", type=int, default=8800)
+    parser.add_argument("--mock-port", type=int, default=9103)
+    args = parser.parse_args()
+
+    mock_url = f"http://127.0.0.1:{args.mock_port}"
+    env = dict(
+        os.environ,
+        AZURE_OPENAI_ENDPOINT=mock_url,
+        AZURE_OPENAI_API_KEY="mock",
+        AZURE_GPT_DEPLOYMENT="mock-gpt",
+        AZURE_SEARCH_ENDPOINT=mock_url,
+        AZURE_SEARCH_KEY="mock",
+        AZURE_SEARCH_INDEX="mock-index",
+        LOG_LEVEL="error",
+    )
+    mock = _start(["mock_upstreams.py", "--port", str(args.mock_port), "--latency-ms", str(args.latency_ms)], env)
+    server = _start(["serve.py", "--workers", "1", "--port", str(args.port)], env)
+    try:
+        asyncio.run(_wait_ready(f"{mock_url}/health"))
+        asyncio.run(_wait_ready(f"http://127.0.0.1:{args.port}/health"))
+        result = asyncio.run(run_turns(f"ws://127.0.0.1:{args.port}/voice", args.turns))
+    finally:
+        server.terminate()
+        server.wait()
+        mock.terminate()
+        mock.wait()
+
+    ttfa = result["time_to_first_audio_ms"]
+    print(
+        f"turns={ttfa['count']} failures={result['failures']} barge_in={'ok' if result['barge_in'] else 'FAILED'}\n"
+        f"time to first audio after end of speech: p50={ttfa['p50']:.0f} ms p95={ttfa['p95']:.0f} ms "
+        f"max={ttfa['max']:.0f} ms (includes the {os.getenv('VOICE_END_SILENCE_MS', '600')} ms end-of-utterance wait)"
+    )
+
+
+if __name__ == "__main__":
+    main()
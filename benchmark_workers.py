@@ -0,0 +1,107 @@
+"""
+/text throughput vs worker count, against mocked upstreams.
+
+    python benchmark_workers.py --workers 1 2 4 --duration 10 --concurrency 64
+
+Starts ``mock_upstreams.py`` and then ``serve.py --workers N`` for each N,
+drives ``POST /text`` at fixed concurrency and prints requests/second with
+the scaling efficiency relative to one worker.
+"""
+
+import argparse
+import asyncio
+import os
+import time
+
+import httpx
+
+from local_servers import start_script, wait_ready
+
+
+QUESTIONS = [
+    "What accounts does BankIslami offer?",
+    "How do I apply for Car Ijarah financing?",
+    "Can I use my debit card internationally?",
+    "What documents are needed to open a Roshan Digital Account?",
+]
+
+
+async def _drive(base_url: str, duration: float, concurrency: int) -> tuple[int, int]:
+    done = 0
+    errors = 0
+    deadline = time.monotonic() + duration
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=60, limits=limits) as client:
+        async def worker(offset: int) -> None:
+            nonlocal done, errors
+            i = offset
+            while time.monotonic() < deadline:
+                question = f"{QUESTIONS[i % len(QUESTIONS)]} #{i}"
+                i += concurrency
+                try:
+                    r = await client.post("/text", json={"text": question})
+                    r.raise_for_status()
+                    done += 1
+                except httpx.HTTPError:
+                    errors += 1
+
+        await asyncio.gather(*(worker(i) for i in range(concurrency)))
+    return done, errors
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark /text throughput per worker count")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--latency-ms", type=float, default=5)
+    parser.add_argument("--port", type=int, default=8600)
+    parser.add_argument("--mock-port", type=int, default=9100)
+    args = parser.parse_args()
+
+    mock_url = f"http://127.0.0.1:{args.mock_port}"
+    env = dict(
+        os.environ,
+        AZURE_OPENAI_ENDPOINT=mock_url,
+        AZURE_OPENAI_API_KEY="mock",
+        AZURE_GPT_DEPLOYMENT="mock-gpt",
+        AZURE_SEARCH_ENDPOINT=mock_url,
+        AZURE_SEARCH_KEY="mock",
+        AZURE_SEARCH_INDEX="mock-index",
+        LOG_LEVEL="error",
+    )
+    mock = start_script(
+        ["mock_upstreams.py", "--port", str(args.mock_port), "--latency-ms", str(args.latency_ms)],
+        env,
+    )
+    results = []
+    try:
+        asyncio.run(wait_ready(f"{mock_url}/health"))
+        for workers in args.workers:
+            server = start_script(["serve.py", "--workers", str(workers), "--port", str(args.port)], env)
+            try:
+                base_url = f"http://127.0.0.1:{args.port}"
+                asyncio.run(wait_ready(f"{base_url}/health"))
+                done, errors = asyncio.run(_drive(base_url, args.duration, args.concurrency))
+            finally:
+                server.terminate()
+                server.wait()
+            rps = done / args.duration
+            results.append((workers, rps, errors))
+            print(f"workers={workers:<3} {rps:8.1f} req/s  errors={errors}")
+    finally:
+        mock.terminate()
+        mock.wait()
+
+    if results:
+        base = results[0][1] / results[0][0] if results[0][1] else 0
+        print("\nworkers  req/s   speedup  efficiency")
+        for workers, rps, _ in results:
+            speedup = rps / results[0][1] if results[0][1] else 0
+            efficiency = rps / (base * workers) if base else 0
+            print(f"{workers:<8} {rps:<7.1f} {speedup:<8.2f} {efficiency:.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,348 @@
+"""
+Build (or rebuild) the precomputed FAQ answer store.
+
+    python build_faq_store.py --seed faq_seed.jsonl --log traffic-*.jsonl.gz --top 200
+
+Questions come from a seed file and/or recorded webhook traffic
+(``TRAFFIC_RECORD_PATH`` logs). The seed is JSONL, one entry per line:
+
+    {"question": "What is Roshan Digital Account?", "variants": ["RDA kya hai?"], "answer": "..."}
+
+``variants`` and ``answer`` are optional; a seed answer is treated as vetted
+and stored verbatim. Logged questions are clustered by embedding similarity,
+questions the intent router already answers locally are dropped, and the
+``--top`` largest clusters are kept, folded into a seed entry when they
+match one. Unanswered entries get an answer from the same retrieval + GPT
+path the app uses; answers without context or with a fallback reply are
+rejected. Every published answer is synthesized once for voice replies.
+
+Generated answers are never published unreviewed. They are written to the
+``--review`` JSONL with ``"approved": false``; set ``approved`` to true on
+the ones that are correct (editing ``answer`` if needed) and pass the file
+back with ``--approved``, which adds those entries as vetted answers (a
+rebuild with ``--review`` keeps them in the file, still approved):
+
+    python build_faq_store.py --seed faq_seed.jsonl --log traffic-*.jsonl.gz --review faq_review.jsonl
+    python build_faq_store.py --seed faq_seed.jsonl --approved faq_review.jsonl
+
+The store records the search index version it was built against; the app
+stops serving it once the index changes, so rerun this command after every
+index update.
+"""
+
+import argparse
+import asyncio
+import glob
+import hashlib
+import json
+import os
+import time
+from collections import Counter
+
+import numpy as np
+from dotenv import load_dotenv
+
+
+def _entry(record: dict, source: str) -> dict | None:
+    question = str(record.get("question") or "").strip()
+    if not question:
+        return None
+    variants = [str(v).strip() for v in record.get("variants") or [] if str(v).strip()]
+    answer = str(record.get("answer") or "").strip() or None
+    return {
+        "question": question,
+        "variants": [question, *(v for v in variants if v != question)],
+        "answer": answer,
+        "count": int(record.get("count") or 0),
+        "source": source,
+        "vetted": answer is not None,
+    }
+
+
+def load_seed(path: str) -> list[dict]:
+    """Seed entries from JSONL, or a text file with one question per line."""
+    entries = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line) if path.endswith(".jsonl") else {"question": line}
+            entry = _entry(record, "seed")
+            if entry:
+                entries.append(entry)
+    return entries
+
+
+def load_approved(path: str) -> list[dict]:
+    """Entries of a reviewed ``--review`` file marked ``"approved": true``."""
+    entries = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            if record.get("approved") is not True:
+                continue
+            entry = _entry(record, "approved")
+            if entry and entry["answer"]:
+                entries.append(entry)
+    return entries
+
+
+def split_vetted(entries: list[dict]) -> tuple[list[dict], list[dict]]:
+    """``(publishable, pending review)``: only seed and approved answers are published."""
+    return [e for e in entries if e["vetted"]], [e for e in entries if not e["vetted"]]
+
+
+def write_review(path: str, entries: list[dict]) -> None:
+    """Generated and previously approved entries, so the file can be passed back as ``--approved``."""
+    with open(path, "w", encoding="utf-8") as f:
+        for entry in entries:
+            if entry["source"] == "seed" and entry["vetted"]:
+                continue
+            record = {key: entry[key] for key in ("question", "variants", "answer", "count", "source")}
+            record["approved"] = entry["vetted"]
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+def logged_questions(paths: list[str]) -> list[str]:
+    """Text questions from recorded webhook traffic."""
+    from api.whatsapp import parse_message
+    from replay_traffic import load_log
+
+    webhooks, _ = load_log(paths)
+    questions = []
+    for _, payload in webhooks:
+        message = parse_message(payload)
+        if message and message["type"] == "text":
+            questions.append(message["text"].strip())
+    return questions
+
+
+def _unit(vectors) -> np.ndarray:
+    matrix = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.where(norms == 0, 1, norms)
+
+
+def cluster_questions(counts: Counter, vectors: dict[str, np.ndarray], threshold: float) -> list[dict]:
+    """
+    Greedy leader clustering, most frequent question first.
+
+    Returns:
+        Clusters sorted by total frequency, each led by its most frequent
+        phrasing
+    """
+    leaders: list[np.ndarray] = []
+    clusters: list[dict] = []
+    for text, count in counts.most_common():
+        vector = _unit([vectors[text]])[0]
+        if leaders:
+            similarities = np.stack(leaders) @ vector
+            best = int(np.argmax(similarities))
+            if similarities[best] >= threshold:
+                clusters[best]["variants"].append(text)
+                clusters[best]["count"] += count
+                continue
+        leaders.append(vector)
+        clusters.append({
+            "question": text, "variants": [text], "count": count, "answer": None, "source": "log", "vetted": False,
+        })
+    return sorted(clusters, key=lambda cluster: cluster["count"], reverse=True)
+
+
+def merge_clusters(seed: list[dict], clusters: list[dict], vectors: dict[str, np.ndarray], threshold: float, top: int) -> list[dict]:
+    """Fold clusters that match a seed entry into it; keep the ``top`` others."""
+    entries = list(seed)
+    seed_rows = [(i, text) for i, entry in enumerate(seed) for text in entry["variants"]]
+    seed_matrix = _unit([vectors[text] for _, text in seed_rows]) if seed_rows else None
+    kept = 0
+    for cluster in clusters:
+        if seed_matrix is not None:
+            similarities = seed_matrix @ _unit([vectors[cluster["question"]]])[0]
+            best = int(np.argmax(similarities))
+            if similarities[best] >= threshold:
+                entry = entries[seed_rows[best][0]]
+                entry["variants"].extend(v for v in cluster["variants"] if v not in entry["variants"])
+                entry["count"] += cluster["count"]
+                continue
+        if kept < top:
+            entries.append(cluster)
+            kept += 1
+    return entries
+
+
+async def answer_entries(entries: list[dict], concurrency: int) -> list[dict]:
+    """
+    Fill in missing answers; returns the entries that passed the automatic
+    checks. Generated answers stay ``vetted: False`` until a human approves them.
+    """
+    from api.ai_search import retrieve_context
+    from api.azure import generate_text
+    from api.formatting import format_response
+    from api.intents import OUT_OF_SCOPE_REPLY
+    from api.prompts import build_system_prompt, build_user_prompt
+    from api.routes import format_responses_enabled, load_system_prompt
+
+    system_prompt = build_system_prompt(load_system_prompt())
+    formatted = format_responses_enabled()
+    rejects = {OUT_OF_SCOPE_REPLY, "Sorry, I could not generate a response."}
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def answer(entry: dict) -> bool:
+        async with semaphore:
+            retrieval = await retrieve_context(entry["question"])
+            entry["doc_ids"] = retrieval["doc_ids"]
+            if entry["answer"]:
+                return True
+            if not retrieval["text"]:
+                print(f"  rejected (no context): {entry['question']}")
+                return False
+            try:
+                text = await generate_text(
+                    user_prompt=build_user_prompt(entry["question"], retrieval["text"]),
+                    system_prompt=system_prompt,
+                    use_tools=False,
+                )
+            except Exception as e:
+                print(f"  rejected ({e}): {entry['question']}")
+                return False
+            text = format_response(text) if formatted else text
+            if not text or text in rejects:
+                print(f"  rejected (fallback reply): {entry['question']}")
+                return False
+            entry["answer"] = text
+            entry["vetted"] = False
+            return True
+
+    results = await asyncio.gather(*(answer(entry) for entry in entries))
+    return [entry for entry, ok in zip(entries, results) if ok]
+
+
+async def synthesize_entries(entries: list[dict], concurrency: int) -> dict[int, bytes]:
+    from api.azure import synthesize_speech
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def synthesize(entry: dict) -> bytes | None:
+        async with semaphore:
+            try:
+                return await synthesize_speech(entry["answer"])
+            except Exception as e:
+                print(f"  no audio ({e}): {entry['question']}")
+                return None
+
+    audio = await asyncio.gather(*(synthesize(entry) for entry in entries))
+    return {index: data for index, data in enumerate(audio) if data}
+
+
+async def build(args: argparse.Namespace) -> dict:
+    from api.ai_search import search_index_version
+    from api.azure import audio_content_type
+    from api.clients import aclose_clients
+    from api.embeddings import embedding_model, get_embedding_service
+    from api.faq_store import answer_fingerprint, tts_signature, write_store
+    from api.intents import create_intent_router
+    from api.prompts import build_system_prompt
+    from api.routes import format_responses_enabled, load_system_prompt
+    from api.tiers import create_tier_policy
+
+    started = time.perf_counter()
+    # Taken before answering: an index update during the build leaves the store stale
+    index_version = await asyncio.to_thread(search_index_version)
+    embedder = get_embedding_service()
+
+    try:
+        approved = [entry for path in args.approved for entry in load_approved(path)]
+        # An approved answer replaces the seed entry it was generated for
+        questions = {entry["question"] for entry in approved}
+        seed = [entry for path in args.seed for entry in load_seed(path) if entry["question"] not in questions]
+        seed += approved
+        log_paths = sorted({path for pattern in args.log for path in glob.glob(pattern)})
+        router = create_intent_router()
+        counts = Counter()
+        for question in logged_questions(log_paths) if log_paths else []:
+            if question and not router.classify(question):
+                counts[" ".join(question.split())] += 1
+        counts = Counter({text: n for text, n in counts.items() if n >= args.min_count})
+
+        texts = list({*counts, *(v for entry in seed for v in entry["variants"])})
+        vectors = dict(zip(texts, await embedder.embed_many(texts)))
+        clusters = cluster_questions(counts, vectors, args.cluster_threshold)
+        entries = merge_clusters(seed, clusters, vectors, args.cluster_threshold, args.top)
+        print(f"{len(seed)} seed entries, {sum(counts.values())} logged questions in {len(clusters)} clusters")
+
+        answered = await answer_entries(entries, args.concurrency)
+        entries, pending = split_vetted(answered)
+        if args.review:
+            write_review(args.review, answered)
+        elif pending:
+            print(f"{len(pending)} generated answers held back; pass --review FILE to review and approve them")
+        for entry in entries:
+            entry["id"] = hashlib.sha256(entry["question"].encode("utf-8")).hexdigest()[:12]
+        audio = {} if args.no_audio else await synthesize_entries(entries, args.concurrency)
+
+        rows, variant_texts = [], []
+        for index, entry in enumerate(entries):
+            for text in entry["variants"]:
+                rows.append(index)
+                variant_texts.append(text)
+        variant_vectors = await embedder.embed_many(variant_texts) if variant_texts else []
+        matrix = _unit(variant_vectors) if variant_texts else np.zeros((0, 1), dtype=np.float32)
+
+        manifest = {
+            "index_version": index_version,
+            "fingerprint": answer_fingerprint(
+                build_system_prompt(load_system_prompt()),
+                create_tier_policy().large_deployment,
+                format_responses_enabled(),
+            ),
+            "embedding_model": embedding_model(),
+            "audio_format": audio_content_type(),
+            "tts": tts_signature(),
+            "built_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        }
+        write_store(args.out, manifest, entries, matrix, np.asarray(rows), audio)
+    finally:
+        await aclose_clients()
+
+    return {
+        "entries": len(entries),
+        "pending": len(pending),
+        "variants": len(rows),
+        "audio": len(audio),
+        "index_version": index_version,
+        "seconds": round(time.perf_counter() - started, 1),
+    }
+
+
+def main() -> None:
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Build the precomputed FAQ answer store")
+    parser.add_argument("--seed", nargs="*", default=[], help="Seed questions (.jsonl or .txt)")
+    parser.add_argument("--log", nargs="*", default=[], help="Recorded traffic logs (globs allowed)")
+    parser.add_argument("--top", type=int, default=200, help="Logged question clusters to keep")
+    parser.add_argument("--min-count", type=int, default=2, help="Ignore logged questions seen fewer times")
+    parser.add_argument("--cluster-threshold", type=float, default=0.9)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--no-audio", action="store_true", help="Skip pre-synthesizing reply audio")
+    parser.add_argument("--out", default=os.getenv("FAQ_STORE_DIR", "faq_store"))
+    parser.add_argument("--review", help="Write generated (unpublished) answers as JSONL for review")
+    parser.add_argument("--approved", nargs="*", default=[], help="Reviewed JSONL files; approved entries are published")
+    args = parser.parse_args()
+    if not args.seed and not args.log and not args.approved:
+        parser.error("Give --seed, --log and/or --approved")
+
+    result = asyncio.run(build(args))
+    print(
+        f"Wrote {result['entries']} answers ({result['variants']} variants, {result['audio']} audio) "
+        f"to {args.out} for index version {result['index_version']} in {result['seconds']} s"
+    )
+    if result["pending"] and args.review:
+        print(f"{result['pending']} generated answers await approval in {args.review}")
+
+
+if __name__ == "__main__":
+    main()
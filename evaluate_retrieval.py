@@ -0,0 +1,354 @@
+"""
+Retrieval quality vs latency for the FAISS and Azure AI Search backends.
+
+    python evaluate_retrieval.py --dataset retrieval_eval.jsonl --top-k 3 5 10
+
+The dataset is JSONL with one labeled question per line:
+
+    {"question": "How many branches does BankIslami have?", "relevant": ["branches: 500+"]}
+
+A retrieved document counts as relevant when a label equals its id or
+source, or appears (case-insensitively) in its content, so one dataset
+scores both backends. FAISS runs against the bundled ``faiss_index/`` with
+each index type rebuilt from the stored vectors; Azure Search runs against
+``mock_upstreams.py`` serving the same corpus unless ``--live`` is given.
+Without FAISS the mock serves ``retrieval_corpus.json``, the ``faiss_index``
+chunks the dataset is labeled on (regenerate it with ``--export-corpus``
+after re-indexing); a corpus that contains none of the labels is an error.
+Per-query latency covers the query embedding and the search on both
+backends, and every ``--top-k`` is a separate search at that depth. The
+report lists recall@k, MRR and latency for every configuration and marks
+the ones on the latency/quality frontier.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Awaitable, Callable, Optional
+
+import httpx
+import numpy as np
+from dotenv import load_dotenv
+
+from api.metrics import Histogram
+
+
+Retriever = Callable[[str], Awaitable[list[dict]]]
+
+
+def load_dataset(path: str) -> list[dict]:
+    rows = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                row = json.loads(line)
+                rows.append({"question": row["question"], "relevant": list(row["relevant"])})
+    return rows
+
+
+def is_relevant(label: str, doc: dict) -> bool:
+    label = label.casefold()
+    if label in {str(doc.get("id", "")).casefold(), str(doc.get("source", "")).casefold()}:
+        return True
+    return label in str(doc.get("content", "")).casefold()
+
+
+def check_coverage(dataset: list[dict], corpus: list[dict]) -> None:
+    """Fail when the corpus cannot contain the labeled answers, so the scores would be meaningless."""
+    labels = {label for row in dataset for label in row["relevant"]}
+    missing = sorted(label for label in labels if not any(is_relevant(label, doc) for doc in corpus))
+    if len(missing) == len(labels):
+        raise RuntimeError(
+            "No labeled answer appears in the search corpus; pass the corpus the dataset "
+            "was labeled on with --documents, or use --live"
+        )
+    if missing:
+        print(f"Warning: {len(missing)} of {len(labels)} labels are not in the search corpus: {missing[:5]}")
+
+
+def score_query(documents: list[dict], labels: list[str]) -> tuple[float, float]:
+    """Recall of ``labels`` within ``documents`` and the reciprocal rank of the first hit."""
+    found = {label for label in labels for doc in documents if is_relevant(label, doc)}
+    reciprocal_rank = 0.0
+    for rank, doc in enumerate(documents, start=1):
+        if any(is_relevant(label, doc) for label in labels):
+            reciprocal_rank = 1.0 / rank
+            break
+    return len(found) / len(labels) if labels else 0.0, reciprocal_rank
+
+
+async def evaluate(
+    backend: str, config: dict, top_k: int, dataset: list[dict], retrieve: Retriever
+) -> dict:
+    latencies = Histogram()
+    recall = 0.0
+    mrr = 0.0
+    for row in dataset:
+        started = time.perf_counter()
+        documents = await retrieve(row["question"])
+        latencies.observe((time.perf_counter() - started) * 1000)
+        row_recall, reciprocal_rank = score_query(documents, row["relevant"])
+        recall += row_recall
+        mrr += reciprocal_rank
+    count = max(1, len(dataset))
+    return {
+        "backend": backend,
+        "config": {**config, "top_k": top_k},
+        "recall": recall / count,
+        "mrr": mrr / count,
+        "latency_ms": latencies.snapshot(),
+    }
+
+
+def mark_frontier(results: list[dict]) -> list[dict]:
+    """Flag configurations no other configuration beats on latency, recall and MRR at once."""
+    for result in results:
+        p50 = result["latency_ms"]["p50"]
+        result["frontier"] = not any(
+            other is not result
+            and other["latency_ms"]["p50"] <= p50
+            and other["recall"] >= result["recall"]
+            and other["mrr"] >= result["mrr"]
+            and (
+                other["latency_ms"]["p50"] < p50
+                or other["recall"] > result["recall"]
+                or other["mrr"] > result["mrr"]
+            )
+            for other in results
+        )
+    return results
+
+
+# ==================== FAISS ====================
+
+def load_faiss(index_path: str):
+    from langchain_community.vectorstores import FAISS
+
+    from rag_pipeline import get_embeddings
+
+    return FAISS.load_local(index_path, get_embeddings(), allow_dangerous_deserialization=True)
+
+
+def corpus_from_vectorstore(vectorstore) -> list[dict]:
+    """The indexed chunks as search documents; the source is the chunk's top-level section."""
+    documents = []
+    for position in range(vectorstore.index.ntotal):
+        doc_id = vectorstore.index_to_docstore_id[position]
+        doc = vectorstore.docstore.search(doc_id)
+        content = doc.page_content
+        documents.append({
+            "id": doc_id,
+            "source": doc.metadata.get("source") or content.split(":", 1)[0].strip(),
+            "content": content,
+        })
+    return documents
+
+
+def build_index(kind: str, vectors: np.ndarray, nprobe: int = 4):
+    import faiss
+
+    dim = vectors.shape[1]
+    if kind == "flat":
+        index = faiss.IndexFlatL2(dim)
+    elif kind == "hnsw":
+        index = faiss.IndexHNSWFlat(dim, 32)
+    elif kind == "ivf":
+        nlist = max(1, int(len(vectors) ** 0.5))
+        index = faiss.IndexIVFFlat(faiss.IndexFlatL2(dim), dim, nlist)
+        index.train(vectors)
+        index.nprobe = min(nprobe, nlist)
+    else:
+        raise ValueError(f"Unknown index type: {kind}")
+    index.add(vectors)
+    return index
+
+
+async def evaluate_faiss(
+    dataset: list[dict], index_path: str, index_types: list[str], top_ks: list[int]
+) -> tuple[list[dict], list[dict]]:
+    """Score each FAISS index type; returns the results and the corpus for the search mock."""
+    vectorstore = load_faiss(index_path)
+    corpus = corpus_from_vectorstore(vectorstore)
+    vectors = vectorstore.index.reconstruct_n(0, vectorstore.index.ntotal).astype(np.float32)
+    ids_by_position = [doc["id"] for doc in corpus]
+    contents_by_position = [doc["content"] for doc in corpus]
+    # Embedded per query, like Azure Search does, through the same kind of cache
+    embeddings = vectorstore.embedding_function
+
+    results = []
+    for kind in index_types:
+        index = build_index(kind, vectors)
+        for top_k in top_ks:
+            async def retrieve(question: str, index=index, top_k=top_k) -> list[dict]:
+                vector = np.asarray(embeddings.embed_query(question), dtype=np.float32)
+                _, positions = index.search(vector[None, :], top_k)
+                return [
+                    {"id": ids_by_position[i], "content": contents_by_position[i]}
+                    for i in positions[0]
+                    if i >= 0
+                ]
+
+            results.append(await evaluate("faiss", {"index": kind}, top_k, dataset, retrieve))
+    return results, corpus
+
+
+# ==================== AZURE AI SEARCH ====================
+
+def _start_mock(corpus: list[dict], port: int, latency_ms: float) -> tuple[subprocess.Popen, str]:
+    handle, documents_path = tempfile.mkstemp(suffix=".json")
+    with os.fdopen(handle, "w", encoding="utf-8") as f:
+        json.dump(corpus, f)
+    env = {**os.environ, "MOCK_SEARCH_DOCUMENTS": documents_path}
+    process = subprocess.Popen(
+        [sys.executable, "mock_upstreams.py", "--port", str(port), "--latency-ms", str(latency_ms)],
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(f"{url}/health").status_code == 200:
+                break
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    else:
+        process.kill()
+        raise RuntimeError("mock_upstreams.py did not become ready")
+
+    # Point the search and embedding clients at the mock; keep its
+    # fake vectors out of the real embedding cache.
+    os.environ.update({
+        "AZURE_SEARCH_ENDPOINT": url,
+        "AZURE_SEARCH_KEY": "mock",
+        "AZURE_SEARCH_INDEX": "mock",
+        "AZURE_OPENAI_ENDPOINT": url,
+        "AZURE_OPENAI_API_KEY": "mock",
+        "EMBEDDING_CACHE_DIR": tempfile.mkdtemp(prefix="eval-embeddings-"),
+    })
+    return process, documents_path
+
+
+async def evaluate_azure(
+    dataset: list[dict],
+    top_ks: list[int],
+    vector_field: str,
+    semantic_config: str,
+) -> list[dict]:
+    from api.ai_search import search_knowledge_base
+
+    modes = [{"hybrid": False, "reranker": False}]
+    if vector_field:
+        modes.append({"hybrid": True, "reranker": False})
+    if semantic_config:
+        modes += [{**mode, "reranker": True} for mode in list(modes)]
+
+    results = []
+    for mode in modes:
+        for top_k in top_ks:
+            async def retrieve(question: str, mode=mode, top_k=top_k) -> list[dict]:
+                return await search_knowledge_base(
+                    question,
+                    top_k=top_k,
+                    vector_field=vector_field if mode["hybrid"] else "",
+                    semantic_config=semantic_config if mode["reranker"] else "",
+                )
+
+            results.append(await evaluate("azure", mode, top_k, dataset, retrieve))
+    return results
+
+
+# ==================== REPORT ====================
+
+def print_report(results: list[dict]) -> None:
+    print(f"{'backend':8} {'config':42} {'recall':>7} {'mrr':>6} {'p50 ms':>8} {'p95 ms':>8}  frontier")
+    for result in sorted(results, key=lambda r: r["latency_ms"]["p50"]):
+        config = ", ".join(f"{k}={v}" for k, v in result["config"].items())
+        latency = result["latency_ms"]
+        print(
+            f"{result['backend']:8} {config:42} {result['recall']:7.3f} {result['mrr']:6.3f} "
+            f"{latency['p50']:8.2f} {latency['p95']:8.2f}  {'*' if result['frontier'] else ''}"
+        )
+
+
+async def run(args: argparse.Namespace) -> list[dict]:
+    dataset = load_dataset(args.dataset)
+    results: list[dict] = []
+    corpus: Optional[list[dict]] = None
+
+    if "faiss" in args.backends:
+        try:
+            faiss_results, corpus = await evaluate_faiss(dataset, args.index_path, args.index_types, args.top_k)
+            results += faiss_results
+        except ImportError as exc:
+            print(f"Skipping FAISS backend ({exc}); install faiss-cpu and langchain-community")
+
+    if "azure" in args.backends:
+        mock = None
+        documents_path = None
+        if not args.live:
+            if corpus is None:
+                if not os.path.exists(args.documents):
+                    raise RuntimeError(
+                        f"Search corpus {args.documents} not found; export it with --export-corpus, "
+                        "pass --documents, or use --live"
+                    )
+                with open(args.documents, "r", encoding="utf-8") as f:
+                    corpus = json.load(f)
+            check_coverage(dataset, corpus)
+            mock, documents_path = _start_mock(corpus, args.mock_port, args.mock_latency_ms)
+        try:
+            results += await evaluate_azure(dataset, args.top_k, args.vector_field, args.semantic_config)
+        finally:
+            if mock:
+                mock.terminate()
+                mock.wait()
+                os.remove(documents_path)
+
+    return mark_frontier(results)
+
+
+def main() -> None:
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Compare retrieval quality and latency across backends")
+    parser.add_argument("--dataset", default="retrieval_eval.jsonl")
+    parser.add_argument("--backends", nargs="+", default=["faiss", "azure"], choices=["faiss", "azure"])
+    parser.add_argument("--top-k", type=int, nargs="+", default=[3, 5, 10])
+    parser.add_argument("--index-path", default=os.getenv("RAG_INDEX_PATH", "faiss_index"))
+    parser.add_argument("--index-types", nargs="+", default=["flat", "hnsw", "ivf"])
+    parser.add_argument("--live", action="store_true", help="Query the configured Azure Search index")
+    parser.add_argument(
+        "--documents",
+        default="retrieval_corpus.json",
+        help="JSON corpus for the search mock when FAISS is not evaluated",
+    )
+    parser.add_argument("--export-corpus", help="Write the faiss_index chunks as a --documents file and exit")
+    parser.add_argument("--vector-field", default=os.getenv("AZURE_SEARCH_VECTOR_FIELD", "contentVector"))
+    parser.add_argument("--semantic-config", default=os.getenv("AZURE_SEARCH_SEMANTIC_CONFIG", "default"))
+    parser.add_argument("--mock-port", type=int, default=9101)
+    parser.add_argument("--mock-latency-ms", type=float, default=20.0)
+    parser.add_argument("--output", help="Write the full report as JSON")
+    args = parser.parse_args()
+
+    if args.export_corpus:
+        corpus = corpus_from_vectorstore(load_faiss(args.index_path))
+        with open(args.export_corpus, "w", encoding="utf-8") as f:
+            json.dump(corpus, f, ensure_ascii=False, indent=1)
+        print(f"Wrote {len(corpus)} documents to {args.export_corpus}")
+        return
+
+    results = asyncio.run(run(args))
+    print_report(results)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
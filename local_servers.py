@@ -0,0 +1,36 @@
+"""
+Helpers for the benchmark and replay scripts that run the app and
+``mock_upstreams.py`` as local subprocesses.
+"""
+
+import asyncio
+import subprocess
+import sys
+import time
+
+import httpx
+
+
+def start_script(args: list[str], env: dict) -> subprocess.Popen:
+    """Run a Python script of this repo (``["serve.py", ...]``) in the background, output discarded."""
+    return subprocess.Popen(
+        [sys.executable, *args],
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+
+
+async def wait_ready(url: str, timeout: float = 30) -> None:
+    """Poll ``url`` until it answers 200; RuntimeError after ``timeout`` seconds."""
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            try:
+                r = await client.get(url)
+                if r.status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f"{url} did not become ready")
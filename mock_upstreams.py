@@ -0,0 +1,191 @@
+"""
+Local stand-ins for Azure OpenAI (chat, embeddings, STT, TTS) and Azure AI
+Search, used by the benchmarks and offline tools.
+
+    python mock_upstreams.py --port 9100 --latency-ms 20
+
+Point the app at it with ``AZURE_OPENAI_ENDPOINT``,
+``AZURE_SEARCH_ENDPOINT`` and ``GRAPH_API_BASE`` set to
+``http://127.0.0.1:9100`` (any key/index values work). Responses are deterministic so runs are comparable.
+``MOCK_FAIL_PATHS`` (comma-separated path fragments, e.g. ``/audio/speech``)
+makes matching requests fail with 503, to exercise the health checks and
+circuit breakers.
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+
+
+DEFAULT_DOCUMENTS = [
+    {
+        "id": "faq-1",
+        "source": "Accounts FAQ",
+        "content": "BankIslami offers current, savings and Roshan Digital Accounts. "
+        "Accounts can be opened at any branch or through the mobile app with a valid CNIC.",
+    },
+    {
+        "id": "faq-2",
+        "source": "Car Ijarah FAQ",
+        "content": "Car Ijarah is a Shariah-compliant vehicle financing product for salaried "
+        "and self-employed customers.",
+    },
+    {
+        "id": "faq-3",
+        "source": "Cards FAQ",
+        "content": "BankIslami debit cards can be used at ATMs and point-of-sale terminals. "
+        "International usage can be enabled through the mobile app.",
+    },
+]
+
+
+def _load_documents() -> list[dict]:
+    path = os.getenv("MOCK_SEARCH_DOCUMENTS")
+    if path:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    return DEFAULT_DOCUMENTS
+
+
+def _score(query: str, content: str) -> float:
+    words = {w for w in query.lower().split() if len(w) > 2}
+    text = content.lower()
+    return float(sum(1 for w in words if w in text))
+
+
+def _rerank_score(query: str, content: str) -> float:
+    # Stand-in for the semantic ranker: overlap normalized by document length
+    return _score(query, content) / max(1.0, len(content.split()) ** 0.5)
+
+
+def _best_sentence(query: str, content: str) -> str:
+    sentences = [s for s in content.replace("? ", ". ").split(". ") if s.strip()]
+    return max(sentences, key=lambda sentence: _score(query, sentence)) if sentences else content
+
+
+def create_mock_app(latency_ms: float = 20.0, documents: list[dict] | None = None) -> FastAPI:
+    app = FastAPI(title="Mock Azure upstreams")
+    delay = latency_ms / 1000
+    docs = documents if documents is not None else _load_documents()
+    failing = [part.strip() for part in os.getenv("MOCK_FAIL_PATHS", "").split(",") if part.strip()]
+
+    @app.middleware("http")
+    async def inject_failures(request: Request, call_next):
+        if any(part in request.url.path for part in failing):
+            await asyncio.sleep(delay)
+            return JSONResponse({"error": {"message": "Mock outage"}}, status_code=503)
+        return await call_next(request)
+
+    @app.post("/openai/deployments/{deployment}/chat/completions")
+    async def chat(deployment: str, request: Request) -> JSONResponse:
+        body = await request.json()
+        await asyncio.sleep(delay)
+        prompt = body["messages"][-1]["content"]
+        return JSONResponse({
+            "choices": [{"message": {"role": "assistant", "content": f"Mock answer ({deployment}) for: {prompt[-80:]}"}}],
+            "usage": {
+                "prompt_tokens": len(json.dumps(body)) // 4,
+                "completion_tokens": 20,
+                "prompt_tokens_details": {"cached_tokens": 0},
+            },
+        })
+
+    @app.post("/openai/deployments/{deployment}/embeddings")
+    async def embeddings(deployment: str, request: Request) -> JSONResponse:
+        body = await request.json()
+        await asyncio.sleep(delay)
+        inputs = body["input"] if isinstance(body["input"], list) else [body["input"]]
+        data = []
+        for index, text in enumerate(inputs):
+            digest = hashlib.sha256(text.encode("utf-8")).digest()
+            data.append({"index": index, "embedding": [b / 255 for b in digest]})
+        return JSONResponse({"data": data})
+
+    @app.post("/openai/deployments/{deployment}/audio/transcriptions")
+    async def transcriptions(deployment: str, request: Request) -> JSONResponse:
+        form = await request.form()
+        upload = form.get("file")
+        size = len(await upload.read()) if upload is not None else 0
+        await asyncio.sleep(delay)
+        return JSONResponse({"text": os.getenv("MOCK_TRANSCRIPT", f"What accounts does BankIslami offer? ({size} bytes)")})
+
+    @app.post("/openai/deployments/{deployment}/audio/speech")
+    async def speech(deployment: str, request: Request) -> StreamingResponse:
+        body = await request.json()
+        await asyncio.sleep(delay)
+        size = len(body.get("input", "")) * 40
+
+        async def chunks():
+            # Streamed like Azure TTS: the first chunk right away, the rest paced.
+            # A 32 kbps MPEG-1 Layer III frame header lets clients size the clip.
+            for offset in range(0, size, 4096):
+                chunk = b"\x00" * min(4096, size - offset)
+                yield b"\xff\xfb\x10\x00" + chunk[4:] if offset == 0 else chunk
+                await asyncio.sleep(0.005)
+
+        return StreamingResponse(chunks(), media_type="audio/mpeg")
+
+    @app.api_route("/indexes{rest:path}", methods=["GET", "POST"])
+    async def search(rest: str, request: Request) -> JSONResponse:
+        body = await request.json() if request.method == "POST" else {}
+        await asyncio.sleep(delay)
+        if rest.endswith("/docs/$count"):
+            return Response(content=str(len(docs)), media_type="text/plain")
+        if rest.endswith("search.stats"):
+            size = sum(len(doc["content"]) for doc in docs)
+            return JSONResponse({"documentCount": len(docs), "storageSize": size, "vectorIndexSize": 0})
+        query = body.get("search") or ""
+        top = int(body.get("top") or 5)
+        ranked = sorted(docs, key=lambda doc: _score(query, doc["content"]), reverse=True)
+        if body.get("queryType") == "semantic":
+            ranked = sorted(ranked[:50], key=lambda doc: _rerank_score(query, doc["content"]), reverse=True)
+        select = [field.strip() for field in (body.get("select") or "").split(",") if field.strip()]
+        value = []
+        for doc in ranked[:top]:
+            item = {"@search.score": _score(query, doc["content"]) or 0.1}
+            item.update({k: v for k, v in doc.items() if not select or k in select})
+            if body.get("queryType") == "semantic":
+                item["@search.rerankerScore"] = _rerank_score(query, doc["content"])
+                if body.get("captions"):
+                    item["@search.captions"] = [{"text": _best_sentence(query, doc["content"])}]
+            if body.get("highlight"):
+                item["@search.highlights"] = {body["highlight"]: [_best_sentence(query, doc["content"])]}
+            value.append(item)
+        return JSONResponse({"@odata.count": len(docs), "value": value})
+
+    @app.get("/mock-media")
+    async def media() -> Response:
+        await asyncio.sleep(delay)
+        return Response(content=b"\x00" * 16000, media_type="audio/ogg")
+
+    @app.api_route("/{rest:path}", methods=["GET", "POST"])
+    async def fallback(rest: str, request: Request) -> JSONResponse:
+        # Graph API stand-in: message sends, media metadata and token checks
+        await asyncio.sleep(delay)
+        return JSONResponse({
+            "ok": True,
+            "id": "mock",
+            "url": f"{str(request.base_url).rstrip('/')}/mock-media",
+            "messages": [{"id": "wamid.mock"}],
+        })
+
+    return app
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Run mock Azure upstreams")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--latency-ms", type=float, default=20.0)
+    args = parser.parse_args()
+    uvicorn.run(create_mock_app(args.latency_ms), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,18 @@
+import asyncio
+import json
 import os
 import sys
+from functools import lru_cache
 
 from dotenv import load_dotenv
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_openai import AzureChatOpenAI
 
-from langchain_community.vectorstores import FAISS
+from api import metrics
+from api.context import assemble_context
+from api.formatting import format_response
 
-from vector_database import create_faiss_index_from_path, create_faiss_index_from_uploaded_pdf, get_embedding_model
+# langchain, faiss and the embedding model are imported lazily in the getters
+# below so importing this module (CLI start-up, the FastAPI app) stays cheap
+# and does not require Azure credentials until a query is actually answered.
 
 load_dotenv()
 
@@ -19,13 +24,6 @@ def require_env(name: str) -> str:
     return value
 
 
-llm_model = AzureChatOpenAI(
-    azure_endpoint=require_env("AZURE_OPENAI_ENDPOINT"),
-    api_version=os.getenv("AZURE_OPENAI_API_VERSION", "2024-12-01-preview"),
-    azure_deployment=require_env("AZURE_GPT_DEPLOYMENT"),
-    api_key=require_env("AZURE_OPENAI_API_KEY"),
-)
-
 # Prompt template
 custom_prompt_template = """
 You are BankIslami's virtual banking assistant. Use ONLY the context below.
@@ -43,8 +41,48 @@ Answer:
 """
 
 
+@lru_cache(maxsize=1)
+def get_llm_model():
+    from langchain_openai import AzureChatOpenAI
+
+    return AzureChatOpenAI(
+        azure_endpoint=require_env("AZURE_OPENAI_ENDPOINT"),
+        api_version=os.getenv("AZURE_OPENAI_API_VERSION", "2024-12-01-preview"),
+        azure_deployment=require_env("AZURE_GPT_DEPLOYMENT"),
+        api_key=require_env("AZURE_OPENAI_API_KEY"),
+    )
+
+
+@lru_cache(maxsize=1)
+def get_chain():
+    from langchain_core.prompts import ChatPromptTemplate
+
+    prompt = ChatPromptTemplate.from_template(custom_prompt_template)
+    return prompt | get_llm_model()
+
+
+@lru_cache(maxsize=1)
+def get_embeddings():
+    from api.embeddings import CachedEmbeddings
+    from vector_database import get_embedding_model
+
+    return CachedEmbeddings(
+        get_embedding_model(),
+        model=os.getenv("RAG_EMBEDDING_MODEL", "faiss-local"),
+    )
+
+
 def get_context(documents):
-    return "\n\n".join([doc.page_content for doc in documents])
+    # similarity_search returns documents best-first without scores, so the
+    # rank stands in for relevance when filling the token budget.
+    context = assemble_context(
+        [
+            {"content": doc.page_content, "score": 1.0 / (rank + 1)}
+            for rank, doc in enumerate(documents)
+        ]
+    )
+    metrics.observe("rag.context_tokens", context["tokens"])
+    return context["text"]
 
 
 # Retrieve docs from uploaded PDF
@@ -52,8 +90,7 @@ def retrieve_docs(query, vectorstore):
     return vectorstore.similarity_search(query, k=4)
 
 
-def build_rag_context(query, vectorstore):
-    documents = retrieve_docs(query, vectorstore)
+def _context_from_documents(documents):
     if not documents:
         return ""
     context = get_context(documents)
@@ -62,8 +99,14 @@ def build_rag_context(query, vectorstore):
     return context
 
 
+def build_rag_context(query, vectorstore):
+    return _context_from_documents(retrieve_docs(query, vectorstore))
+
+
 # Main RAG logic
 def answer_query(uploaded_file, query):
+    from vector_database import create_faiss_index_from_uploaded_pdf
+
     vectorstore = create_faiss_index_from_uploaded_pdf(uploaded_file)
     return answer_with_vectorstore(query, vectorstore)
 
@@ -71,8 +114,11 @@ def answer_query(uploaded_file, query):
 def build_vectorstore_from_path(file_path):
     index_path = os.getenv("RAG_INDEX_PATH", "faiss_index")
     if os.path.isdir(index_path):
-        embeddings = get_embedding_model()
-        return FAISS.load_local(index_path, embeddings, allow_dangerous_deserialization=True)
+        from langchain_community.vectorstores import FAISS
+
+        return FAISS.load_local(index_path, get_embeddings(), allow_dangerous_deserialization=True)
+    from vector_database import create_faiss_index_from_path
+
     return create_faiss_index_from_path(file_path)
 
 
@@ -80,95 +126,20 @@ def answer_with_vectorstore(query, vectorstore):
     context = build_rag_context(query, vectorstore)
     if not context:
         return ""
-    prompt = ChatPromptTemplate.from_template(custom_prompt_template)
-    chain = prompt | llm_model
-    result = chain.invoke({"question": query, "context": context})
+    result = get_chain().invoke({"question": query, "context": context})
     text = getattr(result, "content", "") or str(result)
     return format_response(text)
 
 
-def format_response(text):
-    if " - **" in text:
-        text = text.replace(" - **", "\n- **")
-    text = text.replace("**", "")
-    try:
-        import re
-        text = re.sub(r"(?<!\n)\s+(?=\d+\.\s)", "\n", text)
-    except Exception:
-        pass
-    lines = [line.rstrip() for line in text.splitlines()]
-    numbered = []
-    idx = 1
-    has_numbered = False
-    for line in lines:
-        stripped = line.lstrip()
-        if stripped.startswith("- "):
-            numbered.append(f"{idx}. {stripped[2:].strip()}")
-            idx += 1
-            has_numbered = True
-        else:
-            numbered.append(line)
-
-    normalized = "\n".join(numbered)
-    if has_numbered:
-        return _move_trailing_sentence_to_new_line(normalized)
-
-    inline = normalized
-    if "1." in inline:
-        import re
-        splits = re.split(r"\b(\d+)\.\s*", inline)
-        if len(splits) >= 3:
-            head = splits[0].strip()
-            items = []
-            tail = ""
-            for i in range(1, len(splits), 2):
-                num = splits[i]
-                body = splits[i + 1].strip()
-                if not body:
-                    continue
-                items.append(f"{num}. {body}")
-            if items:
-                # If the last item contains a follow-up question, move it to a new line.
-                last = items[-1]
-                q_match = re.search(r"([A-Z][^?]*\?)", last)
-                if q_match:
-                    q_start = q_match.start(1)
-                    tail = last[q_start:].strip()
-                    items[-1] = last[:q_start].strip()
-                normalized = ("\n".join([head] + items)).strip() if head else "\n".join(items)
-                if tail:
-                    normalized = normalized + "\n\n" + tail
-                return _move_trailing_sentence_to_new_line(normalized)
-    if ":" in inline:
-        prefix, rest = inline.split(":", 1)
-        parts = [p.strip() for p in rest.split(".") if p.strip()]
-        if len(parts) >= 2:
-            numbered_parts = [f"{i + 1}. {p}" for i, p in enumerate(parts)]
-            normalized = f"{prefix.strip()}:\n" + "\n".join(numbered_parts)
-            return _move_trailing_sentence_to_new_line(normalized)
-
-    return normalized
-
-
-def _move_trailing_sentence_to_new_line(text):
-    lines = [line.rstrip() for line in text.splitlines()]
-    stitched = []
-    seen_numbered = False
-    for line in lines:
-        stripped = line.strip()
-        if not stripped:
-            continue
-        if stripped[:2].isdigit() and stripped[1:2] == "." or stripped[:3].isdigit() and stripped[2:3] == ".":
-            stitched.append(stripped)
-            seen_numbered = True
-            continue
-        if seen_numbered:
-            stitched.append("")
-            stitched.append(stripped)
-            seen_numbered = False
-        else:
-            stitched.append(stripped)
-    return "\n".join(stitched).strip()
+async def aanswer_with_vectorstore(query, vectorstore):
+    """Async variant of answer_with_vectorstore for use from the event loop."""
+    documents = await vectorstore.asimilarity_search(query, k=4)
+    context = _context_from_documents(documents)
+    if not context:
+        return ""
+    result = await get_chain().ainvoke({"question": query, "context": context})
+    text = getattr(result, "content", "") or str(result)
+    return format_response(text)
 
 
 def run_cli():
@@ -194,5 +165,94 @@ def run_cli():
         raise
 
 
+def load_questions(path):
+    """Questions from a text file (one per line) or JSONL with a ``question``/``text`` field."""
+    questions = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            if path.endswith(".jsonl"):
+                record = json.loads(line)
+                line = record.get("question") or record.get("text") or ""
+            questions.append(line)
+    return questions
+
+
+async def answer_batch(questions, vectorstore, concurrency=None, out=sys.stdout, use_cache=True, cache_path=None):
+    """
+    Answer ``questions`` against ``vectorstore`` and write NDJSON to ``out``.
+    Answers are cached in Redis when configured, otherwise in the SQLite
+    file ``cache_path`` (no cross-run caching when neither is available).
+
+    Returns:
+        The batch summary (latency percentiles, throughput, cache hits)
+    """
+    from api.batch import create_answer_cache, run_batch
+
+    cache = create_answer_cache(
+        f"{custom_prompt_template}\n{os.getenv('AZURE_GPT_DEPLOYMENT', '')}", cache_path
+    ) if use_cache else None
+
+    async def answer(question):
+        cached = await cache.get(question) if cache else None
+        if cached is not None:
+            return cached
+        text = await aanswer_with_vectorstore(question, vectorstore)
+        if cache and text:
+            await cache.put(question, text)
+        return text
+
+    summary = {}
+    async for result in run_batch(questions, answer, concurrency):
+        if "summary" in result:
+            summary = result["summary"]
+            if cache:
+                summary["answer_cache"] = cache.stats()
+        out.write(json.dumps(result, ensure_ascii=False) + "\n")
+        out.flush()
+    return summary
+
+
+def run_batch_cli(argv):
+    """``python rag_pipeline.py --batch questions.txt [--output answers.jsonl] [--concurrency N] [--refresh] [--cache-file PATH]``"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Answer a file of questions in bulk")
+    parser.add_argument("--batch", required=True, help="Questions file (.txt or .jsonl)")
+    parser.add_argument("--output", help="NDJSON results file (default: stdout)")
+    parser.add_argument("--concurrency", type=int, default=None)
+    parser.add_argument("--refresh", action="store_true", help="Ignore cached answers")
+    parser.add_argument(
+        "--cache-file",
+        default=os.getenv("ANSWER_CACHE_PATH", "answer_cache.sqlite3"),
+        help="SQLite answer cache used when STATE_BACKEND is not redis",
+    )
+    args = parser.parse_args(argv)
+
+    data_path = os.getenv("RAG_DATA_PATH")
+    if not data_path:
+        raise RuntimeError("Missing RAG_DATA_PATH.")
+    vectorstore = build_vectorstore_from_path(data_path)
+    questions = load_questions(args.batch)
+
+    out = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+    try:
+        summary = asyncio.run(
+            answer_batch(
+                questions, vectorstore, args.concurrency, out,
+                use_cache=not args.refresh, cache_path=args.cache_file,
+            )
+        )
+    finally:
+        if args.output:
+            out.close()
+    print(json.dumps(summary, indent=2), file=sys.stderr)
+
+
 if __name__ == "__main__":
-    run_cli()
+    if "--batch" in sys.argv[1:]:
+        run_batch_cli(sys.argv[1:])
+    else:
+        run_cli()
@@ -0,0 +1,205 @@
+"""
+Replay recorded webhook traffic against local stand-ins.
+
+    TRAFFIC_RECORD_PATH=traffic.jsonl.gz python main.py      # record
+    python replay_traffic.py traffic.jsonl.gz --speed 1 10 max
+
+For each speed, starts ``serve.py`` against ``mock_upstreams.py`` and
+re-posts every recorded webhook payload to ``/webhook``. The recorded gaps
+between arrivals are divided by the speed factor, and ``max`` sends back to
+back. The mock's latency defaults to the median upstream latency seen in
+the log. Message ids get a per-run suffix so de-duplication does not
+swallow repeated runs. The report shows the webhook acknowledgement latency
+measured here and the end-to-end job latency (``webhook.job_ms``) taken
+from the app's /metrics.
+"""
+
+import argparse
+import asyncio
+import copy
+import gzip
+import json
+import os
+import statistics
+import tempfile
+import time
+import uuid
+
+import httpx
+
+from api.metrics import Histogram
+from api.whatsapp import parse_message
+from local_servers import start_script, wait_ready
+
+
+def load_log(paths: list[str]) -> tuple[list[tuple[float, dict]], list[float]]:
+    """Recorded webhook payloads with timestamps, and upstream latencies in ms."""
+    webhooks: list[tuple[float, dict]] = []
+    upstream_ms: list[float] = []
+    for path in paths:
+        opener = gzip.open if path.endswith(".gz") else open
+        with opener(path, "rt", encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    event = json.loads(line)
+                except json.JSONDecodeError:
+                    # A worker killed mid-write leaves a truncated last line
+                    continue
+                if event["k"] == "webhook":
+                    webhooks.append((event["t"], event["p"]))
+                elif event["k"] == "upstream" and event.get("ms") is not None:
+                    upstream_ms.append(event["ms"])
+    webhooks.sort(key=lambda item: item[0])
+    return webhooks, upstream_ms
+
+
+def _retag(payload: dict, suffix: str) -> dict:
+    payload = copy.deepcopy(payload)
+    for entry in payload.get("entry") or []:
+        for change in entry.get("changes") or []:
+            for message in (change.get("value") or {}).get("messages") or []:
+                if isinstance(message, dict) and message.get("id"):
+                    message["id"] = f"{message['id']}.{suffix}"
+    return payload
+
+
+async def _job_count(client: httpx.AsyncClient) -> int:
+    report = (await client.get("/metrics")).json()
+    return report["histograms"].get("webhook.job_ms", {}).get("count", 0)
+
+
+async def replay(
+    base_url: str, webhooks: list[tuple[float, dict]], speed: float, drain_timeout: float
+) -> dict:
+    """Send ``webhooks`` at ``speed`` (0 = as fast as possible) and wait for the replies."""
+    suffix = uuid.uuid4().hex[:8]
+    expected = sum(1 for _, payload in webhooks if parse_message(payload))
+    acks = Histogram()
+    errors = 0
+    start_t = webhooks[0][0] if webhooks else 0.0
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=60) as client:
+        baseline = await _job_count(client)
+
+        async def send(payload: dict) -> None:
+            nonlocal errors
+            sent = time.perf_counter()
+            try:
+                r = await client.post("/webhook", json=_retag(payload, suffix))
+                r.raise_for_status()
+            except httpx.HTTPError:
+                errors += 1
+            acks.observe((time.perf_counter() - sent) * 1000)
+
+        started = time.perf_counter()
+        tasks = []
+        for t, payload in webhooks:
+            if speed:
+                delay = (t - start_t) / speed - (time.perf_counter() - started)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            tasks.append(asyncio.create_task(send(payload)))
+        await asyncio.gather(*tasks)
+        sent_s = time.perf_counter() - started
+
+        deadline = time.monotonic() + drain_timeout
+        done = await _job_count(client) - baseline
+        while done < expected and time.monotonic() < deadline:
+            await asyncio.sleep(0.2)
+            done = await _job_count(client) - baseline
+        elapsed = time.perf_counter() - started
+        report = (await client.get("/metrics")).json()
+
+    return {
+        "speed": speed or "max",
+        "payloads": len(webhooks),
+        "messages": expected,
+        "completed": done,
+        "errors": errors,
+        "send_s": round(sent_s, 3),
+        "elapsed_s": round(elapsed, 3),
+        "offered_rps": round(len(webhooks) / sent_s, 2) if sent_s else 0.0,
+        "ack_ms": acks.snapshot(),
+        "job_ms": report["histograms"].get("webhook.job_ms", {}),
+    }
+
+
+def _parse_speed(value: str) -> float:
+    return 0.0 if value == "max" else float(value)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Replay recorded webhook traffic")
+    parser.add_argument("logs", nargs="+", help="Recorded traffic logs (.jsonl or .jsonl.gz)")
+    parser.add_argument("--speed", nargs="+", default=["1"], help="Speed factors, e.g. 1 10 max")
+    parser.add_argument("--port", type=int, default=8700)
+    parser.add_argument("--mock-port", type=int, default=9102)
+    parser.add_argument("--mock-latency-ms", type=float, default=None)
+    parser.add_argument("--drain-timeout", type=float, default=120)
+    parser.add_argument("--output", help="Write the report as JSON")
+    args = parser.parse_args()
+
+    webhooks, upstream_ms = load_log(args.logs)
+    if not webhooks:
+        raise SystemExit("No webhook events in the log")
+    latency_ms = args.mock_latency_ms
+    if latency_ms is None:
+        latency_ms = statistics.median(upstream_ms) if upstream_ms else 20.0
+    print(f"{len(webhooks)} payloads, mock upstream latency {latency_ms:.1f} ms")
+
+    mock_url = f"http://127.0.0.1:{args.mock_port}"
+    base_url = f"http://127.0.0.1:{args.port}"
+    env = dict(
+        os.environ,
+        AZURE_OPENAI_ENDPOINT=mock_url,
+        AZURE_OPENAI_API_KEY="mock",
+        AZURE_GPT_DEPLOYMENT="mock-gpt",
+        AZURE_SEARCH_ENDPOINT=mock_url,
+        AZURE_SEARCH_KEY="mock",
+        AZURE_SEARCH_INDEX="mock-index",
+        GRAPH_API_BASE=mock_url,
+        ACCESS_TOKEN="mock",
+        PHONE_NUMBER_ID="mock",
+        PUBLIC_BASE_URL=base_url,
+        TRAFFIC_RECORD_PATH="",
+        PENDING_JOBS_PATH=os.path.join(tempfile.gettempdir(), f"replay-pending-{os.getpid()}.jsonl"),
+        LOG_LEVEL="error",
+    )
+    env.pop("RECIPIENT_WAID", None)
+
+    mock = start_script(
+        ["mock_upstreams.py", "--port", str(args.mock_port), "--latency-ms", str(latency_ms)], env
+    )
+    results = []
+    try:
+        asyncio.run(wait_ready(f"{mock_url}/health"))
+        for value in args.speed:
+            # One fresh worker per speed so sessions and /metrics cover exactly this run
+            server = start_script(["serve.py", "--workers", "1", "--port", str(args.port)], env)
+            try:
+                asyncio.run(wait_ready(f"{base_url}/health"))
+                result = asyncio.run(replay(base_url, webhooks, _parse_speed(value), args.drain_timeout))
+            finally:
+                server.terminate()
+                server.wait()
+            results.append(result)
+            ack, job = result["ack_ms"], result["job_ms"]
+            print(
+                f"speed={value:<4} sent={result['payloads']} done={result['completed']}/{result['messages']} "
+                f"errors={result['errors']} offered={result['offered_rps']:.1f}/s  "
+                f"ack p50={ack['p50']:.1f} p95={ack['p95']:.1f} ms  "
+                f"job p50={job.get('p50', 0):.1f} p95={job.get('p95', 0):.1f} p99={job.get('p99', 0):.1f} ms"
+            )
+    finally:
+        mock.terminate()
+        mock.wait()
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
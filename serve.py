@@ -0,0 +1,49 @@
+"""
+Multi-process entry point.
+
+Runs ``main:app`` under uvicorn with several worker processes:
+
+    python serve.py --workers 4 --port 8000
+
+Each worker has its own event loop and metrics; media buffers, sessions and
+webhook de-duplication must be shared, so set ``STATE_BACKEND=redis`` and
+``REDIS_URL`` whenever more than one worker is used.
+"""
+
+import argparse
+import os
+
+import uvicorn
+from dotenv import load_dotenv
+
+
+def main() -> None:
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Run the Bank Islami bot with N workers")
+    parser.add_argument("--host", default=os.getenv("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "8000")))
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=int(os.getenv("WEB_CONCURRENCY", str(os.cpu_count() or 1))),
+    )
+    args = parser.parse_args()
+
+    backend = os.getenv("STATE_BACKEND", os.getenv("SESSION_BACKEND", "memory")).strip().lower()
+    if args.workers > 1 and backend != "redis":
+        print(
+            "Warning: running several workers with in-process state; /media lookups, "
+            "sessions and webhook de-duplication will not be shared. Set STATE_BACKEND=redis."
+        )
+
+    uvicorn.run(
+        "main:app",
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        log_level=os.getenv("LOG_LEVEL", "warning"),
+    )
+
+
+if __name__ == "__main__":
+    main()
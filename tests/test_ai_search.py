@@ -0,0 +1,60 @@
+import weakref
+
+import pytest
+from azure.core.exceptions import HttpResponseError
+
+from api import ai_search
+
+
+def bad_request(message):
+    error = HttpResponseError(message=message)
+    error.status_code = 400
+    return error
+
+
+class FakeClient:
+    def __init__(self, reject=None):
+        self.reject = reject
+        self.calls = []
+
+    def search(self, **kwargs):
+        self.calls.append(kwargs)
+        if self.reject and (kwargs.get("select") or self.reject.startswith("Invalid $filter")):
+            raise bad_request(self.reject)
+        return [{"id": "1"}]
+
+
+@pytest.fixture(autouse=True)
+def fresh_flags(monkeypatch):
+    monkeypatch.setattr(ai_search, "_projection_failed", weakref.WeakKeyDictionary())
+
+
+SELECT = ["id", "content", "source"]
+
+
+def test_missing_selected_field_disables_projection_for_that_client_only():
+    client = FakeClient("Could not find a property named 'source' on type 'search.document'.")
+    assert ai_search._run_search(client, search_text="q", select=SELECT) == [{"id": "1"}]
+    assert ai_search._run_search(client, search_text="q", select=SELECT) == [{"id": "1"}]
+    assert [("select" in call) for call in client.calls] == [True, False, False]
+
+    other = FakeClient()
+    ai_search._run_search(other, search_text="q", select=SELECT)
+    assert other.calls == [{"search_text": "q", "select": SELECT}]
+
+
+def test_unrelated_bad_request_is_raised_and_keeps_projection():
+    client = FakeClient("Invalid $filter expression: syntax error at position 7.")
+    with pytest.raises(HttpResponseError):
+        ai_search._run_search(client, search_text="q", filter="category eq", select=SELECT)
+    assert not ai_search._projection_failed[client]
+
+    client.reject = "Unknown semantic configuration 'default'."
+    with pytest.raises(HttpResponseError):
+        ai_search._run_search(client, search_text="q", select=SELECT)
+    assert not ai_search._projection_failed[client]
+
+
+def test_field_names_match_whole_words():
+    assert ai_search._names_field("property named 'id' not found", ["id"])
+    assert not ai_search._names_field("Invalid expression", ["id"])
@@ -0,0 +1,75 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+from api import audio
+from api.audio import AudioTooLong, pcm_to_wav, prepare_for_stt
+from api.uploads import SpooledUpload
+
+
+def wav(seconds):
+    return pcm_to_wav(np.zeros(int(seconds * 16000), dtype=np.int16).tobytes())
+
+
+def ogg(seconds, padding=200_000):
+    """Minimal Ogg/Opus stand-in: an OpusHead page, padding, and a last page with the granule."""
+    last = b"OggS\x00\x04" + int(seconds * 48000).to_bytes(8, "little") + bytes(16)
+    return b"OggS" + bytes(24) + b"OpusHead" + bytes(padding) + last
+
+
+def spooled(data, spool_bytes=1024):
+    upload = SpooledUpload(spool_bytes, suffix=".bin")
+    upload.write(data)
+    upload.finish()
+    return upload
+
+
+def prepare(clip, max_seconds):
+    return asyncio.run(prepare_for_stt(clip, "note", "audio/wav", max_seconds))
+
+
+@pytest.fixture
+def no_ffmpeg(monkeypatch):
+    monkeypatch.setattr(audio, "ffmpeg_path", lambda: None)
+
+
+@pytest.fixture
+def failing_ffmpeg(monkeypatch):
+    def broken(*args):
+        raise RuntimeError("ffmpeg crashed")
+
+    monkeypatch.setattr(audio, "ffmpeg_path", lambda: "/usr/bin/ffmpeg")
+    monkeypatch.setattr(audio, "_get_pool", lambda: None)
+    monkeypatch.setattr(audio, "_screen_and_encode", broken)
+
+
+@pytest.mark.parametrize("fallback", ["no_ffmpeg", "failing_ffmpeg"])
+def test_overlong_clips_are_rejected_without_the_decode(request, fallback):
+    request.getfixturevalue(fallback)
+    with pytest.raises(AudioTooLong):
+        prepare(wav(5), max_seconds=2)
+    upload = spooled(ogg(10))
+    try:
+        assert upload.path
+        with pytest.raises(AudioTooLong):
+            prepare(upload, max_seconds=2)
+    finally:
+        upload.close()
+
+
+def test_clips_within_the_limit_pass_through_unchanged(no_ffmpeg):
+    clip = wav(1)
+    assert prepare(clip, max_seconds=2) == (clip, "note", "audio/wav")
+    assert prepare(wav(5), max_seconds=None)[0][:4] == b"RIFF"
+    # Unknown containers cannot be measured without decoding
+    assert prepare(b"\x00" * 1000, max_seconds=2)[0] == b"\x00" * 1000
+
+
+def test_header_seconds_reads_spilled_uploads():
+    for data, seconds in ((wav(3), 3.0), (ogg(7), 7.0)):
+        upload = spooled(data)
+        try:
+            assert audio._header_seconds(upload) == pytest.approx(seconds)
+        finally:
+            upload.close()
@@ -0,0 +1,106 @@
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+
+from api import batch, state
+from api.batch import create_answer_cache
+from api.routes import create_app
+from api.state import SqliteState
+
+
+def test_sqlite_state_outlives_the_process(tmp_path):
+    path = str(tmp_path / "state.sqlite3")
+
+    async def scenario():
+        first = SqliteState(path)
+        await first.set("kept", b"answer", 60)
+        await first.set("expired", b"old", -1)
+        assert await first.add("kept", b"other", 60) is False
+        assert await first.add("expired", b"new", 60) is True
+        first.close()
+
+        second = SqliteState(path)
+        assert await second.get("kept") == b"answer"
+        assert await second.get("expired") == b"new"
+        await second.delete("kept")
+        assert await second.get("kept") is None
+        assert second.stats()["keys"] == 1
+
+    asyncio.run(scenario())
+
+
+def test_cli_cache_persists_without_a_shared_backend(tmp_path, monkeypatch):
+    monkeypatch.setattr(state, "_backend", state.MemoryState())
+    path = str(tmp_path / "answers.sqlite3")
+
+    async def scenario():
+        await create_answer_cache("prompt", path).put("What is Roshan?", "An account.")
+        # A fresh process starts with an empty memory backend
+        monkeypatch.setattr(state, "_backend", state.MemoryState())
+        cache = create_answer_cache("prompt", path)
+        assert await cache.get("what is roshan?") == "An account."
+        assert await create_answer_cache("other prompt", path).get("What is Roshan?") is None
+        assert await create_answer_cache("prompt").get("What is Roshan?") is None
+
+    asyncio.run(scenario())
+
+
+def test_cli_cache_uses_redis_when_configured(tmp_path, monkeypatch):
+    shared = object()
+    monkeypatch.setattr(state, "_backend", shared)
+    cache = create_answer_cache("prompt", str(tmp_path / "unused.sqlite3"))
+    assert cache.store.backend is shared
+    assert not (tmp_path / "unused.sqlite3").exists()
+
+
+@pytest.fixture(scope="module")
+def client():
+    return TestClient(create_app())
+
+
+@pytest.mark.parametrize("concurrency", ["eight", 2.5, [4], {"n": 4}, True])
+def test_batch_rejects_non_integer_concurrency(client, concurrency):
+    response = client.post("/text/batch", json={"questions": ["hi"], "concurrency": concurrency})
+    assert response.status_code == 400
+    assert response.json()["detail"] == "concurrency must be an integer"
+
+
+def test_run_batch_answers_duplicates_once():
+    calls = []
+
+    async def answer(question):
+        calls.append(question)
+        return question.upper()
+
+    async def scenario():
+        return [result async for result in batch.run_batch(["a", " ", "A", "b"], answer, 2)]
+
+    results = asyncio.run(scenario())
+    summary = results[-1]["summary"]
+    assert sorted(calls) == ["a", "b"]
+    assert (summary["questions"], summary["unique"], summary["blank"]) == (4, 2, 1)
+    assert {r["question"]: r.get("duplicates") for r in results[:-1]} == {"a": [2], "b": None}
+
+
+@pytest.mark.parametrize("reply, cached", [("Profit is paid monthly.", True), (None, False), ("", False)])
+def test_batch_caches_only_real_model_answers(monkeypatch, reply, cached):
+    from api import routes
+
+    calls = []
+
+    async def retrieve_context(question):
+        return {"text": "Roshan accounts pay profit monthly.", "doc_ids": ["doc"], "scores": [1.0]}
+
+    async def generate_text(**kwargs):
+        calls.append(kwargs)
+        return reply
+
+    monkeypatch.setattr(state, "_backend", state.MemoryState())
+    monkeypatch.setattr(routes, "retrieve_context", retrieve_context)
+    monkeypatch.setattr(routes, "generate_text", generate_text)
+    batch_client = TestClient(create_app())
+    for _ in range(2):
+        response = batch_client.post("/text/batch", json={"questions": ["How is Roshan profit paid?"]})
+        assert response.status_code == 200
+    assert len(calls) == (1 if cached else 2)
@@ -0,0 +1,80 @@
+import asyncio
+import json
+
+import pytest
+
+import build_faq_store
+from api import ai_search, azure
+from build_faq_store import answer_entries, load_approved, load_seed, split_vetted, write_review
+
+
+def write_jsonl(path, records):
+    path.write_text("".join(json.dumps(r) + "\n" for r in records), encoding="utf-8")
+    return str(path)
+
+
+def test_seed_answers_are_vetted_and_questions_are_not(tmp_path):
+    path = write_jsonl(tmp_path / "seed.jsonl", [
+        {"question": "What is RDA?", "variants": ["RDA kya hai?"], "answer": "An account."},
+        {"question": "Car ijarah rates?"},
+    ])
+    answered, unanswered = load_seed(path)
+    assert answered["vetted"] and answered["variants"] == ["What is RDA?", "RDA kya hai?"]
+    assert not unanswered["vetted"] and unanswered["answer"] is None
+
+
+def test_only_explicitly_approved_review_entries_load(tmp_path):
+    path = write_jsonl(tmp_path / "review.jsonl", [
+        {"question": "a", "answer": "yes", "approved": True, "count": 7},
+        {"question": "b", "answer": "no", "approved": False},
+        {"question": "c", "answer": "maybe", "approved": "true"},
+        {"question": "d", "answer": "", "approved": True},
+        {"question": "e", "answer": "unset"},
+    ])
+    entries = load_approved(path)
+    assert [(e["question"], e["source"], e["vetted"], e["count"]) for e in entries] == [("a", "approved", True, 7)]
+
+
+@pytest.fixture
+def fake_answering(monkeypatch):
+    async def retrieve_context(question):
+        return {"text": "" if question == "no context" else "context", "doc_ids": ["doc"]}
+
+    async def generate_text(user_prompt, system_prompt, use_tools):
+        return "Generated answer."
+
+    monkeypatch.setattr(ai_search, "retrieve_context", retrieve_context)
+    monkeypatch.setattr(azure, "generate_text", generate_text)
+
+
+def test_generated_answers_are_held_back_for_review(tmp_path, fake_answering):
+    entries = [
+        {"question": "seeded", "variants": ["seeded"], "answer": "Vetted.", "count": 0, "source": "seed", "vetted": True},
+        {"question": "logged", "variants": ["logged"], "answer": None, "count": 5, "source": "log", "vetted": False},
+        {"question": "no context", "variants": ["no context"], "answer": None, "count": 3, "source": "log", "vetted": False},
+    ]
+    answered = asyncio.run(answer_entries(entries, concurrency=2))
+    published, pending = split_vetted(answered)
+    assert [e["question"] for e in published] == ["seeded"]
+    assert [(e["question"], e["answer"]) for e in pending] == [("logged", "Generated answer.")]
+
+    review = str(tmp_path / "review.jsonl")
+    write_review(review, answered)
+    records = [json.loads(line) for line in open(review, encoding="utf-8")]
+    assert [(r["question"], r["approved"]) for r in records] == [("logged", False)]
+    assert load_approved(review) == []
+
+    # The reviewer approves it; the next build publishes it and keeps it approved
+    records[0]["approved"] = True
+    write_jsonl(tmp_path / "review.jsonl", records)
+    approved = load_approved(review)
+    published, pending = split_vetted(asyncio.run(answer_entries(approved, concurrency=2)))
+    assert [(e["question"], e["answer"]) for e in published] == [("logged", "Generated answer.")]
+    write_review(review, published)
+    assert load_approved(review)[0]["question"] == "logged"
+
+
+def test_cli_requires_some_input(monkeypatch):
+    monkeypatch.setattr("sys.argv", ["build_faq_store.py", "--review", "out.jsonl"])
+    with pytest.raises(SystemExit):
+        build_faq_store.main()
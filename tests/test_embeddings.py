@@ -0,0 +1,39 @@
+import asyncio
+
+import numpy as np
+
+from api.embeddings import EmbeddingCache, EmbeddingService
+
+
+def service(tmp_path, max_batch, batch_window=0.01):
+    sizes = []
+
+    async def fetch(texts, model):
+        sizes.append(len(texts))
+        await asyncio.sleep(0)
+        return [np.full(4, float(len(text)), dtype=np.float32) for text in texts]
+
+    cache = EmbeddingCache(max_items=1000, cache_dir=str(tmp_path))
+    return EmbeddingService("test-model", cache, batch_window, max_batch, fetch), sizes
+
+
+def test_batches_never_exceed_max_batch(tmp_path):
+    embeddings, sizes = service(tmp_path, max_batch=8)
+    texts = [f"question {i}" for i in range(21)]
+    vectors = asyncio.run(embeddings.embed_many(texts))
+    assert sizes == [8, 8, 5]
+    assert [int(v[0]) for v in vectors] == [len(text) for text in texts]
+
+
+def test_concurrent_callers_share_the_window_and_duplicates(tmp_path):
+    embeddings, sizes = service(tmp_path, max_batch=64)
+
+    async def scenario():
+        return await asyncio.gather(*(embeddings.embed(text) for text in ["a", "bb", "a", "ccc"]))
+
+    vectors = asyncio.run(scenario())
+    assert sizes == [3]
+    assert [int(v[0]) for v in vectors] == [1, 2, 1, 3]
+    # Served from the cache afterwards
+    asyncio.run(embeddings.embed("bb"))
+    assert sizes == [3]
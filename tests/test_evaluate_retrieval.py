@@ -0,0 +1,32 @@
+import json
+import os
+
+import pytest
+
+from evaluate_retrieval import check_coverage, is_relevant, load_dataset, score_query
+
+
+ROOT = os.path.join(os.path.dirname(__file__), "..")
+
+
+def test_shipped_corpus_contains_every_labeled_answer():
+    dataset = load_dataset(os.path.join(ROOT, "retrieval_eval.jsonl"))
+    with open(os.path.join(ROOT, "retrieval_corpus.json"), encoding="utf-8") as f:
+        corpus = json.load(f)
+    for row in dataset:
+        for label in row["relevant"]:
+            assert any(is_relevant(label, doc) for doc in corpus), label
+    check_coverage(dataset, corpus)
+
+
+def test_unrelated_corpus_fails_loudly():
+    from mock_upstreams import DEFAULT_DOCUMENTS
+
+    dataset = load_dataset(os.path.join(ROOT, "retrieval_eval.jsonl"))
+    with pytest.raises(RuntimeError, match="--documents"):
+        check_coverage(dataset, DEFAULT_DOCUMENTS)
+
+
+def test_score_query_recall_and_reciprocal_rank():
+    documents = [{"id": "a", "content": "x"}, {"id": "b", "content": "branches: 500+"}]
+    assert score_query(documents, ["Branches: 500+", "missing"]) == (0.5, 0.5)
@@ -0,0 +1,65 @@
+"""
+Golden-output tests for ``api.formatting``.
+
+``golden/formatting.jsonl`` holds real-shaped answers with the expected
+``format_response`` output (generated by the pre-refactor formatter from
+rag_pipeline.py, quirks included, so any behaviour change shows up here)
+and the expected ``StreamFormatter`` output for the same text.
+"""
+
+import json
+import os
+
+import pytest
+
+from api.formatting import StreamFormatter, format_response
+
+
+with open(os.path.join(os.path.dirname(__file__), "golden", "formatting.jsonl"), encoding="utf-8") as f:
+    CORPUS = [json.loads(line) for line in f if line.strip()]
+
+IDS = [case["name"] for case in CORPUS]
+
+
+def stream(chunks) -> str:
+    formatter = StreamFormatter()
+    return "".join(formatter.feed(chunk) for chunk in chunks) + formatter.close()
+
+
+@pytest.mark.parametrize("case", CORPUS, ids=IDS)
+def test_format_response_golden(case):
+    assert format_response(case["input"]) == case["formatted"]
+
+
+@pytest.mark.parametrize("case", CORPUS, ids=IDS)
+def test_stream_formatter_golden(case):
+    assert stream([case["input"]]) == case["streamed"]
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 5, 8, 13, 64])
+@pytest.mark.parametrize("case", CORPUS, ids=IDS)
+def test_stream_formatter_fixed_chunk_sizes(case, size):
+    text = case["input"]
+    chunks = [text[i:i + size] for i in range(0, len(text), size)]
+    assert stream(chunks) == case["streamed"]
+
+
+@pytest.mark.parametrize("case", CORPUS, ids=IDS)
+def test_stream_formatter_every_split_point(case):
+    # Splits inside "**", "- ", "\n" and multi-byte characters included
+    text = case["input"]
+    for cut in range(len(text) + 1):
+        assert stream([text[:cut], text[cut:]]) == case["streamed"], cut
+
+
+def test_stream_formatter_numbers_bullets_across_chunks():
+    assert stream(["We offer:\n- **Car", " Ijarah**\n-", " Home Musharakah\n"]) == (
+        "We offer:\n1. Car Ijarah\n2. Home Musharakah"
+    )
+
+
+def test_stream_formatter_emits_only_complete_lines():
+    formatter = StreamFormatter()
+    assert formatter.feed("- first") == ""
+    assert formatter.feed(" item\n- sec") == "1. first item"
+    assert formatter.close() == "\n2. sec"
@@ -0,0 +1,23 @@
+from api.forwarding import client_ip
+
+
+def test_header_ignored_without_trusted_proxies(monkeypatch):
+    monkeypatch.delenv("TRUSTED_PROXIES", raising=False)
+    assert client_ip("10.0.0.5", "203.0.113.7") == "10.0.0.5"
+
+
+def test_header_ignored_from_untrusted_peer(monkeypatch):
+    monkeypatch.setenv("TRUSTED_PROXIES", "10.0.0.0/8")
+    assert client_ip("198.51.100.9", "203.0.113.7") == "198.51.100.9"
+
+
+def test_rightmost_untrusted_hop_is_the_client(monkeypatch):
+    monkeypatch.setenv("TRUSTED_PROXIES", "10.0.0.0/8, 172.16.0.1")
+    # The left-most value is client-supplied and could be spoofed
+    assert client_ip("10.0.0.5", "1.1.1.1, 203.0.113.7, 172.16.0.1") == "203.0.113.7"
+
+
+def test_app_service_port_suffix_and_wildcard(monkeypatch):
+    monkeypatch.setenv("TRUSTED_PROXIES", "*")
+    assert client_ip("169.254.0.1", "203.0.113.7:50123") == "203.0.113.7"
+    assert client_ip("169.254.0.1", "[2001:db8::1]") == "2001:db8::1"
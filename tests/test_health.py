@@ -0,0 +1,73 @@
+import asyncio
+
+import httpx
+import pytest
+from fastapi import HTTPException
+
+from api import azure, health
+
+
+@pytest.fixture(autouse=True)
+def fresh_breakers(monkeypatch):
+    monkeypatch.setattr(health, "_breakers", {})
+    monkeypatch.setenv("AZURE_GPT_DEPLOYMENT", "gpt-4o")
+    monkeypatch.setenv("AZURE_GPT_FAST_DEPLOYMENT", "gpt-4o-mini")
+
+
+class FakeClient:
+    def __init__(self, status):
+        self.status = status
+
+    async def get(self, url, headers, timeout):
+        return httpx.Response(self.status, request=httpx.Request("GET", url))
+
+
+@pytest.mark.parametrize("status, ok", [(200, True), (404, True), (400, True), (401, False), (429, False), (503, False)])
+def test_probe_status_follows_the_real_call_rule(monkeypatch, status, ok):
+    monkeypatch.setattr(health, "get_client", lambda name: FakeClient(status))
+    result = asyncio.run(health.HealthProber({})._probe("http://upstream/models", {}))
+    assert result["ok"] is ok and result["status"] == status
+    assert ("error" in result) is not ok
+
+
+def rate_limited(deployment):
+    request = httpx.Request("POST", f"http://azure/{deployment}")
+    response = httpx.Response(429, request=request)
+    try:
+        response.raise_for_status()
+    except httpx.HTTPStatusError as exc:
+        raise HTTPException(status_code=502, detail="Azure GPT error") from exc
+
+
+@health.watched(azure._llm_upstream)
+async def chat(user_prompt, deployment=None, failing=()):
+    if (deployment or "gpt-4o") in failing:
+        rate_limited(deployment)
+    return f"answer from {deployment or 'gpt-4o'}"
+
+
+def test_chat_calls_report_to_the_breaker_of_their_deployment():
+    assert azure._llm_upstream("q") == health.LLM
+    assert azure._llm_upstream("q", deployment="gpt-4o") == health.LLM
+    assert azure._llm_upstream("q", deployment="gpt-4o-mini") == health.LLM_FAST
+
+
+def test_fast_tier_rate_limits_do_not_block_escalation():
+    async def scenario():
+        for _ in range(10):
+            with pytest.raises(HTTPException):
+                await chat("q", deployment="gpt-4o-mini", failing={"gpt-4o-mini"})
+        with pytest.raises(health.UpstreamUnavailable) as raised:
+            await chat("q", deployment="gpt-4o-mini")
+        assert raised.value.name == health.LLM_FAST
+        return await chat("q", deployment="gpt-4o")
+
+    assert asyncio.run(scenario()) == "answer from gpt-4o"
+    assert health.breaker(health.LLM_FAST).state == health.OPEN
+    assert health.breaker(health.LLM).state == health.CLOSED
+    assert health.available(health.LLM)
+
+
+def test_same_deployment_for_both_tiers_shares_one_breaker(monkeypatch):
+    monkeypatch.setenv("AZURE_GPT_FAST_DEPLOYMENT", "gpt-4o")
+    assert azure._llm_upstream("q", deployment="gpt-4o") == health.LLM
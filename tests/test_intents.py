@@ -0,0 +1,42 @@
+import os
+
+import pytest
+
+from api.intents import GREETING_REPLY, IntentRouter, _load_faqs
+
+
+EXAMPLE = os.path.join(os.path.dirname(__file__), "..", "intent_faqs.example.json")
+
+
+@pytest.fixture(scope="module")
+def router():
+    return IntentRouter(_load_faqs(EXAMPLE))
+
+
+def test_example_file_matches_the_schema():
+    faqs = _load_faqs(EXAMPLE)
+    assert faqs
+    for faq in faqs:
+        assert faq["intent"] and faq["answer"] and faq["patterns"]
+        assert isinstance(faq.get("examples", []), list)
+
+
+def test_every_example_phrase_routes_to_its_own_intent(router):
+    for faq in router.faqs:
+        for example in faq["examples"]:
+            result = router.classify(example)
+            assert result and result["intent"] == faq["intent"], example
+
+
+@pytest.mark.parametrize("text", [
+    "What is the profit rate on the savings account?",
+    "How do I apply for car ijarah?",
+    "credit card ke charges kitne hain?",
+])
+def test_product_questions_go_to_retrieval(router, text):
+    assert router.classify(text) is None
+
+
+def test_small_talk_is_answered_locally(router):
+    assert router.classify("Assalam o Alaikum")["answer"] == GREETING_REPLY
+    assert router.classify("ok thanks")["intent"] == "thanks"
@@ -0,0 +1,65 @@
+import gzip
+import hashlib
+import json
+
+import pytest
+
+from api import recorder
+from api.recorder import TrafficRecorder, sanitize
+
+
+PAYLOAD = {
+    "entry": [{"changes": [{"value": {
+        "contacts": [{"profile": {"name": "Ayesha Khan"}, "wa_id": "923001234567"}],
+        "messages": [{"from": "923001234567", "type": "text", "text": {"body": "CNIC 4210112345671, mail a@b.com"}}],
+    }}]}],
+}
+
+
+def identities(payload):
+    value = payload["entry"][0]["changes"][0]["value"]
+    return value["contacts"][0]["wa_id"], value["messages"][0]["from"], value["contacts"][0]["profile"]["name"]
+
+
+def test_identities_are_keyed_hashes_and_text_is_masked():
+    clean = sanitize(PAYLOAD, "secret")
+    wa_id, sender, name = identities(clean)
+    assert wa_id == sender != "923001234567"
+    assert name.startswith("u") and "Ayesha" not in json.dumps(clean)
+    # Not the unkeyed (or salt-prefixed) hash an attacker could enumerate
+    assert wa_id[1:] not in hashlib.sha256(b"923001234567").hexdigest()
+    assert wa_id[1:] not in hashlib.sha256(b"secret923001234567").hexdigest()
+    assert clean["entry"][0]["changes"][0]["value"]["messages"][0]["text"]["body"] == (
+        "CNIC 0000000000000, mail user@example.com"
+    )
+    assert identities(sanitize(PAYLOAD, "other")) != identities(clean)
+
+
+def test_sanitize_refuses_an_empty_salt():
+    with pytest.raises(ValueError):
+        sanitize(PAYLOAD, "")
+
+
+def test_recorder_without_salt_uses_a_random_key_kept_out_of_the_log(tmp_path):
+    first = TrafficRecorder(str(tmp_path / "a.jsonl.gz"))
+    second = TrafficRecorder(str(tmp_path / "b.jsonl.gz"))
+    assert first.salt and first.salt != second.salt
+    for log in (first, second):
+        log.webhook(PAYLOAD)
+        log.webhook(PAYLOAD)
+        log.close()
+    a = [json.loads(line) for line in gzip.open(first.path, "rt", encoding="utf-8")]
+    b = [json.loads(line) for line in gzip.open(second.path, "rt", encoding="utf-8")]
+    assert identities(a[0]["p"]) == identities(a[1]["p"])
+    assert identities(a[0]["p"]) != identities(b[0]["p"])
+    assert first.salt not in gzip.open(first.path, "rt", encoding="utf-8").read()
+
+
+def test_configured_salt_gives_stable_ids_across_logs(tmp_path, monkeypatch):
+    monkeypatch.setenv("TRAFFIC_RECORD_PATH", str(tmp_path / "traffic-{pid}.jsonl"))
+    monkeypatch.setenv("TRAFFIC_RECORD_SALT", "shared-secret")
+    recorder.close_recorder()
+    try:
+        assert recorder.get_recorder().salt == "shared-secret"
+    finally:
+        recorder.close_recorder()
@@ -0,0 +1,71 @@
+import asyncio
+
+import pytest
+
+from api.scheduler import TEXT, VOICE, FairScheduler, SchedulerBusy
+
+
+def test_cancelled_waiter_racing_release_does_not_leak_the_slot():
+    async def scenario():
+        scheduler = FairScheduler(0, {VOICE: (1, 1, 0)})
+        await scheduler.acquire(VOICE, "alice")
+        waiter = asyncio.create_task(scheduler.acquire(VOICE, "alice"))
+        await asyncio.sleep(0)
+        # Barge-in: the waiting segment is cancelled in the same tick the holder releases
+        waiter.cancel()
+        scheduler.release(VOICE, "alice")
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        assert scheduler.running == 0
+        assert scheduler.classes[VOICE].running == 0
+        assert not scheduler.classes[VOICE].queues
+        await asyncio.wait_for(scheduler.acquire(VOICE, "alice"), timeout=1)
+        assert scheduler.running == 1
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_waiter_is_skipped_for_the_next_one():
+    async def scenario():
+        scheduler = FairScheduler(0, {VOICE: (1, 1, 0)})
+        await scheduler.acquire(VOICE, "alice")
+        cancelled = asyncio.create_task(scheduler.acquire(VOICE, "alice"))
+        waiting = asyncio.create_task(scheduler.acquire(VOICE, "alice"))
+        await asyncio.sleep(0)
+        cancelled.cancel()
+        scheduler.release(VOICE, "alice")
+        await asyncio.wait_for(waiting, timeout=1)
+        assert scheduler.classes[VOICE].running == 1
+
+    asyncio.run(scenario())
+
+
+def test_senders_are_served_round_robin():
+    async def scenario():
+        scheduler = FairScheduler(1, {TEXT: (1, 0, 0)})
+        order = []
+
+        async def job(sender):
+            async with scheduler.slot(TEXT, sender):
+                order.append(sender)
+                await asyncio.sleep(0)
+
+        await asyncio.gather(*(job(sender) for sender in ["abuser"] * 3 + ["user"]))
+        # The abuser's backlog goes to the back of the line after each grant
+        assert order == ["abuser", "abuser", "user", "abuser"]
+
+    asyncio.run(scenario())
+
+
+def test_full_sender_queue_is_shed():
+    async def scenario():
+        scheduler = FairScheduler(0, {TEXT: (1, 1, 1)})
+        await scheduler.acquire(TEXT, "alice")
+        queued = asyncio.create_task(scheduler.acquire(TEXT, "alice"))
+        await asyncio.sleep(0)
+        with pytest.raises(SchedulerBusy):
+            await scheduler.acquire(TEXT, "alice")
+        queued.cancel()
+        await asyncio.gather(queued, return_exceptions=True)
+
+    asyncio.run(scenario())
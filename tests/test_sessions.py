@@ -0,0 +1,51 @@
+import pytest
+
+from api.sessions import SessionStore
+from api.state import MemoryState
+
+
+CAR_SESSION = {
+    "summary": "",
+    "turns": [[
+        "What is car ijarah?",
+        "Car Ijarah is a Shariah-compliant vehicle financing product. The monthly rental "
+        "depends on the vehicle price, the tenure and the profit rate.",
+    ]],
+    "doc_ids": ["faq-2"],
+    "context": "Source: Car Ijarah FAQ\nContent: Car Ijarah is a Shariah-compliant vehicle financing "
+    "product for salaried and self-employed customers. Tenure of 1 to 5 years, a down payment "
+    "of 15% and processing charges apply. Insurance (takaful) is mandatory.",
+}
+
+
+@pytest.fixture
+def sessions():
+    return SessionStore(MemoryState())
+
+
+@pytest.mark.parametrize("text", [
+    "tell me more about it",
+    "iske baare mein mazeed batao",
+    "what is the tenure for it?",
+    "is the takaful mandatory for this?",
+    "and the down payment?",
+    "what are its processing charges?",
+])
+def test_references_to_the_previous_topic_are_follow_ups(sessions, text):
+    assert sessions.is_follow_up(text, CAR_SESSION)
+
+
+@pytest.mark.parametrize("text", [
+    "kaise apply karoon credit card ke liye?",
+    "kitna profit milta hai savings account par?",
+    "what about home financing?",
+    "What are the charges for this service?",
+    "how does this compare with roshan digital account?",
+    "what documents do I need to open an account? please tell me all of them in detail",
+])
+def test_new_topics_are_searched(sessions, text):
+    assert not sessions.is_follow_up(text, CAR_SESSION)
+
+
+def test_no_follow_up_without_previous_context(sessions):
+    assert not sessions.is_follow_up("tell me more about it", {"turns": [], "context": ""})
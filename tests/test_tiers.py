@@ -0,0 +1,33 @@
+import pytest
+
+from api.tiers import FAST, LARGE, RERANKER_MIN_SCORE, create_tier_policy
+
+
+@pytest.fixture(autouse=True)
+def tier_env(monkeypatch):
+    monkeypatch.setenv("AZURE_GPT_DEPLOYMENT", "gpt-4o")
+    monkeypatch.setenv("AZURE_GPT_FAST_DEPLOYMENT", "gpt-4o-mini")
+    monkeypatch.delenv("TIER_FAST_MIN_SCORE", raising=False)
+    monkeypatch.delenv("AZURE_SEARCH_SEMANTIC_CONFIG", raising=False)
+
+
+def test_fast_tier_stays_off_without_a_score_scale():
+    policy = create_tier_policy()
+    assert not policy.enabled
+    assert policy.choose("Car ijarah rate?", [9.0, 1.0]) == (LARGE, "disabled")
+
+
+def test_reranker_scale_gets_a_real_default(monkeypatch):
+    monkeypatch.setenv("AZURE_SEARCH_SEMANTIC_CONFIG", "default")
+    policy = create_tier_policy()
+    assert policy.enabled and policy.fast_min_score == RERANKER_MIN_SCORE
+    assert policy.choose("Car ijarah rate?", [1.2, 0.4]) == (LARGE, "low_score")
+    assert policy.choose("Car ijarah rate?", [3.1, 1.0]) == (FAST, "simple")
+
+
+def test_configured_minimum_wins(monkeypatch):
+    monkeypatch.setenv("TIER_FAST_MIN_SCORE", "12.5")
+    policy = create_tier_policy()
+    assert policy.enabled
+    assert policy.choose("Car ijarah rate?", [10.0, 2.0]) == (LARGE, "low_score")
+    assert policy.choose("Car ijarah rate?", [20.0, 2.0]) == (FAST, "simple")
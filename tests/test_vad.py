@@ -0,0 +1,115 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+from api import audio
+from api.audio import NoSpeechDetected, pcm_to_wav, prepare_for_stt
+from api.vad import StreamingVAD, analyze_speech
+
+
+RATE = 16000
+
+
+def silence(seconds):
+    return np.zeros(int(seconds * RATE), dtype=np.float64)
+
+
+def noise(seconds, level=0.02, seed=0):
+    return np.random.default_rng(seed).normal(0, level, int(seconds * RATE))
+
+
+def tone(seconds, freq=220.0, level=0.3):
+    t = np.arange(int(seconds * RATE)) / RATE
+    return level * np.sin(2 * np.pi * freq * t)
+
+
+def pcm(signal):
+    return (np.clip(signal, -1, 1) * 32767).astype(np.int16)
+
+
+def test_silence_has_no_speech():
+    result = analyze_speech(pcm(silence(2)), RATE)
+    assert result["speech_ratio"] == 0.0
+    assert result["speech_seconds"] == 0.0
+
+
+def test_white_noise_has_no_speech():
+    result = analyze_speech(pcm(noise(2)), RATE)
+    assert result["speech_ratio"] == 0.0
+
+
+def test_tone_over_noise_is_located():
+    clip = np.concatenate([noise(1, seed=1), tone(1) + noise(1, seed=2), noise(1, seed=3)])
+    result = analyze_speech(pcm(clip), RATE)
+    assert result["duration"] == pytest.approx(3.0)
+    assert result["start"] == pytest.approx(1.0, abs=0.05)
+    # Hangover (8 frames of 30 ms) extends past the end of the tone
+    assert 2.0 <= result["end"] <= 2.3
+    assert 0.3 <= result["speech_ratio"] <= 0.45
+
+
+def test_streaming_vad_reports_start_and_end():
+    clip = np.concatenate([silence(0.5), tone(1) + noise(1), silence(1)])
+    vad = StreamingVAD(RATE)
+    events = []
+    raw = pcm(clip).tobytes()
+    # Odd-sized chunks exercise the partial-frame carry-over
+    for offset in range(0, len(raw), 1001):
+        events.extend(vad.feed(raw[offset:offset + 1001]))
+    kinds = [kind for kind, _ in events]
+    assert kinds[0] == "start" and kinds[-1] == "end"
+    assert "start" not in kinds[1:]
+    start, end = events[0][1], events[-1][1]
+    assert start / RATE == pytest.approx(0.5, abs=0.05)
+    assert end / RATE == pytest.approx(1.5, abs=0.05)
+
+
+def test_streaming_vad_ignores_steady_noise():
+    vad = StreamingVAD(RATE)
+    assert vad.feed(pcm(noise(2)).tobytes()) == []
+
+
+needs_ffmpeg = pytest.mark.skipif(audio.ffmpeg_path() is None, reason="ffmpeg not installed")
+
+
+def prepare(signal):
+    return asyncio.run(prepare_for_stt(pcm_to_wav(pcm(signal).tobytes()), "note.wav", "audio/wav"))
+
+
+@pytest.fixture(autouse=True)
+def _pool():
+    yield
+    audio.shutdown_pool()
+
+
+@needs_ffmpeg
+@pytest.mark.parametrize("signal", [silence(2), noise(2)], ids=["silence", "noise"])
+def test_prepare_rejects_clips_without_speech(signal):
+    with pytest.raises(NoSpeechDetected) as raised:
+        prepare(signal)
+    assert raised.value.analysis["speech_ratio"] == 0.0
+
+
+@needs_ffmpeg
+def test_prepare_trims_to_speech_plus_padding(monkeypatch):
+    monkeypatch.setenv("VAD_PADDING_SECONDS", "0.25")
+    clip = np.concatenate([silence(2), tone(1) + noise(1), silence(2)])
+    seen = {}
+    original = audio._screen_and_encode
+
+    def spy(*args):
+        encoded, analysis = original(*args)
+        seen.update(analysis)
+        return encoded, analysis
+
+    # Run in-process so the analysis is observable
+    monkeypatch.setattr(audio, "_get_pool", lambda: None)
+    monkeypatch.setattr(audio, "_screen_and_encode", spy)
+    data, filename, content_type = prepare(clip)
+    assert (filename, content_type) == ("audio.ogg", "audio/ogg")
+    assert data[:4] == b"OggS"
+    assert seen["duration"] == pytest.approx(5.0)
+    # 1 s of tone, up to 0.24 s of hangover, 0.25 s padding each side
+    assert 1.5 <= seen["kept_seconds"] <= 1.8
+    assert seen["start"] == pytest.approx(2.0, abs=0.05)
@@ -0,0 +1,102 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+from api.serialization import loads
+from api.voice import VoiceSession
+
+
+class FakeSocket:
+    """Yields queued frames, then blocks until ``disconnect``."""
+
+    def __init__(self):
+        self.inbox = asyncio.Queue()
+        self.sent = []
+
+    def push(self, **message):
+        self.inbox.put_nowait({"type": "websocket.receive", **message})
+
+    def disconnect(self):
+        self.inbox.put_nowait({"type": "websocket.disconnect"})
+
+    async def receive(self):
+        return await self.inbox.get()
+
+    async def send_text(self, text):
+        self.sent.append(loads(text))
+
+    async def send_bytes(self, data):
+        self.sent.append(data)
+
+
+async def never(_):
+    await asyncio.Event().wait()
+
+
+async def no_audio(_):
+    return
+    yield
+
+
+async def echo(question):
+    return f"echo {question}"
+
+
+def session_for(answer=never):
+    socket = FakeSocket()
+    return socket, VoiceSession(socket, never, answer, no_audio, "audio/mpeg")
+
+
+@pytest.mark.parametrize("text", ["{not json", "[1, 2]", '"interrupt"', "42", "null"])
+def test_bad_control_frames_get_an_error_and_the_session_survives(text):
+    socket, session = session_for(answer=echo)
+
+    async def scenario():
+        socket.push(text=text)
+        socket.push(text='{"type": "text", "text": "hello"}')
+        running = asyncio.create_task(session.run())
+        while not any(isinstance(m, dict) and m["type"] == "done" for m in socket.sent):
+            await asyncio.sleep(0.01)
+        socket.disconnect()
+        await asyncio.wait_for(running, 1)
+
+    asyncio.run(asyncio.wait_for(scenario(), 5))
+    kinds = [message["type"] for message in socket.sent]
+    assert kinds[:2] == ["ready", "error"]
+    assert socket.sent[1]["detail"] == "Control frames must be JSON objects"
+    assert {"type": "answer", "text": "echo hello"} in socket.sent
+
+
+def test_new_utterance_cancels_stale_segment_transcriptions():
+    socket, session = session_for()
+    rate = session.vad.sample_rate
+    t = np.arange(rate) / rate
+    speech = (0.3 * np.sin(2 * np.pi * 220 * t) * 32767).astype(np.int16).tobytes()
+    quiet = np.zeros(rate // 2, dtype=np.int16).tobytes()
+
+    async def scenario():
+        stale = asyncio.create_task(never(b""))
+        session._segments = [stale]
+        await session._on_audio(quiet + speech)
+        await asyncio.sleep(0)
+        return stale
+
+    stale = asyncio.run(scenario())
+    assert stale.cancelled()
+    assert {"type": "listening"} in socket.sent
+    assert session._segments == []
+
+
+def test_disconnect_cancels_pending_segments():
+    socket, session = session_for()
+
+    async def scenario():
+        pending = asyncio.create_task(never(b""))
+        session._segments = [pending]
+        socket.disconnect()
+        await session.run()
+        await asyncio.sleep(0)
+        return pending
+
+    assert asyncio.run(scenario()).cancelled()
@@ -0,0 +1,84 @@
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+from api import routes, state
+from api.scheduler import SchedulerBusy, create_scheduler
+
+
+def text_message(message_id, sender="923001234567"):
+    return {"entry": [{"changes": [{"value": {
+        "contacts": [{"profile": {"name": "Test"}, "wa_id": sender}],
+        "messages": [{"from": sender, "id": message_id, "type": "text", "text": {"body": "Car ijarah rates?"}}],
+    }}]}]}
+
+
+@pytest.fixture
+def shed_app(monkeypatch, tmp_path):
+    replies = []
+
+    def busy_scheduler():
+        scheduler = create_scheduler()
+
+        def slot(kind, sender):
+            raise SchedulerBusy(kind)
+
+        scheduler.slot = slot
+        return scheduler
+
+    async def reply_text(recipient, text):
+        replies.append((recipient, text))
+
+    monkeypatch.delenv("RECIPIENT_WAID", raising=False)
+    monkeypatch.setenv("PENDING_JOBS_PATH", str(tmp_path / "pending.jsonl"))
+    monkeypatch.setenv("WARMUP_CANNED_AUDIO", "0")
+    monkeypatch.setattr(state, "_backend", state.MemoryState())
+    monkeypatch.setattr(routes, "create_scheduler", busy_scheduler)
+    monkeypatch.setattr(routes, "reply_text", reply_text)
+    return routes.create_app(), replies
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.02)
+
+
+def test_shed_sender_is_told_once_why_messages_are_dropped(shed_app):
+    app, replies = shed_app
+    with TestClient(app) as client:
+        for index in range(3):
+            assert client.post("/webhook", json=text_message(f"wamid.{index}")).status_code == 200
+        client.post("/webhook", json=text_message("wamid.other", sender="923009999999"))
+        wait_for(lambda: len(replies) >= 2)
+        time.sleep(0.2)
+        shed = client.get("/metrics").json()["counters"]["webhook.shed"]
+    assert replies == [
+        ("923001234567", routes.BUSY_REPLY),
+        ("923009999999", routes.BUSY_REPLY),
+    ]
+    assert shed == 4
+
+
+def test_push_parses_its_body_with_the_fast_decoder(monkeypatch):
+    from api import serialization
+
+    sent, decoded = [], []
+    real_loads = serialization.loads
+
+    async def push_text(text, to_number):
+        sent.append((text, to_number))
+
+    def loads(data):
+        decoded.append(data)
+        return real_loads(data)
+
+    monkeypatch.setattr(routes, "push_text", push_text)
+    monkeypatch.setattr(serialization, "loads", loads)
+    client = TestClient(routes.create_app())
+    assert client.post("/whatsapp/push", json={"text": " hi ", "to": "923001234567"}).status_code == 200
+    assert sent == [("hi", "923001234567")] and decoded
+    assert client.post("/whatsapp/push", content=b"{nope", headers={"content-type": "application/json"}).status_code == 400
+    assert client.post("/whatsapp/push", json=["hi"]).status_code == 400
+    assert client.post("/whatsapp/push", json={"to": "1"}).status_code == 400